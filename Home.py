@@ -1,7 +1,8 @@
 import streamlit as st
 import sqlite3
-import bcrypt # Necessário instalar: pip install bcrypt
-from database import criar_conexao, inicializar_banco
+import autenticacao # bcrypt em threads de trabalho + limite de tentativas
+import escrita # Gravações pelo escritor único
+from database import inicializar_banco
 
 # Configuração da página principal.
 # Esconde o menu de navegação padrão do Streamlit (Pages) quando o usuário não está logado.
@@ -21,6 +22,7 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
+# Aplica migrações pendentes; só acessa o banco na primeira execução do processo
 inicializar_banco()
 
 # Estado inicial
@@ -28,27 +30,16 @@ if "logado" not in st.session_state:
     st.session_state["logado"] = False
 
 def autenticar(usuario, senha):
-    conn = criar_conexao()
-    cursor = conn.cursor()
-    # 1. Busca o usuário e o hash da senha
-    cursor.execute("SELECT id, nome, senha FROM psicologos WHERE usuario = ?", (usuario,))
-    resultado = cursor.fetchone()
-    conn.close()
-
-    if resultado:
-        psicologo_id, nome_psicologo, senha_hash = resultado
-        # 2. Verifica a senha usando bcrypt
+    # O bcrypt roda no pool de autenticacao.py; hashes com custo antigo são
+    # refeitos em segundo plano após o login
+    try:
+        return autenticacao.autenticar(usuario, senha)
+    except ValueError:
         # ATENÇÃO: Se a senha foi cadastrada antes da criptografia (seu código antigo),
         # esta verificação falhará! Você pode precisar recadastrar seu psicólogo.
-        try:
-            if bcrypt.checkpw(senha.encode('utf-8'), senha_hash.encode('utf-8')):
-                return (psicologo_id, nome_psicologo)
-        except ValueError:
-             # Trata o caso de senhas antigas não criptografadas.
-             # Você PODE querer remover esta linha após migrar todos os usuários.
-             st.error("Erro na verificação. Tente recadastrar-se.")
-             return None
-    
+        st.error("Erro na verificação. Tente recadastrar-se.")
+    except (autenticacao.TentativasExcedidas, autenticacao.ServidorOcupado) as e:
+        st.error(str(e))
     return None
 
 def tela_login():
@@ -64,9 +55,9 @@ def tela_login():
     if st.button("Entrar", use_container_width=True):
         resultado = autenticar(usuario, senha)
         if resultado:
-            st.session_state["logado"] = True
-            st.session_state["psicologo_id"] = resultado[0]
-            st.session_state["nome_psicologo"] = resultado[1]
+            autenticacao.iniciar_sessao(st.session_state, *resultado)
+            # Token persistente: recarregar a página não exige nova senha (nem bcrypt)
+            st.session_state["token_sessao"] = autenticacao.criar_token_sessao(resultado[0])
             st.success(f"Bem-vindo, {resultado[1]}!")
             
             # **REDIRECIONA CORRETAMENTE** para a página na subpasta 'pages/'
@@ -86,25 +77,23 @@ def tela_registro():
     if st.button("Registrar", use_container_width=True):
         if nome and usuario and senha:
             try:
-                # Criptografa a senha antes de salvar
-                senha_hash = bcrypt.hashpw(senha.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+                # Criptografa a senha antes de salvar (custo em PSYCONTROL_BCRYPT_CUSTO)
+                senha_hash = autenticacao.gerar_hash(senha)
                 
-                conn = criar_conexao()
-                cursor = conn.cursor()
-                cursor.execute("INSERT INTO psicologos (nome, usuario, senha) VALUES (?, ?, ?)", (nome, usuario, senha_hash))
-                conn.commit()
-                conn.close()
+                escrita.executar(None, "INSERT INTO psicologos (nome, usuario, senha) VALUES (?, ?, ?)", (nome, usuario, senha_hash))
                 st.success("Cadastro realizado com sucesso! Faça login para continuar.")
             except sqlite3.IntegrityError:
                 st.error("Usuário já existe. Escolha outro.")
+            except autenticacao.ServidorOcupado as e:
+                st.error(str(e))
         else:
             st.warning("Preencha todos os campos.")
 
 # -------------------------------------------------------------
 # Interface principal
 # -------------------------------------------------------------
-if st.session_state["logado"]:
-    # Se logado, redireciona para o painel (página pages/painel_psicologo.py)
+if autenticacao.restaurar_sessao(st.session_state, st.query_params):
+    # Se logado (ou com token de sessão válido na URL), redireciona para o painel (página pages/painel_psicologo.py)
     st.switch_page("pages/painel_psicologo.py")
 else:
     # Se não logado, exibe a opção de Login ou Registro (na sidebar)
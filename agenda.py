@@ -0,0 +1,439 @@
+"""Agenda do psicólogo: consultas por período, conflitos e horários livres.
+
+Desde a migração 10, cada agendamento tem `inicio` ('AAAA-MM-DD HH:MM', que
+ordena como texto), `duracao_min` e o `psicologo_id` do paciente, indexados
+em (psicologo_id, inicio). Semana, mês, um dia ou a busca de conflitos são
+uma única faixa nesse índice, qualquer que seja o tamanho do histórico.
+
+Agendamentos recorrentes (migração 11) são uma linha em series_agendamento
+com a regra (semanal, quinzenal, mensal). As ocorrências são calculadas em
+Python só para o período pedido; cancelar ou remarcar uma delas grava uma
+exceção (excecoes_serie) sem materializar o resto da série.
+"""
+import calendar
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+DURACAO_PADRAO = 50 # minutos
+# Limite da duração aceita: permite limitar por baixo a faixa da busca de conflitos
+DURACAO_MAXIMA = 240
+
+# Expediente considerado na busca de horários livres
+INICIO_EXPEDIENTE = "08:00"
+FIM_EXPEDIENTE = "20:00"
+PASSO_HORARIOS = 30 # minutos entre os inícios sugeridos
+
+REGRAS = {"semanal": 7, "quinzenal": 14, "mensal": None} # intervalo em dias (mensal: mesmo dia do mês)
+# Uma ocorrência só pode ser remarcada para até tantos dias da data original:
+# assim basta olhar as exceções perto do período exibido
+MAX_REMARCACAO_DIAS = 31
+# Ao criar uma série, os conflitos são conferidos neste horizonte
+HORIZONTE_CONFLITOS_DIAS = 365
+# Na lista de próximos agendamentos, as séries entram com as ocorrências destes dias
+DIAS_PROXIMAS_OCORRENCIAS = 30
+
+_FORMATO = "%Y-%m-%d %H:%M"
+
+SQL_AGENDAMENTOS_PERIODO = """
+    SELECT a.id, a.inicio, a.duracao_min, p.nome, a.observacoes, a.paciente_id
+    FROM agendamentos a
+    JOIN pacientes p ON a.paciente_id = p.id
+    WHERE a.psicologo_id = ? AND a.inicio >= ? AND a.inicio < ?
+    ORDER BY a.inicio, a.id
+"""
+
+SQL_INSERIR_AGENDAMENTO = """
+    INSERT INTO agendamentos (paciente_id, data, hora, observacoes, inicio, duracao_min, psicologo_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Séries que podem ter ocorrências no período (parâmetros já com a margem de remarcação)
+SQL_SERIES_PERIODO = """
+    SELECT s.id, s.regra, s.data_inicio, s.data_fim, s.hora, s.duracao_min, p.nome, s.observacoes, s.paciente_id
+    FROM series_agendamento s
+    JOIN pacientes p ON s.paciente_id = p.id
+    WHERE s.psicologo_id = ? AND s.data_inicio < ? AND (s.data_fim IS NULL OR s.data_fim >= ?)
+"""
+
+SQL_EXCECOES_PERIODO = """
+    SELECT e.serie_id, e.data_original, e.cancelada, e.novo_inicio, e.duracao_min
+    FROM excecoes_serie e
+    JOIN series_agendamento s ON s.id = e.serie_id
+    WHERE s.psicologo_id = ? AND s.data_inicio < ? AND (s.data_fim IS NULL OR s.data_fim >= ?)
+      AND e.data_original >= ? AND e.data_original < ?
+"""
+
+# Séries ainda ativas de alguns pacientes (página da lista de pacientes)
+SQL_SERIES_DOS_PACIENTES = """
+    SELECT s.id, s.paciente_id, s.regra, s.data_inicio, s.data_fim, s.hora
+    FROM series_agendamento s
+    WHERE s.paciente_id IN ({marcadores}) AND s.psicologo_id = ? AND (s.data_fim IS NULL OR s.data_fim >= ?)
+"""
+
+SQL_EXCECOES_DAS_SERIES = """
+    SELECT serie_id, data_original, cancelada, novo_inicio
+    FROM excecoes_serie
+    WHERE serie_id IN ({marcadores}) AND data_original >= ?
+"""
+
+SQL_SERIES_ATIVAS = """
+    SELECT s.id, s.regra, s.data_inicio, s.data_fim, s.hora, s.duracao_min, p.nome, s.paciente_id
+    FROM series_agendamento s
+    JOIN pacientes p ON s.paciente_id = p.id
+    WHERE s.psicologo_id = ? AND (s.data_fim IS NULL OR s.data_fim >= ?)
+    ORDER BY p.nome, s.id
+"""
+
+
+class ConflitoDeHorario(Exception):
+    def __init__(self, conflitos):
+        super().__init__(f"{len(conflitos)} agendamento(s) no mesmo horário")
+        self.conflitos = conflitos
+
+
+def _texto(momento):
+    return momento.strftime(_FORMATO)
+
+def _momento(texto):
+    return datetime.strptime(texto, _FORMATO)
+
+@contextmanager
+def _transacao_imediata(conn):
+    # Conferência + escrita sob o lock de escrita: duas abas não passam as duas.
+    # Pelo escritor único (escrita.py) o lote já está em um BEGIN IMMEDIATE:
+    # basta um savepoint para desfazer só esta operação.
+    if conn.in_transaction:
+        conn.execute("SAVEPOINT agenda")
+        try:
+            yield
+        except Exception:
+            conn.execute("ROLLBACK TO agenda")
+            conn.execute("RELEASE agenda")
+            raise
+        conn.execute("RELEASE agenda")
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def inicio_de(data, hora):
+    # data/hora como gravados nas colunas antigas -> valor de `inicio`
+    return f"{data} {hora}"
+
+def buscar_periodo(conn, psicologo_id, de, ate):
+    """Agendamentos e ocorrências de séries com início em [de, ate) (datas), em
+    ordem. Cada linha: (id, inicio, duracao_min, nome, observacoes, paciente_id,
+    serie_id, data_original); id é None nas ocorrências e serie_id nos avulsos."""
+    avulsos = [
+        linha + (None, None)
+        for linha in conn.execute(SQL_AGENDAMENTOS_PERIODO, (psicologo_id, de.isoformat(), ate.isoformat()))
+    ]
+    return sorted(avulsos + ocorrencias(conn, psicologo_id, de, ate), key=lambda linha: linha[1])
+
+def semana_de(dia):
+    # (segunda-feira, segunda seguinte)
+    segunda = dia - timedelta(days=dia.weekday())
+    return segunda, segunda + timedelta(days=7)
+
+def mes_de(dia):
+    primeiro = dia.replace(day=1)
+    return primeiro, date(primeiro.year + primeiro.month // 12, primeiro.month % 12 + 1, 1)
+
+# ----------------------------------------------
+# SÉRIES RECORRENTES
+# ----------------------------------------------
+
+def datas_da_regra(regra, data_inicio, data_fim, de, ate):
+    """Datas das ocorrências de uma série em [de, ate), sem passar de data_fim."""
+    if data_fim is not None:
+        ate = min(ate, data_fim + timedelta(days=1))
+    de = max(de, data_inicio)
+    intervalo = REGRAS[regra]
+    if intervalo is not None:
+        # Pula direto para a primeira ocorrência >= de
+        passos = -(-(de - data_inicio).days // intervalo)
+        dia = data_inicio + timedelta(days=passos * intervalo)
+        while dia < ate:
+            yield dia
+            dia += timedelta(days=intervalo)
+        return
+    # Mensal: mesmo dia do mês; em meses mais curtos, o último dia
+    ano, mes = de.year, de.month
+    while True:
+        dia = date(ano, mes, min(data_inicio.day, calendar.monthrange(ano, mes)[1]))
+        if dia >= ate:
+            return
+        if dia >= de:
+            yield dia
+        ano, mes = ano + mes // 12, mes % 12 + 1
+
+def ocorrencias(conn, psicologo_id, de, ate):
+    """Ocorrências das séries com início em [de, ate), já aplicadas as exceções.
+    Mesmo formato de buscar_periodo (id None)."""
+    margem = timedelta(days=MAX_REMARCACAO_DIAS)
+    de_margem, ate_margem = (de - margem).isoformat(), (ate + margem).isoformat()
+    series = conn.execute(SQL_SERIES_PERIODO, (psicologo_id, ate_margem, de_margem)).fetchall()
+    if not series:
+        return []
+    excecoes = {
+        (serie_id, data_original): (cancelada, novo_inicio, duracao)
+        for serie_id, data_original, cancelada, novo_inicio, duracao in conn.execute(
+            SQL_EXCECOES_PERIODO, (psicologo_id, ate_margem, de_margem, de_margem, ate_margem)
+        )
+    }
+
+    de_texto, ate_texto = de.isoformat(), ate.isoformat()
+    resultado = []
+    for serie_id, regra, data_inicio, data_fim, hora, duracao, nome, observacoes, paciente_id in series:
+        datas = datas_da_regra(
+            regra, date.fromisoformat(data_inicio), date.fromisoformat(data_fim) if data_fim else None,
+            de - margem, ate + margem,
+        )
+        for dia in datas:
+            original = dia.isoformat()
+            inicio, duracao_ocorrencia = inicio_de(original, hora), duracao
+            excecao = excecoes.get((serie_id, original))
+            if excecao is not None:
+                cancelada, novo_inicio, nova_duracao = excecao
+                if cancelada:
+                    continue
+                inicio = novo_inicio or inicio
+                duracao_ocorrencia = nova_duracao or duracao
+            if de_texto <= inicio < ate_texto:
+                resultado.append((None, inicio, duracao_ocorrencia, nome, observacoes, paciente_id, serie_id, original))
+    return resultado
+
+def proximos_agendamentos(conn, psicologo_id, hoje, dias=DIAS_PROXIMAS_OCORRENCIAS):
+    """Todos os agendamentos avulsos a partir de `hoje` e as ocorrências das
+    séries nos próximos `dias` (uma série não tem fim), em ordem de início.
+    Mesmo formato de buscar_periodo."""
+    avulsos = [
+        linha + (None, None)
+        for linha in conn.execute(SQL_AGENDAMENTOS_PERIODO, (psicologo_id, hoje.isoformat(), date.max.isoformat()))
+    ]
+    series = ocorrencias(conn, psicologo_id, hoje, hoje + timedelta(days=dias))
+    return sorted(avulsos + series, key=lambda linha: linha[1])
+
+def proximas_por_paciente(conn, psicologo_id, paciente_ids, a_partir):
+    """{paciente_id: inicio} da próxima ocorrência não cancelada de alguma série
+    de cada paciente, com início a partir de `a_partir` (data)."""
+    if not paciente_ids:
+        return {}
+    # Uma série encerrada há menos de MAX_REMARCACAO_DIAS ainda pode ter uma ocorrência remarcada adiante
+    margem = timedelta(days=MAX_REMARCACAO_DIAS)
+    marcadores = ", ".join("?" * len(paciente_ids))
+    series = conn.execute(SQL_SERIES_DOS_PACIENTES.format(marcadores=marcadores),
+                          list(paciente_ids) + [psicologo_id, (a_partir - margem).isoformat()]).fetchall()
+    if not series:
+        return {}
+    marcadores = ", ".join("?" * len(series))
+    excecoes = {
+        (serie_id, data_original): (cancelada, novo_inicio)
+        for serie_id, data_original, cancelada, novo_inicio in conn.execute(
+            SQL_EXCECOES_DAS_SERIES.format(marcadores=marcadores),
+            [linha[0] for linha in series] + [(a_partir - margem).isoformat()],
+        )
+    }
+
+    a_partir_texto = a_partir.isoformat()
+    proximas = {}
+    for serie_id, paciente_id, regra, data_inicio, data_fim, hora in series:
+        datas = datas_da_regra(regra, date.fromisoformat(data_inicio),
+                               date.fromisoformat(data_fim) if data_fim else None, a_partir - margem, date.max)
+        melhor = None
+        for dia in datas:
+            # Uma ocorrência só sai até MAX_REMARCACAO_DIAS da data original:
+            # daqui em diante nenhuma começa antes da melhor já encontrada
+            if melhor is not None and dia - margem > _momento(melhor).date():
+                break
+            inicio = inicio_de(dia.isoformat(), hora)
+            cancelada, novo_inicio = excecoes.get((serie_id, dia.isoformat()), (0, None))
+            if cancelada:
+                continue
+            inicio = novo_inicio or inicio
+            if inicio >= a_partir_texto and (melhor is None or inicio < melhor):
+                melhor = inicio
+        if melhor is not None and (paciente_id not in proximas or melhor < proximas[paciente_id]):
+            proximas[paciente_id] = melhor
+    return proximas
+
+def _ocupados(conn, psicologo_id, de, ate, ignorar=None):
+    """Agendamentos (avulsos e de séries) que se sobrepõem a [de, ate) (datetimes):
+    [(inicio, fim, linha de buscar_periodo)]. `ignorar` é um id de agendamento
+    ou um par (serie_id, data_original).
+
+    A faixa lida começa DURACAO_MAXIMA antes de `de`: nada que comece antes
+    disso pode invadir o intervalo."""
+    linhas = buscar_periodo(conn, psicologo_id, (de - timedelta(minutes=DURACAO_MAXIMA)).date(),
+                            ate.date() + timedelta(days=1))
+    resultado = []
+    for linha in linhas:
+        if ignorar is not None and (linha[0] == ignorar or (linha[6], linha[7]) == ignorar):
+            continue
+        comeco = _momento(linha[1])
+        termino = comeco + timedelta(minutes=linha[2] or DURACAO_PADRAO)
+        if comeco < ate and termino > de:
+            resultado.append((comeco, termino, linha))
+    return resultado
+
+def _conflitos_em(ocupados, inicio, duracao_min):
+    fim = inicio + timedelta(minutes=duracao_min)
+    return [(linha[0], linha[1], linha[2], linha[3]) for comeco, termino, linha in ocupados
+            if comeco < fim and termino > inicio]
+
+def criar_serie(conn, psicologo_id, paciente_id, primeira, duracao_min=DURACAO_PADRAO, regra="semanal",
+                data_fim=None, observacoes="", permitir_conflito=False):
+    """Grava a série (uma linha) e retorna o id. `primeira` é o datetime da
+    primeira ocorrência; ConflitoDeHorario se alguma ocorrência do próximo ano
+    (ou até data_fim) se sobrepuser a outro agendamento."""
+    if regra not in REGRAS:
+        raise ValueError(f"regra desconhecida: {regra}")
+    if not 0 < duracao_min <= DURACAO_MAXIMA:
+        raise ValueError(f"duração deve estar entre 1 e {DURACAO_MAXIMA} minutos")
+    if data_fim is not None and data_fim < primeira.date():
+        raise ValueError("a data final é anterior à primeira ocorrência")
+
+    with _transacao_imediata(conn):
+        if not permitir_conflito:
+            horizonte = primeira.date() + timedelta(days=HORIZONTE_CONFLITOS_DIAS)
+            if data_fim is not None:
+                horizonte = min(horizonte, data_fim + timedelta(days=1))
+            # Uma única leitura para o horizonte todo; cada ocorrência é conferida em memória
+            ocupados = _ocupados(conn, psicologo_id, primeira, datetime.combine(horizonte, primeira.time()))
+            conflitos = []
+            for dia in datas_da_regra(regra, primeira.date(), data_fim, primeira.date(), horizonte):
+                conflitos += _conflitos_em(ocupados, datetime.combine(dia, primeira.time()), duracao_min)
+            if conflitos:
+                raise ConflitoDeHorario(conflitos)
+        return conn.execute(
+            """INSERT INTO series_agendamento
+               (psicologo_id, paciente_id, regra, data_inicio, data_fim, hora, duracao_min, observacoes)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+            (psicologo_id, paciente_id, regra, primeira.date().isoformat(),
+             data_fim.isoformat() if data_fim else None, primeira.strftime("%H:%M"), duracao_min, observacoes),
+        ).lastrowid
+
+def _serie(conn, psicologo_id, serie_id):
+    # A série, se for do psicólogo (os ids vêm da interface)
+    linha = conn.execute(
+        "SELECT regra, data_inicio, data_fim FROM series_agendamento WHERE id = ? AND psicologo_id = ?",
+        (serie_id, psicologo_id),
+    ).fetchone()
+    if linha is None:
+        raise LookupError("série não encontrada")
+    return linha
+
+def _conferir_ocorrencia(conn, psicologo_id, serie_id, data_original):
+    regra, data_inicio, data_fim = _serie(conn, psicologo_id, serie_id)
+    dia = date.fromisoformat(data_original)
+    datas = datas_da_regra(regra, date.fromisoformat(data_inicio), date.fromisoformat(data_fim) if data_fim else None,
+                           dia, dia + timedelta(days=1))
+    if dia not in datas:
+        raise ValueError(f"{data_original} não é uma ocorrência da série")
+
+def cancelar_ocorrencia(conn, psicologo_id, serie_id, data_original):
+    """Cancela só a ocorrência de `data_original` (AAAA-MM-DD)."""
+    with _transacao_imediata(conn):
+        _conferir_ocorrencia(conn, psicologo_id, serie_id, data_original)
+        conn.execute(
+            """INSERT INTO excecoes_serie (serie_id, data_original, cancelada) VALUES (?, ?, 1)
+               ON CONFLICT (serie_id, data_original) DO UPDATE SET cancelada = 1, novo_inicio = NULL, duracao_min = NULL""",
+            (serie_id, data_original),
+        )
+
+def remarcar_ocorrencia(conn, psicologo_id, serie_id, data_original, novo_inicio, duracao_min=None,
+                        permitir_conflito=False):
+    """Move só a ocorrência de `data_original` para `novo_inicio` (datetime)."""
+    if abs((novo_inicio.date() - date.fromisoformat(data_original)).days) > MAX_REMARCACAO_DIAS:
+        raise ValueError(f"remarque para no máximo {MAX_REMARCACAO_DIAS} dias da data original")
+    with _transacao_imediata(conn):
+        _conferir_ocorrencia(conn, psicologo_id, serie_id, data_original)
+        if not permitir_conflito:
+            duracao = duracao_min or conn.execute(
+                "SELECT duracao_min FROM series_agendamento WHERE id = ?", (serie_id,)
+            ).fetchone()[0]
+            ocupados = _ocupados(conn, psicologo_id, novo_inicio, novo_inicio + timedelta(minutes=duracao),
+                                 ignorar=(serie_id, data_original))
+            conflitos = _conflitos_em(ocupados, novo_inicio, duracao)
+            if conflitos:
+                raise ConflitoDeHorario(conflitos)
+        conn.execute(
+            """INSERT INTO excecoes_serie (serie_id, data_original, cancelada, novo_inicio, duracao_min) VALUES (?, ?, 0, ?, ?)
+               ON CONFLICT (serie_id, data_original)
+               DO UPDATE SET cancelada = 0, novo_inicio = excluded.novo_inicio, duracao_min = excluded.duracao_min""",
+            (serie_id, data_original, _texto(novo_inicio), duracao_min),
+        )
+
+def encerrar_serie(conn, psicologo_id, serie_id, ultima_data):
+    """A série deixa de gerar ocorrências depois de `ultima_data` (as anteriores ficam)."""
+    with _transacao_imediata(conn):
+        _regra, data_inicio, _data_fim = _serie(conn, psicologo_id, serie_id)
+        if ultima_data < date.fromisoformat(data_inicio):
+            # Nem começou: não sobra nenhuma ocorrência
+            conn.execute("DELETE FROM series_agendamento WHERE id = ?", (serie_id,))
+        else:
+            conn.execute("UPDATE series_agendamento SET data_fim = ? WHERE id = ?", (ultima_data.isoformat(), serie_id))
+            conn.execute("DELETE FROM excecoes_serie WHERE serie_id = ? AND data_original > ?",
+                         (serie_id, ultima_data.isoformat()))
+
+def series_ativas(conn, psicologo_id, hoje=None):
+    return conn.execute(SQL_SERIES_ATIVAS, (psicologo_id, (hoje or date.today()).isoformat())).fetchall()
+
+def proximas_ocorrencias(conn, psicologo_id, serie_id, a_partir, quantidade=8):
+    """Ocorrências não canceladas da série a partir de `a_partir`, no máximo
+    `quantidade`, olhando `quantidade` intervalos da regra à frente."""
+    regra, _inicio, _fim = _serie(conn, psicologo_id, serie_id)
+    janela = timedelta(days=(REGRAS[regra] or 31) * quantidade + 1)
+    linhas = [linha for linha in ocorrencias(conn, psicologo_id, a_partir, a_partir + janela) if linha[6] == serie_id]
+    return sorted(linhas, key=lambda linha: linha[1])[:quantidade]
+
+
+# ----------------------------------------------
+# CONFLITOS E HORÁRIOS LIVRES
+# ----------------------------------------------
+
+def buscar_conflitos(conn, psicologo_id, inicio, duracao_min, ignorar=None):
+    """Agendamentos (avulsos ou de séries) que se sobrepõem a [inicio, inicio + duração).
+    Cada um: (id ou None, inicio, duracao_min, nome)."""
+    fim = inicio + timedelta(minutes=duracao_min)
+    return _conflitos_em(_ocupados(conn, psicologo_id, inicio, fim, ignorar), inicio, duracao_min)
+
+def agendar(conn, psicologo_id, paciente_id, inicio, duracao_min=DURACAO_PADRAO, observacoes="",
+            permitir_conflito=False):
+    """Grava o agendamento e retorna o id; ConflitoDeHorario se houver sobreposição.
+
+    A conferência e a inserção acontecem na mesma transação IMMEDIATE: duas
+    abas agendando o mesmo horário não passam as duas pela conferência."""
+    if not 0 < duracao_min <= DURACAO_MAXIMA:
+        raise ValueError(f"duração deve estar entre 1 e {DURACAO_MAXIMA} minutos")
+    with _transacao_imediata(conn):
+        conflitos = buscar_conflitos(conn, psicologo_id, inicio, duracao_min)
+        if conflitos and not permitir_conflito:
+            raise ConflitoDeHorario(conflitos)
+        data, hora = inicio.strftime("%Y-%m-%d"), inicio.strftime("%H:%M")
+        return conn.execute(
+            SQL_INSERIR_AGENDAMENTO,
+            (paciente_id, data, hora, observacoes, _texto(inicio), duracao_min, psicologo_id),
+        ).lastrowid
+
+def horarios_livres(conn, psicologo_id, dia, duracao_min=DURACAO_PADRAO,
+                    inicio_expediente=INICIO_EXPEDIENTE, fim_expediente=FIM_EXPEDIENTE, passo=PASSO_HORARIOS):
+    """Inícios possíveis (datetime) no dia, de `passo` em `passo` minutos, em que
+    uma consulta de `duracao_min` cabe no expediente sem sobrepor nenhuma outra."""
+    abertura = datetime.combine(dia, datetime.strptime(inicio_expediente, "%H:%M").time())
+    fechamento = datetime.combine(dia, datetime.strptime(fim_expediente, "%H:%M").time())
+    ocupados = [(comeco, termino) for comeco, termino, _linha in _ocupados(conn, psicologo_id, abertura, fechamento)]
+
+    livres = []
+    candidato = abertura
+    duracao = timedelta(minutes=duracao_min)
+    while candidato + duracao <= fechamento:
+        fim = candidato + duracao
+        if all(fim <= comeco or candidato >= termino for comeco, termino in ocupados):
+            livres.append(candidato)
+        candidato += timedelta(minutes=passo)
+    return livres
@@ -0,0 +1,155 @@
+"""Leitura incremental do registro de alterações (tabela alteracoes).
+
+Os triggers das migrações 6 e 15 gravam um seq crescente para cada
+INSERT/UPDATE/DELETE em pacientes, sessões, agendamentos, custos e séries
+recorrentes. As exceções de uma série (ocorrências canceladas ou remarcadas)
+vêm como tabela "excecoes_serie" com o id da série, e os dados são a lista
+atual de exceções dela. Quem sincroniza guarda o último
+seq recebido (o "cursor") e na próxima vez pede só o que veio depois dele:
+
+    alteracoes, cursor = buscar_alteracoes(conn, psicologo_id, desde=cursor)
+
+A linha atual de cada registro é lida no momento da consulta (o log guarda só
+a chave). Por isso várias alterações do mesmo registro em uma página viram uma
+só, com o estado mais recente; um registro já excluído vem com dados=None.
+
+Uso pela linha de comando (uma alteração JSON por linha no stdout):
+    python alteracoes.py --psicologo 1 --arquivo-cursor billing.cursor
+"""
+import json
+
+from migracao import CHAVES_ALTERACOES, TABELAS_ALTERACOES
+
+LIMITE_ALTERACOES = 1000
+
+# Limite de parâmetros por IN (...): o SQLite antigo aceita no máximo 999
+_MAX_IDS_POR_CONSULTA = 900
+
+OPERACOES = {"I": "insercao", "U": "atualizacao", "D": "exclusao"}
+
+SQL_ALTERACOES = """
+SELECT seq, tabela, registro_id, operacao, momento
+FROM alteracoes
+WHERE psicologo_id = ? AND seq > ?
+ORDER BY seq
+LIMIT ?
+"""
+
+SQL_ULTIMO_SEQ = "SELECT COALESCE(MAX(seq), 0) FROM alteracoes WHERE psicologo_id = ?"
+
+
+def _linhas_atuais(conn, psicologo_id, tabela, ids):
+    # {id: dicionário com a linha atual} para os ids que ainda existem e ainda
+    # pertencem ao psicólogo (uma linha que mudou de dono não é exposta)
+    dono = TABELAS_ALTERACOES[tabela].format(linha=tabela)
+    chave = CHAVES_ALTERACOES.get(tabela, "id")
+    # Chave que não é o id (exceções por série): cada id vira uma lista, vazia se não sobrou nenhuma
+    linhas = {} if chave == "id" else {registro_id: [] for registro_id in ids}
+    ids = sorted(ids)
+    for i in range(0, len(ids), _MAX_IDS_POR_CONSULTA):
+        parte = ids[i:i + _MAX_IDS_POR_CONSULTA]
+        marcadores = ", ".join("?" * len(parte))
+        cursor = conn.execute(
+            f"SELECT * FROM {tabela} WHERE {chave} IN ({marcadores}) AND {dono} = ?", parte + [psicologo_id]
+        )
+        colunas = [c[0] for c in cursor.description]
+        for valores in cursor:
+            linha = dict(zip(colunas, valores))
+            if chave == "id":
+                linhas[linha["id"]] = linha
+            else:
+                linhas[linha[chave]].append(linha)
+    return linhas
+
+def buscar_alteracoes(conn, psicologo_id, desde=0, limite=LIMITE_ALTERACOES):
+    """Retorna (alterações, novo cursor) com até `limite` entradas do log após `desde`.
+
+    Cada alteração é um dicionário {seq, tabela, id, operacao, momento, dados},
+    em ordem de seq. O novo cursor é o seq da última entrada lida (ou `desde`,
+    se não houver nada novo); repita enquanto a lista vier cheia."""
+    entradas = conn.execute(SQL_ALTERACOES, (psicologo_id, desde, limite)).fetchall()
+    if not entradas:
+        return [], desde
+    cursor = entradas[-1][0]
+
+    # Só a última entrada de cada registro interessa: os dados já são os atuais
+    ultimas = {}
+    for entrada in entradas:
+        ultimas[(entrada[1], entrada[2])] = entrada
+
+    por_tabela = {}
+    for tabela, registro_id, operacao in (e[1:4] for e in ultimas.values()):
+        if operacao != "D":
+            por_tabela.setdefault(tabela, set()).add(registro_id)
+    atuais = {tabela: _linhas_atuais(conn, psicologo_id, tabela, ids)
+              for tabela, ids in por_tabela.items() if tabela in TABELAS_ALTERACOES}
+
+    alteracoes = []
+    for seq, tabela, registro_id, operacao, momento in sorted(ultimas.values()):
+        alteracoes.append({
+            "seq": seq,
+            "tabela": tabela,
+            "id": registro_id,
+            "operacao": OPERACOES[operacao],
+            "momento": momento,
+            # None se o registro não existe mais (o 'D' pode vir numa página seguinte)
+            "dados": atuais.get(tabela, {}).get(registro_id),
+        })
+    return alteracoes, cursor
+
+def iterar_alteracoes(conn, psicologo_id, desde=0, limite=LIMITE_ALTERACOES):
+    """Percorre todas as páginas após `desde`; o seq de cada alteração serve de cursor."""
+    while True:
+        alteracoes, desde = buscar_alteracoes(conn, psicologo_id, desde, limite)
+        if not alteracoes:
+            return
+        yield from alteracoes
+
+def ultimo_seq(conn, psicologo_id):
+    # Cursor de partida para quem acabou de fazer uma carga completa
+    return conn.execute(SQL_ULTIMO_SEQ, (psicologo_id,)).fetchone()[0]
+
+def podar_alteracoes(conn, ate_seq):
+    """Apaga do log as entradas com seq <= ate_seq (já consumidas por todos)."""
+    with conn:
+        return conn.execute("DELETE FROM alteracoes WHERE seq <= ?", (ate_seq,)).rowcount
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    import sys
+
+    from database import criar_conexao, inicializar_banco
+
+    parser = argparse.ArgumentParser(description="Lista as alterações de um psicólogo desde um cursor.")
+    parser.add_argument("--psicologo", type=int, required=True)
+    parser.add_argument("--desde", type=int, help="Último seq já recebido (padrão: 0 ou o do --arquivo-cursor)")
+    parser.add_argument("--arquivo-cursor", help="Lê o cursor deste arquivo e grava o novo ao terminar")
+    parser.add_argument("--limite", type=int, default=LIMITE_ALTERACOES, help="Entradas do log por consulta")
+    args = parser.parse_args()
+
+    desde = args.desde
+    if desde is None:
+        desde = 0
+        if args.arquivo_cursor and os.path.exists(args.arquivo_cursor):
+            with open(args.arquivo_cursor) as arquivo:
+                desde = int(arquivo.read().strip() or 0)
+
+    inicializar_banco()
+    conn = criar_conexao(args.psicologo)
+    cursor, total = desde, 0
+    try:
+        for alteracao in iterar_alteracoes(conn, args.psicologo, desde, args.limite):
+            print(json.dumps(alteracao, ensure_ascii=False, default=str))
+            cursor = alteracao["seq"]
+            total += 1
+    finally:
+        conn.close()
+
+    # O cursor só avança depois que tudo foi escrito no stdout
+    sys.stdout.flush()
+    if args.arquivo_cursor:
+        with open(args.arquivo_cursor, "w") as arquivo:
+            arquivo.write(f"{cursor}\n")
+    print(f"{total} alterações; cursor = {cursor}", file=sys.stderr)
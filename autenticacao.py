@@ -0,0 +1,348 @@
+"""Senhas dos psicólogos: hash bcrypt fora da thread do script e limite de tentativas.
+
+bcrypt é caro de propósito (centenas de ms por verificação). As verificações e
+os hashes rodam em um pool pequeno de threads (o bcrypt libera o GIL enquanto
+calcula), então um pico de logins ocupa no máximo TRABALHADORES_HASH núcleos e
+os reruns dos outros usuários continuam andando. O custo (work factor) é
+configurável; hashes com custo diferente do atual são refeitos, em segundo
+plano, no próximo login bem-sucedido em que houver vaga no pool.
+
+Cada usuário pode errar a senha LIMITE_FALHAS vezes; depois disso fica
+bloqueado por um tempo que dobra a cada nova falha, e nem chega a gastar um
+bcrypt. O controle é em memória, por processo.
+
+Depois do login, um token de sessão aleatório (guardado só como SHA-256, com
+validade e revogação) vai na URL (?sessao=...). Recarregar a página ou abrir
+outra aba valida o token com uma consulta indexada, sem bcrypt.
+
+A URL é um contorno: o Streamlit não tem API de cookies, e o token precisa
+sobreviver ao F5. O preço é que ele aparece no histórico do navegador, em
+links copiados e em logs de proxy. Para limitar o estrago de uma URL vazada:
+  - a validade é curta (HORAS_SESSAO) e desliza enquanto o painel está em uso
+    (renovar_sessao);
+  - o token não é trocado a cada abertura: F5 e abas duplicadas usam o mesmo
+    token, validado só com leitura. Um link copiado vale até vencer ou até o
+    psicólogo sair;
+  - "Sair" revoga o token, e "Sair de todos os dispositivos" revoga todos os
+    do psicólogo (as abas abertas caem na próxima renovação).
+
+Para escolher o custo nesta máquina:
+    python autenticacao.py --alvo-ms 250
+"""
+import hashlib
+import math
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt # Necessário instalar: pip install bcrypt
+
+import escrita
+from database import conexao
+
+CUSTO_BCRYPT = int(os.environ.get("PSYCONTROL_BCRYPT_CUSTO", "12"))
+TRABALHADORES_HASH = int(os.environ.get("PSYCONTROL_HASH_TRABALHADORES", str(max(1, (os.cpu_count() or 2) // 2))))
+
+# Fila limitada: além disto, novos logins esperam até TEMPO_ESPERA_HASH e desistem
+MAX_HASHES_PENDENTES = TRABALHADORES_HASH * 4
+TEMPO_ESPERA_HASH = 10 # segundos
+
+# Limite de tentativas por usuário
+LIMITE_FALHAS = 5
+JANELA_FALHAS = 15 * 60 # Falhas mais antigas que isso são esquecidas (segundos)
+BLOQUEIO_INICIAL = 30 # segundos; dobra a cada falha além do limite
+BLOQUEIO_MAXIMO = 15 * 60
+# Usuários com falhas lembrados ao mesmo tempo. Nomes inventados também contam
+# falha; sem este teto, tentativas com nomes aleatórios fariam o dicionário
+# crescer sem fim. Acima dele, os de falha mais antiga são esquecidos.
+MAX_USUARIOS_COM_FALHAS = int(os.environ.get("PSYCONTROL_MAX_FALHAS_LEMBRADAS", "10000"))
+
+# Validade dos tokens de sessão, contada do último uso
+HORAS_SESSAO = float(os.environ.get("PSYCONTROL_SESSAO_HORAS", "8"))
+RENOVAR_A_CADA = 10 * 60 # segundos entre duas renovações da validade
+
+# Nome do parâmetro da URL que carrega o token
+PARAMETRO_SESSAO = "sessao"
+
+
+class ServidorOcupado(RuntimeError):
+    pass
+
+
+class TentativasExcedidas(RuntimeError):
+    def __init__(self, segundos):
+        super().__init__(f"Muitas tentativas. Tente novamente em {segundos} segundos.")
+        self.segundos = segundos
+
+
+# ----------------------------------------------
+# HASH EM THREADS DE TRABALHO
+# ----------------------------------------------
+
+_executor = ThreadPoolExecutor(max_workers=TRABALHADORES_HASH, thread_name_prefix="bcrypt")
+_vagas = threading.BoundedSemaphore(MAX_HASHES_PENDENTES)
+
+def _no_pool(funcao, *args):
+    # Executa no pool e espera o resultado; a thread do script só aguarda
+    if not _vagas.acquire(timeout=TEMPO_ESPERA_HASH):
+        raise ServidorOcupado("Muitos logins ao mesmo tempo. Tente novamente em instantes.")
+    try:
+        futuro = _executor.submit(funcao, *args)
+    except Exception:
+        _vagas.release()
+        raise
+    futuro.add_done_callback(lambda _futuro: _vagas.release())
+    return futuro.result()
+
+def gerar_hash(senha, custo=None):
+    custo = CUSTO_BCRYPT if custo is None else custo
+    return _no_pool(lambda: bcrypt.hashpw(senha.encode("utf-8"), bcrypt.gensalt(rounds=custo)).decode("utf-8"))
+
+def verificar_senha(senha, senha_hash):
+    """True/False; ValueError se senha_hash não for um hash bcrypt (cadastros antigos)."""
+    return _no_pool(bcrypt.checkpw, senha.encode("utf-8"), senha_hash.encode("utf-8"))
+
+def custo_do_hash(senha_hash):
+    # "$2b$12$<salt+hash>" -> 12
+    try:
+        return int(senha_hash.split("$")[2])
+    except (IndexError, ValueError):
+        return None
+
+def precisa_rehash(senha_hash):
+    return custo_do_hash(senha_hash) != CUSTO_BCRYPT
+
+def _refazer_hash(psicologo_id, senha, hash_antigo):
+    # Roda no pool, depois do login: o usuário não espera por este bcrypt.
+    # Só troca se o hash não mudou nesse meio tempo (ex.: troca de senha).
+    novo_hash = bcrypt.hashpw(senha.encode("utf-8"), bcrypt.gensalt(rounds=CUSTO_BCRYPT)).decode("utf-8")
+    escrita.executar(None, "UPDATE psicologos SET senha = ? WHERE id = ? AND senha = ?", (novo_hash, psicologo_id, hash_antigo))
+
+
+# ----------------------------------------------
+# LIMITE DE TENTATIVAS POR USUÁRIO
+# ----------------------------------------------
+
+_falhas = {} # usuario -> [momentos das falhas recentes], na ordem da última falha
+_em_verificacao = set() # Uma verificação por vez para o mesmo usuário
+_falhas_lock = threading.Lock()
+
+def _bloqueio_restante(usuario, agora):
+    recentes = [momento for momento in _falhas.get(usuario, []) if agora - momento < JANELA_FALHAS]
+    if recentes:
+        _falhas[usuario] = recentes
+    else:
+        _falhas.pop(usuario, None)
+    excesso = len(recentes) - LIMITE_FALHAS
+    if excesso < 0:
+        return 0
+    fim = recentes[-1] + min(BLOQUEIO_MAXIMO, BLOQUEIO_INICIAL * 2 ** excesso)
+    return math.ceil(fim - agora) if fim > agora else 0
+
+def _reservar_tentativa(usuario):
+    with _falhas_lock:
+        agora = time.monotonic()
+        restante = _bloqueio_restante(usuario, agora)
+        if restante:
+            raise TentativasExcedidas(restante)
+        if usuario in _em_verificacao:
+            raise TentativasExcedidas(1)
+        _em_verificacao.add(usuario)
+
+def _varrer_falhas(agora):
+    # Chamado com _falhas_lock. O dicionário está na ordem da última falha: os
+    # vencidos ficam no começo, e a varredura para no primeiro ainda recente.
+    while _falhas:
+        usuario, momentos = next(iter(_falhas.items()))
+        if agora - momentos[-1] < JANELA_FALHAS and len(_falhas) <= MAX_USUARIOS_COM_FALHAS:
+            break
+        del _falhas[usuario]
+
+def _concluir_tentativa(usuario, sucesso):
+    with _falhas_lock:
+        _em_verificacao.discard(usuario)
+        if sucesso:
+            _falhas.pop(usuario, None)
+        else:
+            agora = time.monotonic()
+            momentos = _falhas.pop(usuario, []) # Reinsere no fim (falha mais recente)
+            momentos.append(agora)
+            _falhas[usuario] = momentos
+            _varrer_falhas(agora)
+
+
+# ----------------------------------------------
+# LOGIN
+# ----------------------------------------------
+
+def autenticar(usuario, senha):
+    """Retorna (psicologo_id, nome) ou None se usuário/senha não conferem.
+
+    Levanta TentativasExcedidas (usuário bloqueado), ServidorOcupado (fila de
+    hashes cheia) ou ValueError (senha cadastrada sem bcrypt)."""
+    _reservar_tentativa(usuario)
+    sucesso = False
+    try:
+        with conexao() as conn:
+            resultado = conn.execute("SELECT id, nome, senha FROM psicologos WHERE usuario = ?", (usuario,)).fetchone()
+        if resultado is None:
+            return None
+        psicologo_id, nome, senha_hash = resultado
+        sucesso = verificar_senha(senha, senha_hash)
+        if not sucesso:
+            return None
+    finally:
+        _concluir_tentativa(usuario, sucesso)
+
+    if precisa_rehash(senha_hash):
+        _rehash_em_segundo_plano(psicologo_id, senha, senha_hash)
+    return psicologo_id, nome
+
+def _rehash_em_segundo_plano(psicologo_id, senha, senha_hash):
+    # Ocupa uma vaga da fila como as verificações, mas sem esperar: com a fila
+    # cheia (pico de logins logo após subir o custo) o rehash fica para o
+    # próximo login, em vez de disputar o pool com quem está entrando.
+    if not _vagas.acquire(blocking=False):
+        return
+    try:
+        futuro = _executor.submit(_refazer_hash, psicologo_id, senha, senha_hash)
+    except Exception:
+        _vagas.release()
+        raise
+    futuro.add_done_callback(lambda _futuro: _vagas.release())
+
+
+# ----------------------------------------------
+# TOKENS DE SESSÃO
+# ----------------------------------------------
+
+SQL_VALIDAR_TOKEN = """
+    SELECT t.psicologo_id, p.nome
+    FROM tokens_sessao t
+    JOIN psicologos p ON p.id = t.psicologo_id
+    WHERE t.token_hash = ? AND t.revogado = 0 AND t.expira_em > ?
+"""
+
+def _hash_token(token):
+    # Token aleatório de 256 bits: SHA-256 simples basta (não é senha fraca)
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def _gravar_token(conn, psicologo_id, token_hash, agora):
+    # Aproveita para descartar os tokens vencidos deste psicólogo
+    conn.execute("DELETE FROM tokens_sessao WHERE psicologo_id = ? AND expira_em <= ?", (psicologo_id, agora))
+    conn.execute(
+        "INSERT INTO tokens_sessao (psicologo_id, token_hash, criado_em, expira_em) VALUES (?, ?, ?, ?)",
+        (psicologo_id, token_hash, agora, agora + int(HORAS_SESSAO * 3600)),
+    )
+
+def criar_token_sessao(psicologo_id):
+    """Cria e retorna um token novo; só o hash vai para o banco."""
+    token = secrets.token_urlsafe(32)
+    escrita.escrever(None, _gravar_token, psicologo_id, _hash_token(token), int(time.time()))
+    return token
+
+def revogar_token_sessao(token):
+    if token:
+        escrita.executar(None, "UPDATE tokens_sessao SET revogado = 1 WHERE token_hash = ?", (_hash_token(token),))
+
+def revogar_sessoes_do_psicologo(psicologo_id):
+    # "Sair de todos os dispositivos"
+    escrita.executar(None, "UPDATE tokens_sessao SET revogado = 1 WHERE psicologo_id = ?", (psicologo_id,))
+
+def iniciar_sessao(estado, psicologo_id, nome):
+    # Preenche o st.session_state de um login (por senha ou por token)
+    estado["logado"] = True
+    estado["psicologo_id"] = psicologo_id
+    estado["nome_psicologo"] = nome
+
+def encerrar_sessao(estado):
+    # Esquece o login neste st.session_state (o token é revogado por quem chama)
+    estado.pop("token_sessao", None)
+    estado.pop("token_renovado_em", None)
+    estado["logado"] = False
+    estado["psicologo_id"] = None
+    estado["nome_psicologo"] = None
+
+def restaurar_sessao(estado, parametros):
+    """Se `estado` (st.session_state) não está logado mas `parametros`
+    (st.query_params) trazem um token válido, refaz o login. Retorna se está logado.
+
+    Só lê o banco: o mesmo token serve a todas as abas até vencer ou ser
+    revogado, e a validade desliza em renovar_sessao."""
+    if estado.get("logado"):
+        return True
+    token = parametros.get(PARAMETRO_SESSAO)
+    if not token:
+        return False
+    agora = int(time.time())
+    with conexao() as conn:
+        resultado = conn.execute(SQL_VALIDAR_TOKEN, (_hash_token(token), agora)).fetchone()
+    if resultado is None:
+        return False
+    iniciar_sessao(estado, *resultado)
+    estado["token_sessao"] = token
+    estado["token_renovado_em"] = agora
+    return True
+
+def renovar_sessao(estado):
+    """Validade deslizante: enquanto o painel é usado, o token vale por mais
+    HORAS_SESSAO (uma gravação a cada RENOVAR_A_CADA, no máximo).
+
+    Retorna False, e encerra a sessão em `estado`, se o token foi revogado ou
+    venceu (ex.: "Sair de todos os dispositivos" em outro aparelho)."""
+    token = estado.get("token_sessao")
+    if not token:
+        return True
+    agora = int(time.time())
+    if agora - estado.get("token_renovado_em", 0) < RENOVAR_A_CADA:
+        return True
+    renovados = escrita.executar(
+        None,
+        "UPDATE tokens_sessao SET expira_em = ? WHERE token_hash = ? AND revogado = 0 AND expira_em > ?",
+        (agora + int(HORAS_SESSAO * 3600), _hash_token(token), agora),
+    )
+    if not renovados:
+        encerrar_sessao(estado)
+        return False
+    estado["token_renovado_em"] = agora
+    return True
+
+
+if __name__ == "__main__":
+    import argparse
+    import statistics
+
+    parser = argparse.ArgumentParser(description="Mede o bcrypt para escolher PSYCONTROL_BCRYPT_CUSTO.")
+    parser.add_argument("--alvo-ms", type=float, default=250, help="Tempo máximo aceitável por verificação")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    args = parser.parse_args()
+
+    senha = b"senha-de-teste"
+    recomendado = None
+    print(f"{'custo':>5} {'mediana ms':>11} {'logins/s (pool de ' + str(TRABALHADORES_HASH) + ')':>24}")
+    for custo in range(8, 16):
+        senha_hash = bcrypt.hashpw(senha, bcrypt.gensalt(rounds=custo))
+        tempos = []
+        for _ in range(args.repeticoes):
+            inicio = time.perf_counter()
+            bcrypt.checkpw(senha, senha_hash)
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        mediana = statistics.median(tempos)
+
+        # Vazão com o pool cheio: quantas verificações por segundo ele sustenta
+        inicio = time.perf_counter()
+        list(_executor.map(lambda _i: bcrypt.checkpw(senha, senha_hash), range(TRABALHADORES_HASH * 2)))
+        vazao = TRABALHADORES_HASH * 2 / (time.perf_counter() - inicio)
+
+        print(f"{custo:5d} {mediana:11.1f} {vazao:24.1f}")
+        if mediana <= args.alvo_ms:
+            recomendado = custo
+        elif mediana > args.alvo_ms * 4:
+            break # Os próximos só ficam mais lentos
+
+    if recomendado is None:
+        print(f"\nNem o custo 8 fica abaixo de {args.alvo_ms:.0f} ms nesta máquina.")
+    else:
+        print(f"\nRecomendado: PSYCONTROL_BCRYPT_CUSTO={recomendado} (maior custo com mediana <= {args.alvo_ms:.0f} ms)")
@@ -0,0 +1,301 @@
+"""Benchmark das consultas do painel em bancos sintéticos de vários tamanhos.
+
+Para cada escala de gerador_dados.ESCALAS, gera (uma vez) um banco em
+--diretorio e mede cada carregador de dados do painel sem o cache de
+cache.py, que esconderia o custo real no primeiro acesso após uma escrita.
+Reporta p50/p95 (time.perf_counter), o pico de memória Python (tracemalloc,
+medido numa execução separada para não distorcer os tempos) e quanto o
+resultado ocupa enquanto fica no cache de cada sessão (cache.tamanho).
+
+    python benchmark.py                                  # escalas pequena e media
+    python benchmark.py --escalas grande --json atual.json
+    python benchmark.py --comparar base.json             # código 1 se o p95 piorar
+
+Os carregadores financeiros usam pandas, como a página; sem ele são pulados.
+"""
+import json
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import date
+
+import agenda
+import cache
+import consultas
+import database
+import escrita
+import gerador_dados
+
+try:
+    import pandas as pd
+    import quadros
+except ImportError:
+    pd = None
+
+REPETICOES = 30
+
+# Piora tolerada no p95 antes de acusar regressão: relativa E absoluta, para
+# que ruído em consultas de microssegundos não reprove a comparação
+TOLERANCIA = 0.25
+TOLERANCIA_MIN_MS = 1.0
+
+
+# ----------------------------------------------
+# CARREGADORES MEDIDOS (mesmas consultas da página)
+# ----------------------------------------------
+
+def _preparar(conn, psicologo_id):
+    # Parâmetros realistas para os carregadores: período completo do histórico,
+    # o paciente com mais sessões e o cursor da 10ª página do histórico
+    hoje = date.today().isoformat()
+    primeira = conn.execute(consultas.SQL_PRIMEIRA_DATA_SESSAO, (psicologo_id,)).fetchone()[0] or hoje
+    paciente = conn.execute(
+        "SELECT s.paciente_id FROM sessoes s JOIN pacientes p ON s.paciente_id = p.id "
+        "WHERE p.psicologo_id = ? GROUP BY s.paciente_id ORDER BY COUNT(*) DESC LIMIT 1",
+        (psicologo_id,),
+    ).fetchone()
+    filtros = {"data_inicio": primeira, "data_fim": hoje}
+    cursor = None
+    for _ in range(9):
+        _linhas, proximo = consultas.buscar_pagina_sessoes(conn, psicologo_id, cursor=cursor, **filtros)
+        if proximo is None:
+            break
+        cursor = proximo
+    return {"filtros": filtros, "paciente_id": paciente[0] if paciente else None, "cursor_pagina_10": cursor}
+
+def _get_pacientes(conn, psicologo_id, _ctx):
+    return dict(conn.execute(consultas.SQL_PACIENTES_NOMES, (psicologo_id,)).fetchall())
+
+def _pagina_pacientes(conn, psicologo_id, _ctx, busca=""):
+    total = consultas.contar_pacientes(conn, psicologo_id, busca)
+    return total, consultas.buscar_pagina_pacientes(conn, psicologo_id, busca, "Nome (A-Z)", 0)
+
+def _busca_pacientes(conn, psicologo_id, ctx):
+    return _pagina_pacientes(conn, psicologo_id, ctx, busca="silva")
+
+def _seletor_pacientes(conn, psicologo_id, _ctx):
+    return consultas.buscar_pacientes_seletor(conn, psicologo_id, "silva")
+
+def _historico_sessoes(conn, psicologo_id, ctx, cursor=None, **extra):
+    filtros = dict(ctx["filtros"], **extra)
+    total = consultas.contar_sessoes(conn, psicologo_id, **filtros)
+    return total, consultas.buscar_pagina_sessoes(conn, psicologo_id, cursor=cursor, **filtros)
+
+def _historico_pagina_10(conn, psicologo_id, ctx):
+    return _historico_sessoes(conn, psicologo_id, ctx, cursor=ctx["cursor_pagina_10"])
+
+def _historico_paciente(conn, psicologo_id, ctx):
+    return _historico_sessoes(conn, psicologo_id, ctx, paciente_id=ctx["paciente_id"])
+
+def _busca_textual(conn, psicologo_id, _ctx):
+    return consultas.buscar_textos(conn, psicologo_id, "ansiedade sono")
+
+def _agendamentos_futuros(conn, psicologo_id, _ctx):
+    return agenda.proximos_agendamentos(conn, psicologo_id, date.today())
+
+def _agenda_mes(conn, psicologo_id, _ctx):
+    return agenda.buscar_periodo(conn, psicologo_id, *agenda.mes_de(date.today()))
+
+def _horarios_livres(conn, psicologo_id, _ctx):
+    return agenda.horarios_livres(conn, psicologo_id, date.today())
+
+def _dados_financeiros(conn, psicologo_id, _ctx):
+    return quadros.ler_custos(conn, psicologo_id), quadros.ler_receita(conn, psicologo_id)
+
+def _resumo_financeiro(conn, psicologo_id, _ctx):
+    # carregar_resumo_financeiro: totais, meses e categorias somados no SQLite
+    totais = conn.execute(consultas.SQL_TOTAIS_FINANCEIROS, (psicologo_id, psicologo_id)).fetchone()
+    mensal = conn.execute(consultas.SQL_FINANCEIRO_MENSAL, (psicologo_id, psicologo_id)).fetchall()
+    por_categoria = conn.execute(consultas.SQL_CUSTOS_POR_CATEGORIA, (psicologo_id,)).fetchall()
+    return totais, mensal, por_categoria
+
+# (nome, função, precisa de pandas)
+CARREGADORES = [
+    ("get_pacientes", _get_pacientes, False),
+    ("listar_pacientes (1ª página)", _pagina_pacientes, False),
+    ("listar_pacientes (busca)", _busca_pacientes, False),
+    ("seletor de pacientes (busca)", _seletor_pacientes, False),
+    ("listar_sessoes (1ª página)", _historico_sessoes, False),
+    ("listar_sessoes (10ª página)", _historico_pagina_10, False),
+    ("listar_sessoes (por paciente)", _historico_paciente, False),
+    ("busca textual (notas)", _busca_textual, False),
+    ("listar_agendamentos", _agendamentos_futuros, False),
+    ("calendário (mês)", _agenda_mes, False),
+    ("horários livres (dia)", _horarios_livres, False),
+    ("get_dados_financeiros", _dados_financeiros, True),
+    ("gestao_custos (totais no SQL)", _resumo_financeiro, False),
+]
+
+
+# Gravações concorrentes pelo escritor único (escrita.py): cada "sessão" é uma
+# thread que grava e apaga um custo, como um formulário do painel
+SESSOES_ESCRITA = (1, 8, 32)
+GRAVACOES_POR_SESSAO = 25
+
+def _gravar_e_apagar(conn, psicologo_id):
+    cursor = conn.execute(
+        "INSERT INTO custos (psicologo_id, descricao, valor_centavos, data, categoria) VALUES (?, 'benchmark', 100, '2000-01-01', 'Outros')",
+        (psicologo_id,),
+    )
+    conn.execute("DELETE FROM custos WHERE id = ?", (cursor.lastrowid,))
+
+
+# ----------------------------------------------
+# MEDIÇÃO
+# ----------------------------------------------
+
+def percentil(ordenados, p):
+    # Posto mais próximo, sem interpolar: com 30 amostras, p95 é a 29ª
+    return ordenados[max(0, math.ceil(p / 100 * len(ordenados)) - 1)]
+
+def medir(funcao, repeticoes=REPETICOES, aquecimento=2):
+    """Executa funcao() e retorna {p50_ms, p95_ms, media_ms, pico_memoria_kb, retido_kb}."""
+    for _ in range(aquecimento): # Cache de páginas do SQLite e imports preguiçosos
+        funcao()
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    tempos.sort()
+
+    tracemalloc.start()
+    try:
+        resultado = funcao()
+        _atual, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "p50_ms": round(percentil(tempos, 50), 3),
+        "p95_ms": round(percentil(tempos, 95), 3),
+        "media_ms": round(sum(tempos) / len(tempos), 3),
+        "pico_memoria_kb": round(pico / 1024, 1),
+        "retido_kb": round(cache.tamanho(resultado) / 1024, 1),
+    }
+
+def medir_escritas(psicologo_id, sessoes, gravacoes=GRAVACOES_POR_SESSAO):
+    """Latência de cada gravação com `sessoes` threads gravando ao mesmo tempo."""
+    tempos = []
+    lock = threading.Lock()
+
+    def sessao():
+        for _ in range(gravacoes):
+            inicio = time.perf_counter()
+            escrita.escrever(psicologo_id, _gravar_e_apagar, psicologo_id)
+            with lock:
+                tempos.append((time.perf_counter() - inicio) * 1000)
+
+    threads = [threading.Thread(target=sessao) for _ in range(sessoes)]
+    inicio = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duracao = time.perf_counter() - inicio
+    tempos.sort()
+    return {
+        "p50_ms": round(percentil(tempos, 50), 3),
+        "p95_ms": round(percentil(tempos, 95), 3),
+        "media_ms": round(sum(tempos) / len(tempos), 3),
+        "por_segundo": round(len(tempos) / duracao, 1),
+    }
+
+def caminho_banco(diretorio, escala, semente):
+    return os.path.join(diretorio, f"bench_{escala}_s{semente}.db")
+
+def preparar_banco(diretorio, escala, semente):
+    caminho = caminho_banco(diretorio, escala, semente)
+    if not os.path.exists(caminho):
+        print(f"Gerando banco '{escala}' em {caminho}...", file=sys.stderr)
+        gerador_dados.gerar_banco(caminho, semente=semente, **gerador_dados.ESCALAS[escala])
+    return caminho
+
+def executar(escalas, diretorio, semente=42, repeticoes=REPETICOES, psicologo_id=1):
+    """Retorna {escala: {"linhas": {...}, "carregadores": {nome: métricas}, "escritas": {nome: métricas}}}."""
+    resultados = {}
+    for escala in escalas:
+        database.configurar(preparar_banco(diretorio, escala, semente))
+        database.inicializar_banco()
+        conn = database.criar_conexao()
+        try:
+            linhas = {tabela: conn.execute(f"SELECT COUNT(*) FROM {tabela}").fetchone()[0]
+                      for tabela in ("pacientes", "sessoes", "agendamentos", "custos", "series_agendamento")}
+            ctx = _preparar(conn, psicologo_id)
+            medidas = {}
+            for nome, funcao, usa_pandas in CARREGADORES:
+                if usa_pandas and pd is None:
+                    continue
+                medidas[nome] = medir(lambda: funcao(conn, psicologo_id, ctx), repeticoes)
+        finally:
+            conn.close()
+        escritas = {f"{sessoes} sessão(ões) gravando": medir_escritas(psicologo_id, sessoes) for sessoes in SESSOES_ESCRITA}
+        escrita.encerrar()
+        resultados[escala] = {"linhas": linhas, "carregadores": medidas, "escritas": escritas}
+    return resultados
+
+def comparar(atual, base, tolerancia=TOLERANCIA, tolerancia_min_ms=TOLERANCIA_MIN_MS, secao="carregadores"):
+    """Retorna [(escala, carregador, p95 base, p95 atual)] que pioraram além da tolerância."""
+    regressoes = []
+    for escala, dados in atual.items():
+        anteriores = base.get(escala, {}).get(secao, {})
+        for nome, medidas in dados[secao].items():
+            antes, agora = anteriores.get(nome, {}).get("p95_ms"), medidas["p95_ms"]
+            if antes is None or agora is None: # Novo, ou sem medição válida
+                continue
+            if agora > antes * (1 + tolerancia) and agora - antes > tolerancia_min_ms:
+                regressoes.append((escala, nome, antes, agora))
+    return regressoes
+
+def imprimir(resultados):
+    for escala, dados in resultados.items():
+        resumo = ", ".join(f"{quantidade} {tabela}" for tabela, quantidade in dados["linhas"].items())
+        print(f"\n== Escala {escala} ({resumo})")
+        print(f"{'carregador':40} {'p50 ms':>9} {'p95 ms':>9} {'pico KB':>10} {'retido KB':>10}")
+        for nome, medidas in dados["carregadores"].items():
+            print(f"{nome:40} {medidas['p50_ms']:9.2f} {medidas['p95_ms']:9.2f} {medidas['pico_memoria_kb']:10.1f} "
+                  f"{medidas.get('retido_kb', float('nan')):10.1f}")
+        print(f"{'escritor único':40} {'p50 ms':>9} {'p95 ms':>9} {'grav./s':>10}")
+        for nome, medidas in dados.get("escritas", {}).items():
+            print(f"{nome:40} {medidas['p50_ms']:9.2f} {medidas['p95_ms']:9.2f} {medidas['por_segundo']:10.1f}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Mede os carregadores do painel em bancos sintéticos.")
+    parser.add_argument("--escalas", nargs="+", choices=list(gerador_dados.ESCALAS), default=["pequena", "media"])
+    parser.add_argument("--diretorio", default=os.path.join(tempfile.gettempdir(), "psycontrol_bench"),
+                        help="Onde ficam os bancos gerados (reaproveitados entre execuções)")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--repeticoes", type=int, default=REPETICOES)
+    parser.add_argument("--json", help="Grava os resultados neste arquivo")
+    parser.add_argument("--comparar", help="Resultados anteriores (JSON) para detectar regressões")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA, help="Piora relativa aceita no p95")
+    args = parser.parse_args()
+
+    os.makedirs(args.diretorio, exist_ok=True)
+    if pd is None:
+        print("pandas não instalado: carregadores financeiros serão pulados.", file=sys.stderr)
+
+    resultados = executar(args.escalas, args.diretorio, args.semente, args.repeticoes)
+    imprimir(resultados)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as arquivo:
+            json.dump(resultados, arquivo, ensure_ascii=False, indent=2)
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as arquivo:
+            base = json.load(arquivo)
+        regressoes = comparar(resultados, base, args.tolerancia) + comparar(resultados, base, args.tolerancia, secao="escritas")
+        if regressoes:
+            print("\nRegressões de desempenho (p95):")
+            for escala, nome, antes, agora in regressoes:
+                print(f"    [{escala}] {nome}: {antes:.2f} ms -> {agora:.2f} ms")
+            sys.exit(1)
+        print("\nOK: nenhuma regressão de p95 além da tolerância.")
@@ -0,0 +1,129 @@
+"""Cache em memória dos carregadores de dados do painel.
+
+Cada psicólogo tem um contador de "geração" que entra na chave do cache. Toda
+escrita (cadastro, exclusão, despesa...) chama invalidar(psicologo_id), o que
+incrementa a geração: as leituras seguintes não encontram as entradas antigas
+e vão ao banco. Enquanto nada é escrito, reruns do Streamlit (digitar em um
+campo, trocar um filtro) reaproveitam os resultados sem nenhum SQL.
+
+O cache é por processo, o que basta para um servidor Streamlit. Os valores são
+compartilhados entre reruns: quem recebe um DataFrame/lista não deve alterá-lo.
+"""
+import os
+import sys
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+MAX_ITENS = int(os.environ.get("PSYCONTROL_CACHE_ITENS", "512"))
+
+
+def tamanho(valor, _vistos=None):
+    """Bytes aproximados de um valor em cache, contando o conteúdo de tuplas,
+    listas e dicionários; DataFrames/Series pelo memory_usage(deep=True)."""
+    vistos = set() if _vistos is None else _vistos
+    if id(valor) in vistos: # Objeto compartilhado: conta uma vez só
+        return 0
+    vistos.add(id(valor))
+    if hasattr(valor, "memory_usage"): # pandas, sem importar pandas aqui
+        uso = valor.memory_usage(deep=True)
+        return int(uso.sum()) if hasattr(uso, "sum") else int(uso)
+    total = sys.getsizeof(valor)
+    if isinstance(valor, dict):
+        total += sum(tamanho(chave, vistos) + tamanho(item, vistos) for chave, item in valor.items())
+    elif isinstance(valor, (list, tuple, set, frozenset)):
+        total += sum(tamanho(item, vistos) for item in valor)
+    return total
+
+
+class CacheGeracional:
+    def __init__(self, max_itens=MAX_ITENS):
+        self.max_itens = max_itens
+        self._itens = OrderedDict() # Ordem de uso: o primeiro é o menos recente
+        self._geracoes = {}
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+        self.descartes = 0
+
+    def geracao(self, psicologo_id):
+        with self._lock:
+            return self._geracoes.get(psicologo_id, 0)
+
+    def invalidar(self, psicologo_id):
+        with self._lock:
+            self._geracoes[psicologo_id] = self._geracoes.get(psicologo_id, 0) + 1
+            # As entradas antigas nunca mais seriam lidas; libera a memória já
+            obsoletas = [chave for chave in self._itens if chave[1] == psicologo_id]
+            for chave in obsoletas:
+                del self._itens[chave]
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+    def em_cache(self, func):
+        # O primeiro argumento da função decorada é sempre o psicologo_id
+        nome = f"{func.__module__}.{func.__qualname__}"
+
+        @wraps(func)
+        def carregar(psicologo_id, *args, **kwargs):
+            with self._lock:
+                geracao = self._geracoes.get(psicologo_id, 0)
+                chave = (nome, psicologo_id, geracao, args, tuple(sorted(kwargs.items())))
+                if chave in self._itens:
+                    self._itens.move_to_end(chave)
+                    self.acertos += 1
+                    return self._itens[chave]
+                self.falhas += 1
+
+            # Fora do lock: a consulta pode demorar. Exceções não são guardadas.
+            valor = func(psicologo_id, *args, **kwargs)
+
+            with self._lock:
+                # Se houve escrita durante a consulta, o resultado já nasceu velho
+                if self._geracoes.get(psicologo_id, 0) == geracao:
+                    self._itens[chave] = valor
+                    self._itens.move_to_end(chave)
+                    while len(self._itens) > self.max_itens:
+                        self._itens.popitem(last=False)
+                        self.descartes += 1
+            return valor
+
+        return carregar
+
+    def memoria(self, psicologo_id=None):
+        """{carregador: (itens, bytes aproximados)} do que está em cache agora
+        (só do psicologo_id, se informado)."""
+        with self._lock:
+            itens = [(chave, valor) for chave, valor in self._itens.items()
+                     if psicologo_id is None or chave[1] == psicologo_id]
+        # Fora do lock: os valores em cache não são alterados por ninguém
+        por_carregador = {}
+        for (nome, *_), valor in itens:
+            nome = nome.rsplit(".", 1)[-1]
+            quantidade, total = por_carregador.get(nome, (0, 0))
+            por_carregador[nome] = (quantidade + 1, total + tamanho(valor))
+        return por_carregador
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self.acertos + self.falhas
+            return {
+                "itens": len(self._itens),
+                "max_itens": self.max_itens,
+                "acertos": self.acertos,
+                "falhas": self.falhas,
+                "descartes": self.descartes,
+                "taxa_acerto": self.acertos / consultas if consultas else 0.0,
+            }
+
+
+_cache = CacheGeracional()
+
+em_cache = _cache.em_cache
+invalidar = _cache.invalidar
+geracao = _cache.geracao
+limpar = _cache.limpar
+estatisticas = _cache.estatisticas
+memoria = _cache.memoria
@@ -0,0 +1,286 @@
+"""Teste de carga da interface: reruns completos do Streamlit, sem navegador.
+
+Cada usuário simulado é um processo que abre o painel com AppTest
+(streamlit.testing), já logado como um psicólogo do banco sintético, e
+percorre um roteiro de interações: troca de seção, busca, paginação, filtros,
+formulários e exclusões. Para cada interação são medidos:
+
+    - tempo do rerun (time.perf_counter em volta do .run());
+    - instruções SQL executadas (set_trace_callback nas conexões do pool);
+    - elementos emitidos na página (folhas da árvore do AppTest).
+
+Uma interação falha se o rerun levantar exceção ou se a página mostrar um
+st.error (o painel captura as exceções e as exibe assim). As falhas não
+entram nos tempos; as mensagens são listadas depois da tabela.
+
+Um usuário por processo: os contadores de SQL não se misturam entre usuários
+e todos disputam o mesmo arquivo SQLite, como vários workers de um servidor.
+
+    python carga_interface.py --usuarios 4 --rodadas 3 --json base.json
+    python carga_interface.py --usuarios 4 --comparar base.json
+
+Os dados são alterados (sessões excluídas, despesas e pacientes criados), por
+isso o banco gerado é só deste teste: fica em --diretorio, separado do benchmark.
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import benchmark
+import database
+import gerador_dados
+
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+PAGINA_LOGIN = os.path.join(RAIZ, "Home.py")
+PAGINA_PAINEL = os.path.join(RAIZ, "pages", "painel_psicologo.py")
+
+TEMPO_LIMITE_RERUN = 60 # segundos
+
+
+# ----------------------------------------------
+# CONTAGEM DE SQL (por processo)
+# ----------------------------------------------
+
+_sql_executadas = 0
+_sql_lock = threading.Lock()
+
+def _instalar_contador(conn):
+    # Cada trigger disparado repete no trace o texto da instrução que o disparou;
+    # repetições seguidas na mesma conexão contam como uma instrução só
+    anterior = [None]
+
+    def contar(instrucao):
+        global _sql_executadas
+        if instrucao != anterior[0]:
+            with _sql_lock:
+                _sql_executadas += 1
+        anterior[0] = instrucao
+
+    conn.set_trace_callback(contar)
+
+
+# ----------------------------------------------
+# ROTEIRO DE INTERAÇÕES
+# ----------------------------------------------
+# Cada passo recebe o AppTest já renderizado e devolve o widget alterado (ou o
+# próprio AppTest); só o .run() que segue é cronometrado.
+
+def _por_rotulo(widgets, rotulo):
+    for widget in widgets:
+        if widget.label == rotulo:
+            return widget
+    raise LookupError(f"widget '{rotulo}' não encontrado")
+
+def _primeiro_botao(at, prefixo_chave):
+    for botao in at.button:
+        if (botao.key or "").startswith(prefixo_chave):
+            return botao
+    raise LookupError(f"nenhum botão com chave '{prefixo_chave}*'")
+
+def _secao(nome):
+    return lambda at, _usuario: at.radio(key="secao_ativa").set_value(nome)
+
+def _salvar_despesa(at, usuario):
+    _por_rotulo(at.text_input, "Descrição (Ex: Aluguel de Sala, Licença Software)").input(f"Despesa de carga {usuario}")
+    _por_rotulo(at.number_input, "Valor (R$)*").set_value(42.0)
+    return _por_rotulo(at.button, "💾 Salvar Despesa").click()
+
+def _cadastrar_paciente(at, usuario):
+    _por_rotulo(at.text_input, "Nome Completo*").input(f"Paciente Carga {usuario}")
+    _por_rotulo(at.text_input, "Telefone*").input("(11) 91234-5678")
+    _por_rotulo(at.text_input, "Email*").input(f"carga{usuario}@exemplo.com")
+    return _por_rotulo(at.button, "💾 Salvar Cadastro").click()
+
+ROTEIRO = [
+    ("seção Pacientes", _secao("Pacientes & Detalhes")),
+    ("buscar paciente", lambda at, _u: at.text_input(key="pacientes_busca").input("silva")),
+    ("limpar busca", lambda at, _u: at.text_input(key="pacientes_busca").input("")),
+    ("próxima página de pacientes", lambda at, _u: at.button(key="pacientes_pagina_proxima").click()),
+    ("seção Histórico de Sessões", _secao("Histórico de Sessões")),
+    ("filtrar por tipo de receita",
+     lambda at, _u: _por_rotulo(at.selectbox, "Filtrar por Tipo de Receita").set_value("Particular")),
+    ("próxima página de sessões", lambda at, _u: at.button(key="sessoes_pagina_proxima").click()),
+    ("excluir sessão", lambda at, _u: _primeiro_botao(at, "sessao_excluir_").click()),
+    ("buscar nas anotações", lambda at, _u: at.text_input(key="busca_textual").input("ansiedade sono")),
+    ("limpar busca nas anotações", lambda at, _u: at.text_input(key="busca_textual").input("")),
+    ("seção Agendamentos", _secao("Agendamentos")),
+    ("agenda: próxima semana", lambda at, _u: at.button(key="agenda_proximo").click()),
+    ("seção Gestão Financeira", _secao("Gestão Financeira")),
+    ("salvar despesa", _salvar_despesa),
+    ("seção Cadastrar Paciente", _secao("Cadastrar Paciente")),
+    ("cadastrar paciente", _cadastrar_paciente),
+]
+
+
+# ----------------------------------------------
+# EXECUÇÃO DE UM USUÁRIO (em processo próprio)
+# ----------------------------------------------
+
+def _contar_elementos(no):
+    filhos = getattr(no, "children", None)
+    if filhos is None:
+        return 1
+    return sum(_contar_elementos(filho) for filho in filhos.values())
+
+def _medir_rerun(executar, at):
+    sql_antes = _sql_executadas
+    inicio = time.perf_counter()
+    at = executar()
+    ms = (time.perf_counter() - inicio) * 1000
+    # O painel transforma exceções em st.error: contam como falha também
+    erro = "; ".join([str(e.message) for e in at.exception] + [str(e.value) for e in at.error]) or None
+    return at, {
+        "ms": ms,
+        "sql": _sql_executadas - sql_antes,
+        "elementos": _contar_elementos(at.main) + _contar_elementos(at.sidebar),
+        "erro": erro,
+    }
+
+def simular_usuario(usuario, psicologo_id, caminho_banco, rodadas):
+    """Roda o roteiro `rodadas` vezes. Retorna [(interação, medidas)]."""
+    from streamlit.testing.v1 import AppTest # Só aqui: o processo pai não precisa do Streamlit
+
+    database.registrar_gancho_conexao(_instalar_contador)
+    database.configurar(caminho_banco)
+    medidas = []
+
+    login = AppTest.from_file(PAGINA_LOGIN, default_timeout=TEMPO_LIMITE_RERUN)
+    _at, medida = _medir_rerun(login.run, login)
+    medidas.append(("tela de login (Home.py)", medida))
+
+    for _ in range(rodadas):
+        at = AppTest.from_file(PAGINA_PAINEL, default_timeout=TEMPO_LIMITE_RERUN)
+        at.session_state["logado"] = True
+        at.session_state["psicologo_id"] = psicologo_id
+        at.session_state["nome_psicologo"] = f"Usuário de carga {usuario}"
+        at, medida = _medir_rerun(at.run, at)
+        medidas.append(("abrir painel", medida))
+
+        for nome, passo in ROTEIRO:
+            try:
+                alvo = passo(at, usuario)
+            except LookupError as e: # Ex.: sem próxima página nesse psicólogo
+                medidas.append((nome, {"ms": None, "sql": None, "elementos": None, "erro": str(e)}))
+                continue
+            at, medida = _medir_rerun(alvo.run, at)
+            medidas.append((nome, medida))
+    return medidas
+
+
+# ----------------------------------------------
+# AGREGAÇÃO E LINHA DE COMANDO
+# ----------------------------------------------
+
+def agregar(medidas_por_usuario):
+    """{interação: {n, p50_ms, p95_ms, sql_medio, elementos_medio, erros}} na ordem do roteiro."""
+    por_interacao = {}
+    for medidas in medidas_por_usuario:
+        for nome, medida in medidas:
+            por_interacao.setdefault(nome, []).append(medida)
+
+    resultado = {}
+    for nome, lista in por_interacao.items():
+        mensagens = sorted({m["erro"] for m in lista if m["erro"]})
+        validas = [m for m in lista if m["ms"] is not None and not m["erro"]]
+        tempos = sorted(m["ms"] for m in validas)
+        resultado[nome] = {
+            "n": len(validas),
+            "erros": len(lista) - len(validas),
+            "p50_ms": round(benchmark.percentil(tempos, 50), 2) if tempos else None,
+            "p95_ms": round(benchmark.percentil(tempos, 95), 2) if tempos else None,
+            "sql_medio": round(sum(m["sql"] for m in validas) / len(validas), 1) if validas else None,
+            "elementos_medio": round(sum(m["elementos"] for m in validas) / len(validas), 1) if validas else None,
+            "mensagens_erro": mensagens,
+        }
+    return resultado
+
+def comparar_sql(atual, base):
+    """[(interação, sql base, sql atual)] em que o número médio de instruções subiu."""
+    piores = []
+    for nome, medidas in atual.items():
+        anterior = base.get(nome, {}).get("sql_medio")
+        if anterior is not None and medidas["sql_medio"] is not None and medidas["sql_medio"] > anterior:
+            piores.append((nome, anterior, medidas["sql_medio"]))
+    return piores
+
+def imprimir(interacoes):
+    print(f"{'interação':36} {'n':>4} {'p50 ms':>9} {'p95 ms':>9} {'SQL':>7} {'elem.':>7} {'erros':>6}")
+    for nome, m in interacoes.items():
+        def fmt(valor, casas):
+            return f"{valor:.{casas}f}" if valor is not None else "-"
+        print(f"{nome:36} {m['n']:4d} {fmt(m['p50_ms'], 1):>9} {fmt(m['p95_ms'], 1):>9} "
+              f"{fmt(m['sql_medio'], 1):>7} {fmt(m['elementos_medio'], 0):>7} {m['erros']:6d}")
+    falhas = [(nome, mensagem) for nome, m in interacoes.items() for mensagem in m.get("mensagens_erro", [])]
+    if falhas:
+        print("\nFalhas:")
+        for nome, mensagem in falhas:
+            print(f"    {nome}: {mensagem}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Mede reruns do painel com usuários simultâneos (AppTest).")
+    parser.add_argument("--usuarios", type=int, default=4, help="Usuários simultâneos (um processo cada)")
+    parser.add_argument("--rodadas", type=int, default=3, help="Vezes que cada usuário percorre o roteiro")
+    parser.add_argument("--escala", choices=list(gerador_dados.ESCALAS), default="media")
+    parser.add_argument("--diretorio", default=os.path.join(tempfile.gettempdir(), "psycontrol_carga"),
+                        help="Onde fica o banco gerado para o teste")
+    parser.add_argument("--novo-banco", action="store_true", help="Descarta o banco alterado por execuções anteriores")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--json", help="Grava os resultados neste arquivo")
+    parser.add_argument("--comparar", help="Resultados anteriores (JSON) para detectar regressões")
+    parser.add_argument("--tolerancia", type=float, default=benchmark.TOLERANCIA, help="Piora relativa aceita no p95")
+    args = parser.parse_args()
+
+    os.makedirs(args.diretorio, exist_ok=True)
+    caminho = benchmark.caminho_banco(args.diretorio, args.escala, args.semente)
+    if args.novo_banco:
+        for sufixo in ("", "-wal", "-shm"):
+            if os.path.exists(caminho + sufixo):
+                os.remove(caminho + sufixo)
+    benchmark.preparar_banco(args.diretorio, args.escala, args.semente)
+    database.configurar(caminho) # Fecha as conexões do processo pai antes de criar os filhos
+    psicologos = gerador_dados.ESCALAS[args.escala]["psicologos"]
+
+    inicio = time.perf_counter()
+    # spawn: cada usuário começa com módulos (cache, pool) limpos, como um worker novo
+    with ProcessPoolExecutor(max_workers=args.usuarios, mp_context=get_context("spawn")) as executor:
+        futuros = [
+            executor.submit(simular_usuario, usuario, usuario % psicologos + 1, caminho, args.rodadas)
+            for usuario in range(args.usuarios)
+        ]
+        medidas = [futuro.result() for futuro in futuros]
+    duracao = time.perf_counter() - inicio
+
+    interacoes = agregar(medidas)
+    print(f"{args.usuarios} usuário(s) x {args.rodadas} rodada(s), escala {args.escala}, em {duracao:.1f}s\n")
+    imprimir(interacoes)
+
+    resultados = {
+        args.escala: {
+            "config": {"usuarios": args.usuarios, "rodadas": args.rodadas, "semente": args.semente},
+            "interacoes": interacoes,
+        }
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as arquivo:
+            json.dump(resultados, arquivo, ensure_ascii=False, indent=2)
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as arquivo:
+            base = json.load(arquivo)
+        regressoes = benchmark.comparar(resultados, base, args.tolerancia, secao="interacoes")
+        mais_sql = comparar_sql(interacoes, base.get(args.escala, {}).get("interacoes", {}))
+        for escala, nome, antes, agora in regressoes:
+            print(f"    [{escala}] {nome}: p95 {antes:.1f} ms -> {agora:.1f} ms")
+        for nome, antes, agora in mais_sql:
+            print(f"    [{args.escala}] {nome}: {antes:.1f} -> {agora:.1f} instruções SQL")
+        if regressoes or mais_sql:
+            sys.exit(1)
+        print("\nOK: nenhuma regressão em relação à base.")
@@ -0,0 +1,437 @@
+"""Consultas SQL usadas pelo painel do psicólogo.
+
+Ficam aqui (e não espalhadas na página) para que a mesma instrução possa ser
+conferida com EXPLAIN QUERY PLAN fora do Streamlit:
+
+    python consultas.py        # falha (código 1) se alguma consulta fizer SCAN completo
+"""
+import re
+import sys
+from datetime import date
+
+import agenda
+from validacao import apenas_digitos, normalizar_nome
+
+SQL_PACIENTES_NOMES = "SELECT id, nome FROM pacientes WHERE psicologo_id = ?"
+
+# Diretório de pacientes: uma página por vez, com busca e ordenação no banco.
+# Os totalizadores de cada paciente vêm na MESMA consulta (subconsultas
+# correlacionadas resolvidas pelos índices de sessoes/agendamentos), só para
+# as linhas da página -- nada de uma consulta extra por paciente.
+TAMANHO_PAGINA_PACIENTES = 25
+
+ORDENACOES_PACIENTES = {
+    "Nome (A-Z)": "p.nome COLLATE NOCASE ASC, p.id ASC",
+    "Nome (Z-A)": "p.nome COLLATE NOCASE DESC, p.id DESC",
+    "Cadastro mais recente": "p.id DESC",
+    "Última sessão": "(SELECT MAX(s.data) FROM sessoes s WHERE s.paciente_id = p.id) DESC, p.id DESC",
+}
+
+def _filtro_pacientes(busca):
+    filtros = ["p.psicologo_id = ?"]
+    if busca:
+        filtros.append("(p.nome LIKE ? OR p.telefone LIKE ? OR p.email LIKE ? OR p.carteirinha LIKE ?)")
+    return " AND ".join(filtros)
+
+def _parametros_busca(busca):
+    if not busca:
+        return []
+    termo = f"%{busca}%"
+    return [termo, termo, termo, termo]
+
+def sql_pagina_pacientes(ordenacao="Nome (A-Z)", busca=False):
+    ordem = ORDENACOES_PACIENTES[ordenacao] # Só valores da lista: nunca texto do usuário
+    return f"""
+    WITH pagina AS (
+        SELECT p.id
+        FROM pacientes p
+        WHERE {_filtro_pacientes(busca)}
+        ORDER BY {ordem}
+        LIMIT ? OFFSET ?
+    )
+    SELECT
+        p.id, p.nome, p.telefone, p.email, p.carteirinha,
+        (SELECT COUNT(*) FROM sessoes s WHERE s.paciente_id = p.id) as total_sessoes,
+        (SELECT COALESCE(SUM(s.valor_centavos), 0) FROM sessoes s WHERE s.paciente_id = p.id) as total_pago_centavos,
+        (SELECT MAX(s.data) FROM sessoes s WHERE s.paciente_id = p.id) as ultima_sessao,
+        -- Só avulsos; as séries entram em buscar_pagina_pacientes
+        (SELECT a.data || ' ' || a.hora FROM agendamentos a
+            WHERE a.paciente_id = p.id AND a.data >= date('now', 'localtime')
+            ORDER BY a.data, a.hora LIMIT 1) as proximo_agendamento
+    FROM pacientes p
+    JOIN pagina ON pagina.id = p.id
+    ORDER BY {ordem}
+    """
+
+def buscar_pagina_pacientes(conn, psicologo_id, busca="", ordenacao="Nome (A-Z)",
+                            pagina=0, limite=TAMANHO_PAGINA_PACIENTES):
+    params = [psicologo_id] + _parametros_busca(busca) + [limite, pagina * limite]
+    linhas = conn.execute(sql_pagina_pacientes(ordenacao, bool(busca)), params).fetchall()
+    # Próximo agendamento: o mais cedo entre o avulso (SQL) e as séries do paciente
+    series = agenda.proximas_por_paciente(conn, psicologo_id, [linha[0] for linha in linhas], date.today())
+    return [
+        linha[:-1] + (min(filter(None, (linha[-1], series.get(linha[0])))),)
+        if linha[0] in series else linha
+        for linha in linhas
+    ]
+
+def contar_pacientes(conn, psicologo_id, busca=""):
+    sql = f"SELECT COUNT(*) FROM pacientes p WHERE {_filtro_pacientes(bool(busca))}"
+    return conn.execute(sql, [psicologo_id] + _parametros_busca(busca)).fetchone()[0]
+
+# Seletor de pacientes dos formulários: só as primeiras correspondências, por
+# faixa de prefixo nos índices (psicologo_id, nome_busca / telefone_digitos /
+# carteirinha). Nada de mandar a lista inteira de pacientes para o navegador.
+LIMITE_SELETOR_PACIENTES = 20
+
+_COLUNAS_SELETOR = "SELECT id, nome, telefone, carteirinha FROM pacientes"
+
+def _sql_prefixo(coluna):
+    return f"""
+    {_COLUNAS_SELETOR}
+    WHERE psicologo_id = ? AND {coluna} >= ? AND {coluna} < ?
+    ORDER BY {coluna}
+    LIMIT ?
+    """
+
+SQL_SELETOR_NOME = _sql_prefixo("nome_busca")
+SQL_SELETOR_TELEFONE = _sql_prefixo("telefone_digitos")
+SQL_SELETOR_CARTEIRINHA = _sql_prefixo("carteirinha")
+
+# Complemento quando o prefixo do nome não enche a lista: termo no início de
+# outra palavra ("silva" em "ana silva"). Percorre só o índice do psicólogo.
+SQL_SELETOR_SOBRENOME = f"""
+    {_COLUNAS_SELETOR}
+    WHERE psicologo_id = ? AND nome_busca LIKE ? ESCAPE '\\'
+    ORDER BY nome_busca
+    LIMIT ?
+"""
+
+def _faixa_prefixo(prefixo):
+    # [prefixo, próximo prefixo): "ana" -> ("ana", "anb")
+    return prefixo, prefixo[:-1] + chr(ord(prefixo[-1]) + 1)
+
+def buscar_pacientes_seletor(conn, psicologo_id, termo="", limite=LIMITE_SELETOR_PACIENTES):
+    """Retorna até `limite` pacientes (id, nome, telefone, carteirinha) que
+    correspondem ao termo: prefixo do nome (sem acentos) ou de um sobrenome, ou,
+    se o termo for numérico, prefixo do telefone ou da carteirinha. Sem termo,
+    os primeiros em ordem alfabética."""
+    digitos = apenas_digitos(termo)
+    if digitos and not re.search(r"[^\d\s()+.-]", termo):
+        etapas = [(SQL_SELETOR_TELEFONE, _faixa_prefixo(digitos)), (SQL_SELETOR_CARTEIRINHA, _faixa_prefixo(digitos))]
+    else:
+        nome = normalizar_nome(termo)
+        if not nome:
+            return conn.execute(SQL_SELETOR_NOME, (psicologo_id, "", "\uffff", limite)).fetchall()
+        sobrenome = "% " + nome.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        etapas = [(SQL_SELETOR_NOME, _faixa_prefixo(nome)), (SQL_SELETOR_SOBRENOME, (sobrenome,))]
+
+    encontrados = {}
+    for sql, faixa in etapas:
+        for linha in conn.execute(sql, (psicologo_id, *faixa, limite)):
+            encontrados.setdefault(linha[0], linha)
+        if len(encontrados) >= limite:
+            break
+    return list(encontrados.values())[:limite]
+
+SQL_OBSERVACOES_PACIENTE = "SELECT observacoes FROM pacientes WHERE id = ? AND psicologo_id = ?"
+
+# Histórico paginado por keyset em (data, id): a página desce o índice
+# idx_sessoes_psicologo_data (psicologo_id, data; o id é o rowid no fim da
+# chave) a partir do cursor e para no LIMIT, lendo as colunas da sessão e o nome
+# do paciente só dessas linhas; nada é ordenado (CONSULTAS_SEM_ORDENACAO). A
+# descrição (texto longo) fica de fora e é carregada sob demanda com
+# SQL_DESCRICAO_SESSAO.
+TAMANHO_PAGINA_SESSOES = 20
+
+def sql_pagina_sessoes(por_paciente=False, por_tipo=False, com_cursor=False):
+    # Com cursor, o (data, id) dele é o limite superior (já está dentro do período)
+    filtros = ["s.psicologo_id = ?", "s.data >= ?", "(s.data, s.id) < (?, ?)" if com_cursor else "s.data <= ?"]
+    if por_paciente:
+        filtros.append("s.paciente_id = ?")
+    if por_tipo:
+        filtros.append("s.tipo_receita = ?")
+    return f"""
+    SELECT
+        s.id, s.data, s.valor_centavos, s.tipo_receita, s.qtd_sessoes,
+        p.nome as paciente_nome, s.paciente_id
+    FROM sessoes s
+    JOIN pacientes p ON s.paciente_id = p.id
+    WHERE {" AND ".join(filtros)}
+    ORDER BY s.data DESC, s.id DESC
+    LIMIT ?
+    """
+
+def sql_contar_sessoes(por_paciente=False, por_tipo=False):
+    filtros = ["s.psicologo_id = ?", "s.data BETWEEN ? AND ?"]
+    if por_paciente:
+        filtros.append("s.paciente_id = ?")
+    if por_tipo:
+        filtros.append("s.tipo_receita = ?")
+    return f"""
+    SELECT COUNT(*)
+    FROM sessoes s
+    WHERE {" AND ".join(filtros)}
+    """
+
+def _parametros_filtro_sessoes(psicologo_id, data_inicio, data_fim, paciente_id, tipo_receita):
+    params = [psicologo_id, data_inicio, data_fim]
+    if paciente_id is not None:
+        params.append(paciente_id)
+    if tipo_receita is not None:
+        params.append(tipo_receita)
+    return params
+
+def buscar_pagina_sessoes(conn, psicologo_id, data_inicio, data_fim, paciente_id=None,
+                          tipo_receita=None, cursor=None, limite=TAMANHO_PAGINA_SESSOES):
+    """Retorna (linhas, próximo cursor). O cursor é o (data, id) da última linha
+    da página anterior; None quando não há mais páginas."""
+    params = [psicologo_id, data_inicio, *(cursor if cursor is not None else (data_fim,))]
+    if paciente_id is not None:
+        params.append(paciente_id)
+    if tipo_receita is not None:
+        params.append(tipo_receita)
+    # Busca uma linha a mais só para saber se existe próxima página
+    params.append(limite + 1)
+    sql = sql_pagina_sessoes(paciente_id is not None, tipo_receita is not None, cursor is not None)
+    linhas = conn.execute(sql, params).fetchall()
+
+    proximo = None
+    if len(linhas) > limite:
+        linhas = linhas[:limite]
+        proximo = (linhas[-1][1], linhas[-1][0])
+    return linhas, proximo
+
+def contar_sessoes(conn, psicologo_id, data_inicio, data_fim, paciente_id=None, tipo_receita=None):
+    params = _parametros_filtro_sessoes(psicologo_id, data_inicio, data_fim, paciente_id, tipo_receita)
+    sql = sql_contar_sessoes(paciente_id is not None, tipo_receita is not None)
+    return conn.execute(sql, params).fetchone()[0]
+
+SQL_PRIMEIRA_DATA_SESSAO = """
+    SELECT MIN(s.data)
+    FROM sessoes s
+    JOIN pacientes p ON s.paciente_id = p.id
+    WHERE p.psicologo_id = ?
+"""
+
+# Filtra também pelo psicólogo: o id vem da interface e não deve expor notas de outro
+SQL_DESCRICAO_SESSAO = """
+    SELECT s.descricao
+    FROM sessoes s
+    JOIN pacientes p ON s.paciente_id = p.id
+    WHERE s.id = ? AND p.psicologo_id = ?
+"""
+
+# Resumos mensais mantidos por trigger (migrações 5 e 12, em centavos): os KPIs
+# e os gráficos financeiros somam só estas linhas, no SQLite e em inteiros,
+# qualquer que seja o tamanho do histórico
+SQL_TOTAIS_FINANCEIROS = """
+    SELECT receita, custos, receita - custos AS lucro
+    FROM (
+        SELECT
+            (SELECT COALESCE(SUM(total_centavos), 0) FROM receita_mensal WHERE psicologo_id = ?) AS receita,
+            (SELECT COALESCE(SUM(total_centavos), 0) FROM custo_mensal WHERE psicologo_id = ?) AS custos
+    )
+"""
+
+SQL_FINANCEIRO_MENSAL = """
+    SELECT ano_mes, SUM(receita) AS receita_centavos, SUM(custos) AS custos_centavos
+    FROM (
+        SELECT ano_mes, total_centavos AS receita, 0 AS custos
+        FROM receita_mensal WHERE psicologo_id = ? AND qtd > 0
+        UNION ALL
+        SELECT ano_mes, 0, total_centavos
+        FROM custo_mensal WHERE psicologo_id = ? AND qtd > 0
+    )
+    GROUP BY ano_mes
+    ORDER BY ano_mes
+"""
+
+SQL_CUSTOS_POR_CATEGORIA = """
+    SELECT categoria, SUM(total_centavos) AS total_centavos
+    FROM custo_mensal
+    WHERE psicologo_id = ? AND qtd > 0
+    GROUP BY categoria
+    ORDER BY total_centavos DESC
+"""
+
+# Tabelas de "Histórico de Transações": só os lançamentos mais recentes, e só
+# as colunas que a tabela mostra (tipos compactos em quadros.py)
+LIMITE_TRANSACOES = 200
+
+SQL_CUSTOS = """
+    SELECT data, descricao, categoria, valor_centavos
+    FROM custos
+    WHERE psicologo_id = ?
+    ORDER BY data DESC, id DESC
+    LIMIT ?
+"""
+
+SQL_RECEITA = """
+    SELECT s.data, s.valor_centavos, p.nome as paciente_nome
+    FROM sessoes s
+    JOIN pacientes p ON s.paciente_id = p.id
+    WHERE s.psicologo_id = ? AND s.valor_centavos IS NOT NULL
+    ORDER BY s.data DESC, s.id DESC
+    LIMIT ?
+"""
+
+# Busca textual nas notas das sessões e nas observações dos pacientes (índices
+# FTS5 da migração 8). Ordenada por relevância (bm25); a página usa OFFSET,
+# já que a ordem por rank não tem chave estável para um keyset.
+TAMANHO_PAGINA_BUSCA = 20
+
+# Marcadores de destaque para st.markdown e tamanho do trecho (em termos)
+_DESTAQUE = ("**", "**", " … ", 24)
+
+SQL_BUSCA_SESSOES = f"""
+    SELECT s.id, s.data, p.nome as paciente_nome,
+           snippet(sessoes_busca, 0, '{_DESTAQUE[0]}', '{_DESTAQUE[1]}', '{_DESTAQUE[2]}', {_DESTAQUE[3]}) as trecho
+    FROM sessoes_busca
+    JOIN sessoes s ON s.id = sessoes_busca.rowid
+    JOIN pacientes p ON s.paciente_id = p.id
+    WHERE sessoes_busca MATCH ? AND p.psicologo_id = ?
+    ORDER BY sessoes_busca.rank
+    LIMIT ? OFFSET ?
+"""
+
+SQL_BUSCA_PACIENTES = f"""
+    SELECT p.id, NULL as data, p.nome as paciente_nome,
+           snippet(pacientes_busca, 0, '{_DESTAQUE[0]}', '{_DESTAQUE[1]}', '{_DESTAQUE[2]}', {_DESTAQUE[3]}) as trecho
+    FROM pacientes_busca
+    JOIN pacientes p ON p.id = pacientes_busca.rowid
+    WHERE pacientes_busca MATCH ? AND p.psicologo_id = ?
+    ORDER BY pacientes_busca.rank
+    LIMIT ? OFFSET ?
+"""
+
+ORIGENS_BUSCA = {
+    "Notas das sessões": SQL_BUSCA_SESSOES,
+    "Observações dos pacientes": SQL_BUSCA_PACIENTES,
+}
+
+def consulta_fts(texto, psicologo_id):
+    """Converte o texto digitado em uma consulta FTS5 restrita ao psicólogo.
+
+    Cada palavra vira um termo entre aspas (a sintaxe do FTS5 nunca chega crua
+    do usuário); todas precisam aparecer. Um '*' no fim da palavra busca por
+    prefixo ("ansi*"). Retorna None se não sobrar nenhuma palavra."""
+    termos = []
+    for palavra in texto.split():
+        prefixo = palavra.endswith("*")
+        palavra = palavra.rstrip("*").replace('"', "")
+        if palavra:
+            termos.append(f'"{palavra}"' + ("*" if prefixo else ""))
+    if not termos:
+        return None
+    return f"dono : p{int(psicologo_id)} AND texto : ({' AND '.join(termos)})"
+
+def buscar_textos(conn, psicologo_id, texto, origem="Notas das sessões", pagina=0, limite=TAMANHO_PAGINA_BUSCA):
+    """Retorna (linhas, há próxima página). Cada linha: (id, data, paciente, trecho)."""
+    consulta = consulta_fts(texto, psicologo_id)
+    if consulta is None:
+        return [], False
+    linhas = conn.execute(ORIGENS_BUSCA[origem], (consulta, psicologo_id, limite + 1, pagina * limite)).fetchall()
+    return linhas[:limite], len(linhas) > limite
+
+# Consultas conferidas pelo verificador de planos (nome, sql, parâmetros de exemplo)
+CONSULTAS_DO_PAINEL = [
+    ("get_pacientes", SQL_PACIENTES_NOMES, (1,)),
+    ("listar_pacientes (página)", sql_pagina_pacientes("Última sessão", busca=True),
+     (1, "%a%", "%a%", "%a%", "%a%", 25, 0)),
+    ("listar_pacientes (contagem)", "SELECT COUNT(*) FROM pacientes p WHERE " + _filtro_pacientes(False), (1,)),
+    ("listar_pacientes (observações)", SQL_OBSERVACOES_PACIENTE, (1, 1)),
+    ("seletor de pacientes (nome)", SQL_SELETOR_NOME, (1, "ana", "anb", 20)),
+    ("seletor de pacientes (sobrenome)", SQL_SELETOR_SOBRENOME, (1, "% silva%", 20)),
+    ("seletor de pacientes (telefone)", SQL_SELETOR_TELEFONE, (1, "119", "11:", 20)),
+    ("seletor de pacientes (carteirinha)", SQL_SELETOR_CARTEIRINHA, (1, "123", "124", 20)),
+    ("listar_sessoes (1ª página)", sql_pagina_sessoes(), (1, "2000-01-01", "2100-01-01", 21)),
+    ("listar_sessoes (cursor)", sql_pagina_sessoes(com_cursor=True), (1, "2000-01-01", "2024-01-01", 1, 21)),
+    ("listar_sessoes (paciente, tipo, cursor)", sql_pagina_sessoes(True, True, True),
+     (1, "2000-01-01", "2024-01-01", 1, 1, "Particular", 21)),
+    ("listar_sessoes (contagem)", sql_contar_sessoes(True, True), (1, "2000-01-01", "2100-01-01", 1, "Particular")),
+    ("listar_sessoes (primeira data)", SQL_PRIMEIRA_DATA_SESSAO, (1,)),
+    ("listar_sessoes (descrição)", SQL_DESCRICAO_SESSAO, (1, 1)),
+    ("get_resumo_financeiro (totais)", SQL_TOTAIS_FINANCEIROS, (1, 1)),
+    ("get_resumo_financeiro (por mês)", SQL_FINANCEIRO_MENSAL, (1, 1)),
+    ("get_resumo_financeiro (por categoria)", SQL_CUSTOS_POR_CATEGORIA, (1,)),
+    ("get_dados_financeiros (custos)", SQL_CUSTOS, (1, LIMITE_TRANSACOES)),
+    ("get_dados_financeiros (receita)", SQL_RECEITA, (1, LIMITE_TRANSACOES)),
+    ("busca textual (sessões)", SQL_BUSCA_SESSOES, (consulta_fts("ansiedade", 1), 1, 21, 0)),
+    ("busca textual (pacientes)", SQL_BUSCA_PACIENTES, (consulta_fts("ansiedade", 1), 1, 21, 0)),
+]
+
+def _consultas_de_outros_modulos():
+    from agenda import (SQL_AGENDAMENTOS_PERIODO, SQL_EXCECOES_DAS_SERIES, SQL_EXCECOES_PERIODO, SQL_SERIES_ATIVAS,
+                        SQL_SERIES_DOS_PACIENTES, SQL_SERIES_PERIODO)
+    from alteracoes import SQL_ALTERACOES
+    from exportacao import EXPORTACOES
+    return [(f"exportação ({tipo})", sql, (1, "2000-01-01", "2100-01-01"))
+            for tipo, (_colunas, sql) in EXPORTACOES.items()] + [
+        ("alterações desde o cursor", SQL_ALTERACOES, (1, 0, 1000)),
+        ("agenda (semana/mês)", SQL_AGENDAMENTOS_PERIODO, (1, "2024-01-01", "2024-02-01")),
+        ("agenda (séries no período)", SQL_SERIES_PERIODO, (1, "2024-03-01", "2023-12-01")),
+        ("agenda (exceções das séries)", SQL_EXCECOES_PERIODO, (1, "2024-03-01", "2023-12-01", "2023-12-01", "2024-03-01")),
+        ("agenda (séries ativas)", SQL_SERIES_ATIVAS, (1, "2024-01-01")),
+        ("listar_agendamentos", SQL_AGENDAMENTOS_PERIODO, (1, "2024-01-01", "9999-12-31")),
+        ("listar_pacientes (séries)", SQL_SERIES_DOS_PACIENTES.format(marcadores="?, ?"), (1, 2, 1, "2024-01-01")),
+        ("listar_pacientes (exceções)", SQL_EXCECOES_DAS_SERIES.format(marcadores="?, ?"), (1, 2, "2024-01-01")),
+    ]
+
+CONSULTAS_DO_PAINEL += _consultas_de_outros_modulos()
+
+# "SCAN tabela" = leitura completa da tabela (ou de um índice inteiro).
+# Percorrer uma CTE já materializada (ex.: a página de pacientes) não conta, nem
+# uma tabela virtual (o FTS5 resolve o MATCH no próprio índice), nem a linha
+# única de um SELECT sem FROM ("SCAN CONSTANT ROW", ex.: os totais financeiros).
+_RE_SCAN = re.compile(r"^SCAN (?!CONSTANT ROW)(\w+)\b(?! VIRTUAL TABLE)")
+_RE_CTE = re.compile(r"(?:WITH|,)\s*(\w+)\s+AS\s*\(", re.IGNORECASE)
+
+# Páginas que devem sair na ordem do índice: um "USE TEMP B-TREE FOR ORDER BY"
+# nelas significa ordenar todas as linhas do período a cada página.
+CONSULTAS_SEM_ORDENACAO = {
+    "listar_sessoes (1ª página)",
+    "listar_sessoes (cursor)",
+    "listar_sessoes (paciente, tipo, cursor)",
+    "get_dados_financeiros (receita)",
+}
+
+
+def plano_de_consulta(conn, sql, params=()):
+    return [linha[3] for linha in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+def verificar_planos(conn, consultas=CONSULTAS_DO_PAINEL):
+    """Retorna [(nome, detalhe do plano)] para cada consulta que faz SCAN completo
+    (ou, nas CONSULTAS_SEM_ORDENACAO, que ordena em uma B-tree temporária)."""
+    problemas = []
+    for nome, sql, params in consultas:
+        ctes = set(_RE_CTE.findall(sql))
+        for detalhe in plano_de_consulta(conn, sql, params):
+            scan = _RE_SCAN.match(detalhe)
+            if scan and scan.group(1) not in ctes:
+                problemas.append((nome, detalhe))
+            elif nome in CONSULTAS_SEM_ORDENACAO and detalhe.startswith("USE TEMP B-TREE"):
+                problemas.append((nome, detalhe))
+    return problemas
+
+
+if __name__ == "__main__":
+    from database import criar_conexao, inicializar_banco
+
+    inicializar_banco()
+    conn = criar_conexao()
+    try:
+        for nome, sql, params in CONSULTAS_DO_PAINEL:
+            print(f"{nome}:")
+            for detalhe in plano_de_consulta(conn, sql, params):
+                print(f"    {detalhe}")
+        problemas = verificar_planos(conn)
+    finally:
+        conn.close()
+
+    if problemas:
+        print("\nRegressão de plano (SCAN completo ou ordenação temporária):")
+        for nome, detalhe in problemas:
+            print(f"    {nome}: {detalhe}")
+        sys.exit(1)
+    print("\nOK: nenhuma consulta faz SCAN completo.")
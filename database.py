@@ -1,96 +1,486 @@
+import logging
+import os
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 
-def criar_conexao():
-    # Permite acesso de threads diferentes, essencial para o Streamlit
-    return sqlite3.connect("psycontrol.db", check_same_thread=False)
+# Caminho do banco: pode ser sobrescrito pela variável de ambiente PSYCONTROL_DB.
+# Por padrão fica ao lado deste arquivo (e não relativo ao diretório de execução).
+DB_PATH = os.environ.get(
+    "PSYCONTROL_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "psycontrol.db"),
+)
 
-def inicializar_banco():
-    conn = criar_conexao()
-    cursor = conn.cursor()
-
-    # 1. Tabela Psicologos (Sem alteração)
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS psicologos (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        nome TEXT NOT NULL,
-        usuario TEXT UNIQUE NOT NULL,
-        senha TEXT NOT NULL
-    );
-    """)
-
-    # 2. Tabela Pacientes (Inclui a coluna carteirinha)
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS pacientes (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        psicologo_id INTEGER NOT NULL,
-        nome TEXT NOT NULL,
-        telefone TEXT,
-        email TEXT,
-        observacoes TEXT,
-        foto_path TEXT,
-        carteirinha TEXT,
-        FOREIGN KEY (psicologo_id) REFERENCES psicologos(id)
-    );
-    """)
-
-    # 3. Tabela Sessoes (ATUALIZADA: Adicionado a coluna 'valor' REAL)
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS sessoes (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        paciente_id INTEGER NOT NULL,
-        data TEXT NOT NULL,
-        descricao TEXT NOT NULL,
-        valor REAL,
-        tipo_receita TEXT, -- NOVA COLUNA
-        qtd_sessoes INTEGER, -- NOVA COLUNA
-        FOREIGN KEY (paciente_id) REFERENCES pacientes(id) ON DELETE CASCADE
-    );
-    """)
-    
-    # *** ATENÇÃO: MIGRAÇÃO DE COLUNAS EXISTENTES ***
-    # Se você já usou o app, estas linhas SÃO NECESSÁRIAS para adicionar as novas colunas
+# Quantas conexões ociosas o pool mantém abertas
+TAMANHO_POOL = int(os.environ.get("PSYCONTROL_POOL", "8"))
+
+# Modo fragmentado (opcional): com PSYCONTROL_SHARDS apontando para um diretório,
+# cada psicólogo tem o próprio arquivo (psicologo_<id>.db) e o DB_PATH vira o
+# banco central, só com psicólogos e tokens de sessão. Ver fragmentacao.py.
+SHARDS_DIR = os.environ.get("PSYCONTROL_SHARDS") or None
+# Cada fragmento tem um pool pequeno; os menos usados são fechados além deste número
+TAMANHO_POOL_SHARD = int(os.environ.get("PSYCONTROL_POOL_SHARD", "2"))
+MAX_SHARDS_ABERTOS = int(os.environ.get("PSYCONTROL_SHARDS_ABERTOS", "64"))
+
+# PRAGMAs aplicados UMA vez, quando a conexão é aberta (e não a cada uso)
+PRAGMAS_CONEXAO = (
+    "PRAGMA journal_mode = WAL",       # Leitores não bloqueiam o escritor
+    "PRAGMA synchronous = NORMAL",     # Seguro com WAL e bem mais barato que FULL
+    "PRAGMA cache_size = -20000",      # ~20 MB de cache de páginas por conexão
+    "PRAGMA mmap_size = 268435456",    # 256 MB de leitura via mmap
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",      # Espera o lock em vez de falhar com "database is locked"
+    "PRAGMA foreign_keys = ON",
+)
+
+# Funções chamadas com cada conexão nova do pool (ver registrar_gancho_conexao)
+_ganchos_conexao = []
+
+# Rastreio de SQL (desligado por padrão). Ligado, cada instrução registra texto,
+# duração e linhas; desligado, as conexões são as normais, sem nenhum invólucro.
+RASTREIO_ATIVO = os.environ.get("PSYCONTROL_RASTREIO") == "1"
+# Instruções a partir desta duração vão para o log de lentas (se houver arquivo)
+LIMITE_LENTA_MS = float(os.environ.get("PSYCONTROL_LENTA_MS", "100"))
+ARQUIVO_LOG_LENTAS = os.environ.get("PSYCONTROL_LOG_LENTAS")
+# Cada coleta guarda no máximo isto de instruções (as demais só entram nos totais)
+MAX_REGISTROS_COLETA = 1000
+
+
+# ----------------------------------------------
+# RASTREIO DE SQL
+# ----------------------------------------------
+
+class RegistroSql:
+    __slots__ = ("sql", "ms", "linhas")
+
+    def __init__(self, sql):
+        self.sql = " ".join(sql.split())
+        self.ms = 0.0
+        self.linhas = 0
+
+
+class ColetaSql:
+    # Tudo o que foi executado na thread entre iniciar_coleta() e encerrar_coleta()
+    # (no Streamlit: um rerun do script)
+    def __init__(self):
+        self.registros = []
+        self.instrucoes = 0
+        self.ms_total = 0.0
+        self.conexoes_emprestadas = 0
+        self.conexoes_abertas = 0
+
+    def adicionar(self, registro):
+        self.instrucoes += 1
+        if len(self.registros) < MAX_REGISTROS_COLETA:
+            self.registros.append(registro)
+
+    def mais_lentas(self, quantidade=10):
+        return sorted(self.registros, key=lambda registro: registro.ms, reverse=True)[:quantidade]
+
+
+_local = threading.local()
+_log_lentas = None
+
+def iniciar_coleta():
+    """Começa a coletar o SQL desta thread. Retorna a coleta, ou None com o rastreio desligado."""
+    if not RASTREIO_ATIVO:
+        return None
+    _local.coleta = ColetaSql()
+    return _local.coleta
+
+def coleta_atual():
+    return getattr(_local, "coleta", None)
+
+def encerrar_coleta():
+    coleta = coleta_atual()
+    _local.coleta = None
+    return coleta
+
+def _logger_lentas():
+    global _log_lentas
+    if _log_lentas is None:
+        _log_lentas = logging.getLogger("psycontrol.sql_lento")
+        _log_lentas.propagate = False
+        _log_lentas.setLevel(logging.WARNING)
+        manipulador = logging.FileHandler(ARQUIVO_LOG_LENTAS, encoding="utf-8")
+        manipulador.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        _log_lentas.addHandler(manipulador)
+    return _log_lentas
+
+def _finalizar_registro(registro):
+    # Chamado quando a instrução termina: linhas lidas (ou afetadas) já contadas
+    coleta = coleta_atual()
+    if coleta is not None:
+        coleta.ms_total += registro.ms
+    if ARQUIVO_LOG_LENTAS and registro.ms >= LIMITE_LENTA_MS:
+        _logger_lentas().warning("%.1f ms | %d linhas | %s", registro.ms, registro.linhas, registro.sql)
+
+
+class CursorRastreado(sqlite3.Cursor):
+    # Mede execute + leitura das linhas: no SQLite o custo aparece ao percorrer
+    # o resultado, não só no execute. O registro fecha quando o cursor esgota,
+    # executa outra instrução, é fechado ou coletado.
+    _registro = None
+
+    def _iniciar(self, sql):
+        self._finalizar()
+        self._registro = RegistroSql(sql)
+        coleta = coleta_atual()
+        if coleta is not None:
+            coleta.adicionar(self._registro)
+
+    def _finalizar(self):
+        registro = self._registro
+        if registro is not None:
+            self._registro = None
+            if not registro.linhas and self.rowcount > 0: # INSERT/UPDATE/DELETE
+                registro.linhas = self.rowcount
+            _finalizar_registro(registro)
+
+    def _medir(self, metodo, *args):
+        inicio = time.perf_counter()
+        try:
+            return metodo(*args)
+        finally:
+            if self._registro is not None:
+                self._registro.ms += (time.perf_counter() - inicio) * 1000
+
+    def execute(self, sql, parametros=()):
+        self._iniciar(sql)
+        return self._medir(super().execute, sql, parametros)
+
+    def executemany(self, sql, sequencia):
+        self._iniciar(sql)
+        return self._medir(super().executemany, sql, sequencia)
+
+    def fetchone(self):
+        linha = self._medir(super().fetchone)
+        if linha is None:
+            self._finalizar()
+        elif self._registro is not None:
+            self._registro.linhas += 1
+        return linha
+
+    def fetchmany(self, size=None):
+        linhas = self._medir(super().fetchmany, self.arraysize if size is None else size)
+        if not linhas:
+            self._finalizar()
+        elif self._registro is not None:
+            self._registro.linhas += len(linhas)
+        return linhas
+
+    def fetchall(self):
+        linhas = self._medir(super().fetchall)
+        if self._registro is not None:
+            self._registro.linhas += len(linhas)
+        self._finalizar()
+        return linhas
+
+    def __next__(self):
+        linha = self.fetchone()
+        if linha is None:
+            raise StopIteration
+        return linha
+
+    def close(self):
+        self._finalizar()
+        super().close()
+
+    def __del__(self):
+        self._finalizar()
+
+
+class ConexaoPsy(sqlite3.Connection):
+    # Conexão que volta para o pool no close() em vez de ser fechada de verdade.
+    # Assim o código existente (conn = criar_conexao() ... conn.close()) continua
+    # funcionando, mas sem pagar abertura de arquivo + PRAGMAs a cada chamada.
+    _pool = None
+
+    def close(self):
+        if self._pool is None:
+            super().close()
+        else:
+            self._pool.devolver(self)
+
+    def fechar_de_verdade(self):
+        self._pool = None
+        super().close()
+
+
+class ConexaoRastreada(ConexaoPsy):
+    # Usada pelo pool só com o rastreio ligado: todo SQL passa por CursorRastreado
+    def cursor(self, factory=CursorRastreado):
+        return super().cursor(factory)
+
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, sequencia):
+        return self.cursor().executemany(sql, sequencia)
+
+    def commit(self):
+        if not self.in_transaction:
+            return super().commit()
+        registro = RegistroSql("COMMIT") # Com escrita, é aqui que o WAL vai para o disco
+        coleta = coleta_atual()
+        if coleta is not None:
+            coleta.adicionar(registro)
+        inicio = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            registro.ms = (time.perf_counter() - inicio) * 1000
+            _finalizar_registro(registro)
+
+
+class PoolConexoes:
+    def __init__(self, caminho, tamanho_max=TAMANHO_POOL):
+        self.caminho = caminho
+        self.tamanho_max = tamanho_max
+        self._ociosas = []
+        self._lock = threading.Lock()
+        self.abertas = 0 # Total de conexões físicas abertas pelo pool
+        self.fechadas = 0
+        self.emprestimos = 0 # Chamadas a obter()
+        self.encerrado = False # Encerrado, fecha as conexões que voltarem
+
+    def _abrir(self):
+        # Permite acesso de threads diferentes, essencial para o Streamlit
+        fabrica = ConexaoRastreada if RASTREIO_ATIVO else ConexaoPsy
+        conn = sqlite3.connect(self.caminho, check_same_thread=False, factory=fabrica)
+        for pragma in PRAGMAS_CONEXAO:
+            conn.execute(pragma)
+        for gancho in _ganchos_conexao:
+            gancho(conn)
+        conn._pool = self
+        conn._emprestada = False
+        with self._lock:
+            self.abertas += 1
+        coleta = coleta_atual() if RASTREIO_ATIVO else None
+        if coleta is not None:
+            coleta.conexoes_abertas += 1
+        return conn
+
+    def obter(self):
+        with self._lock:
+            conn = self._ociosas.pop() if self._ociosas else None
+            self.emprestimos += 1
+        if conn is None:
+            conn = self._abrir()
+        conn._emprestada = True
+        coleta = coleta_atual() if RASTREIO_ATIVO else None
+        if coleta is not None:
+            coleta.conexoes_emprestadas += 1
+        return conn
+
+    def devolver(self, conn):
+        if not conn._emprestada:
+            return # close() chamado duas vezes
+        conn._emprestada = False
+        try:
+            # Nunca devolve uma transação pendente para outro usuário do pool
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._fechar(conn)
+            return
+        with self._lock:
+            if not self.encerrado and len(self._ociosas) < self.tamanho_max:
+                self._ociosas.append(conn)
+                return
+        self._fechar(conn)
+
+    def _fechar(self, conn):
+        conn.fechar_de_verdade()
+        with self._lock:
+            self.fechadas += 1
+
+    def fechar_todas(self):
+        with self._lock:
+            ociosas, self._ociosas = self._ociosas, []
+        for conn in ociosas:
+            self._fechar(conn)
+
+    def encerrar(self):
+        # Pool descartado: fecha as ociosas agora e as emprestadas quando voltarem
+        self.encerrado = True
+        self.fechar_todas()
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                "abertas": self.abertas,
+                "fechadas": self.fechadas,
+                "ociosas": len(self._ociosas),
+                "emprestimos": self.emprestimos,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_pools_shard = OrderedDict() # psicologo_id -> PoolConexoes, do menos ao mais usado
+
+def registrar_gancho_conexao(gancho):
+    # gancho(conn) roda para cada conexão aberta DAQUI EM DIANTE (ex.: instalar
+    # um set_trace_callback para contar instruções). Chame configurar() depois
+    # para que as conexões ociosas do pool também passem por ele.
+    _ganchos_conexao.append(gancho)
+
+_NAO_INFORMADO = object()
+
+def configurar(caminho=None, tamanho_pool=None, diretorio_shards=_NAO_INFORMADO):
+    # Troca o banco/pool em uso (útil para scripts, testes e benchmarks).
+    # diretorio_shards=None desliga o modo fragmentado; um caminho o liga.
+    global DB_PATH, TAMANHO_POOL, SHARDS_DIR, _pool, _banco_inicializado
+    with _pool_lock:
+        if caminho is not None:
+            DB_PATH = caminho
+        if tamanho_pool is not None:
+            TAMANHO_POOL = tamanho_pool
+        if diretorio_shards is not _NAO_INFORMADO:
+            SHARDS_DIR = diretorio_shards
+        if _pool is not None:
+            _pool.fechar_todas()
+        _pool = None
+        for pool in _pools_shard.values():
+            pool.encerrar()
+        _pools_shard.clear()
+        _banco_inicializado = False # Banco novo: migrações precisam ser conferidas
+
+def ativar_rastreio(ativo=True, limite_ms=None, arquivo_log=None):
+    # Liga/desliga o rastreio em tempo de execução. O pool é recriado para que
+    # todas as conexões passem a ser (ou deixem de ser) rastreadas.
+    global RASTREIO_ATIVO, LIMITE_LENTA_MS, ARQUIVO_LOG_LENTAS, _log_lentas
+    RASTREIO_ATIVO = ativo
+    if limite_ms is not None:
+        LIMITE_LENTA_MS = limite_ms
+    if arquivo_log is not None and arquivo_log != ARQUIVO_LOG_LENTAS:
+        ARQUIVO_LOG_LENTAS = arquivo_log
+        if _log_lentas is not None:
+            for manipulador in list(_log_lentas.handlers):
+                _log_lentas.removeHandler(manipulador)
+                manipulador.close()
+            _log_lentas = None
+    configurar()
+
+def rastreio_ativo():
+    return RASTREIO_ATIVO
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PoolConexoes(DB_PATH, TAMANHO_POOL)
+    return _pool
+
+# ----------------------------------------------
+# FRAGMENTOS POR PSICÓLOGO
+# ----------------------------------------------
+
+def fragmentado():
+    return SHARDS_DIR is not None
+
+def caminho_shard(psicologo_id):
+    return os.path.join(SHARDS_DIR, f"psicologo_{int(psicologo_id)}.db")
+
+def preparar_shard(conn, psicologo_id):
+    """Migra o arquivo do psicólogo e copia a linha dele do banco central.
+
+    A linha em psicologos só existe para as chaves estrangeiras do fragmento;
+    a senha fica apenas no banco central."""
+    from migracao import aplicar_migracoes
+
+    central = get_pool().obter()
     try:
-        cursor.execute("ALTER TABLE sessoes ADD COLUMN valor REAL")
-    except sqlite3.OperationalError:
-        pass # Coluna já existe
-        
+        linha = central.execute("SELECT id, nome, usuario FROM psicologos WHERE id = ?", (psicologo_id,)).fetchone()
+    finally:
+        central.close()
+    if linha is None:
+        raise LookupError(f"Psicólogo {psicologo_id} não existe no banco central")
+    aplicar_migracoes(conn)
+    with conn:
+        conn.execute("INSERT OR IGNORE INTO psicologos (id, nome, usuario, senha) VALUES (?, ?, ?, '!central')", linha)
+
+def _pool_do_shard(psicologo_id):
+    psicologo_id = int(psicologo_id)
+    with _pool_lock:
+        pool = _pools_shard.get(psicologo_id)
+        if pool is not None:
+            _pools_shard.move_to_end(psicologo_id)
+            return pool
+
+    # Primeiro uso neste processo: cria/migra o arquivo fora do lock global
+    pool = PoolConexoes(caminho_shard(psicologo_id), TAMANHO_POOL_SHARD)
+    conn = pool.obter()
     try:
-        cursor.execute("ALTER TABLE sessoes ADD COLUMN tipo_receita TEXT") # MIGRAÇÃO
-    except sqlite3.OperationalError:
-        pass # Coluna já existe
+        preparar_shard(conn, psicologo_id)
+    finally:
+        conn.close()
+
+    with _pool_lock:
+        existente = _pools_shard.setdefault(psicologo_id, pool)
+        _pools_shard.move_to_end(psicologo_id)
+        excedentes = [] if existente is pool else [pool] # Outra thread chegou antes
+        while len(_pools_shard) > MAX_SHARDS_ABERTOS:
+            excedentes.append(_pools_shard.popitem(last=False)[1])
+    for antigo in excedentes:
+        antigo.encerrar()
+    return existente
+
+def caminho_banco(psicologo_id=None):
+    # Arquivo que criar_conexao(psicologo_id) abriria
+    if psicologo_id is not None and SHARDS_DIR is not None:
+        return caminho_shard(psicologo_id)
+    return DB_PATH
+
+def fechar_shard(psicologo_id):
+    # Descarta o pool do fragmento (ex.: antes de recriar o arquivo)
+    with _pool_lock:
+        pool = _pools_shard.pop(int(psicologo_id), None)
+    if pool is not None:
+        pool.encerrar()
+
+def criar_conexao(psicologo_id=None):
+    # Retorna uma conexão do pool; conn.close() a devolve ao pool. Com o modo
+    # fragmentado, psicologo_id escolhe o arquivo do psicólogo; sem ele (ou
+    # fora do modo) a conexão é do banco principal/central.
+    if psicologo_id is not None and SHARDS_DIR is not None:
+        return _pool_do_shard(psicologo_id).obter()
+    return get_pool().obter()
 
+@contextmanager
+def conexao(psicologo_id=None):
+    """Empresta uma conexão do pool: commit ao sair, rollback em caso de erro."""
+    conn = criar_conexao(psicologo_id)
     try:
-        cursor.execute("ALTER TABLE sessoes ADD COLUMN qtd_sessoes INTEGER") # MIGRAÇÃO
-    except sqlite3.OperationalError:
-        pass # Coluna já existe
-    # **********************************************
-
-# ... (o resto do código do database.py)
-
-    # 4. Tabela Agendamentos (Sem alteração)
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS agendamentos (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        paciente_id INTEGER NOT NULL,
-        data TEXT NOT NULL,
-        hora TEXT NOT NULL,
-        observacoes TEXT,
-        FOREIGN KEY (paciente_id) REFERENCES pacientes(id) ON DELETE CASCADE
-    );
-    """)
-    
-    # 5. Tabela de Custos (Sem alteração)
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS custos (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        psicologo_id INTEGER NOT NULL,
-        descricao TEXT NOT NULL,
-        valor REAL NOT NULL,
-        data TEXT NOT NULL,
-        categoria TEXT NOT NULL,
-        FOREIGN KEY (psicologo_id) REFERENCES psicologos(id) ON DELETE CASCADE
-    );
-    """)
-
-    conn.commit()
-    conn.close()
\ No newline at end of file
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+_banco_inicializado = False
+_init_lock = threading.Lock()
+
+def inicializar_banco():
+    # Roda as migrações pendentes apenas uma vez por processo. O Home.py chama
+    # esta função a cada rerun; depois da primeira vez ela não toca no banco.
+    global _banco_inicializado
+    if _banco_inicializado:
+        return
+    with _init_lock:
+        if _banco_inicializado:
+            return
+        from migracao import aplicar_migracoes
+
+        conn = criar_conexao()
+        try:
+            aplicar_migracoes(conn)
+        finally:
+            conn.close()
+        _banco_inicializado = True
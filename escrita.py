@@ -0,0 +1,206 @@
+"""Escritor único: as gravações do painel passam por uma fila.
+
+Cada arquivo de banco (o único ou, com PSYCONTROL_SHARDS, cada fragmento) tem
+uma thread dona da conexão de escrita. Ela tira da fila o que já chegou (até
+TAMANHO_LOTE pedidos), abre UMA transação (BEGIN IMMEDIATE), roda cada pedido
+em um SAVEPOINT próprio e faz um único COMMIT: o custo de gravar o WAL é
+dividido pelo lote. O erro de um pedido desfaz só o savepoint dele e é
+levantado para quem pediu; os demais do lote são gravados normalmente.
+Quem pede recebe o resultado só depois do COMMIT.
+
+As sessões do Streamlit deixam de disputar o lock de escrita entre si (sobra
+só a espera por scripts externos, coberta pelo busy_timeout), e a latência de
+uma gravação depende do tamanho da fila, não de quantas abas estão abertas.
+
+As funções enviadas recebem a conexão e NÃO devem fazer commit/rollback nem
+usar `with conn:` (isso encerraria a transação do lote inteiro).
+"""
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future, TimeoutError as TempoEsgotado
+
+import database
+
+TAMANHO_LOTE = int(os.environ.get("PSYCONTROL_LOTE_ESCRITA", "32"))
+TEMPO_ESPERA = 30 # segundos que quem pede espera pelo resultado
+TEMPO_OCIOSO = 60 # segundos sem pedidos: a thread termina e devolve a conexão
+
+
+class EscritaDemorada(RuntimeError):
+    pass
+
+
+class _Pedido:
+    __slots__ = ("funcao", "args", "futuro")
+
+    def __init__(self, funcao, args):
+        self.funcao = funcao
+        self.args = args
+        self.futuro = Future()
+
+
+# ----------------------------------------------
+# THREAD DE ESCRITA
+# ----------------------------------------------
+
+_escritores = {} # caminho do arquivo -> Escritor
+_escritores_lock = threading.Lock()
+
+
+class Escritor(threading.Thread):
+    def __init__(self, caminho, conn):
+        super().__init__(name=f"escritor:{os.path.basename(caminho)}", daemon=True)
+        self.caminho = caminho
+        self.conn = conn
+        self.fila = queue.Queue()
+        self.lotes = 0
+        self.pedidos = 0
+
+    def run(self):
+        try:
+            while True:
+                try:
+                    pedido = self.fila.get(timeout=TEMPO_OCIOSO)
+                except queue.Empty:
+                    # Sai sob o mesmo lock de escrever(): nenhum pedido fica para trás
+                    with _escritores_lock:
+                        if self.fila.empty():
+                            if _escritores.get(self.caminho) is self:
+                                del _escritores[self.caminho]
+                            return
+                    continue
+                if pedido is None: # encerrar()
+                    return
+                lote = [pedido]
+                while len(lote) < TAMANHO_LOTE:
+                    try:
+                        pedido = self.fila.get_nowait()
+                    except queue.Empty:
+                        break
+                    if pedido is None:
+                        self.fila.put(None) # Grava o que já foi tirado e sai na próxima volta
+                        break
+                    lote.append(pedido)
+                self._gravar(lote)
+        finally:
+            self.conn.close()
+
+    def _gravar(self, lote):
+        conn = self.conn
+        gravados = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for pedido in lote:
+                if not pedido.futuro.set_running_or_notify_cancel():
+                    continue # Quem pediu desistiu (tempo esgotado) antes da vez dele
+                conn.execute("SAVEPOINT pedido")
+                try:
+                    resultado = pedido.funcao(conn, *pedido.args)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO pedido")
+                    conn.execute("RELEASE pedido")
+                    pedido.futuro.set_exception(e)
+                else:
+                    conn.execute("RELEASE pedido")
+                    gravados.append((pedido, resultado))
+            conn.commit()
+        except Exception as e:
+            # BEGIN/COMMIT falhou (ou um pedido encerrou a transação): nada do lote ficou
+            try:
+                if conn.in_transaction:
+                    conn.rollback()
+            except sqlite3.Error:
+                pass # A conexão segue; o próximo BEGIN dirá se ela ainda presta
+            for pedido in lote:
+                if not pedido.futuro.done():
+                    pedido.futuro.set_exception(e)
+            return
+        self.lotes += 1
+        self.pedidos += len(gravados)
+        for pedido, resultado in gravados:
+            pedido.futuro.set_result(resultado)
+
+
+def _enfileirar(psicologo_id, pedido):
+    caminho = database.caminho_banco(psicologo_id)
+    with _escritores_lock:
+        escritor = _escritores.get(caminho)
+        if escritor is not None:
+            escritor.fila.put(pedido)
+            return
+
+    # Primeira escrita neste arquivo: abrir a conexão pode criar e migrar um
+    # fragmento, então acontece fora do lock, sem travar os escritores dos
+    # outros psicólogos. Se outra thread criou o escritor nesse meio tempo, a
+    # conexão aberta aqui volta ao pool.
+    conn = database.criar_conexao(psicologo_id)
+    with _escritores_lock:
+        escritor = _escritores.get(caminho)
+        if escritor is None:
+            escritor = Escritor(caminho, conn)
+            _escritores[caminho] = escritor
+            escritor.start()
+            conn = None
+        escritor.fila.put(pedido)
+    if conn is not None:
+        conn.close()
+
+
+# ----------------------------------------------
+# API
+# ----------------------------------------------
+
+def escrever(psicologo_id, funcao, *args):
+    """Roda funcao(conn, *args) na thread de escrita do banco de psicologo_id
+    (None: banco principal/central) e devolve o resultado depois do COMMIT.
+
+    Exceções de funcao voltam para quem chamou, com a gravação dela desfeita.
+    EscritaDemorada se o pedido não for atendido em TEMPO_ESPERA segundos."""
+    atual = threading.current_thread()
+    if isinstance(atual, Escritor):
+        # Já na thread de escrita (uma função que chama outra): mesma transação
+        if atual.caminho != database.caminho_banco(psicologo_id):
+            raise RuntimeError("Um pedido de escrita não pode gravar em outro arquivo de banco")
+        return funcao(atual.conn, *args)
+
+    pedido = _Pedido(funcao, args)
+    _enfileirar(psicologo_id, pedido)
+    try:
+        return pedido.futuro.result(timeout=TEMPO_ESPERA)
+    except TempoEsgotado:
+        if pedido.futuro.cancel():
+            raise EscritaDemorada("O banco está ocupado; a gravação não foi feita. Tente novamente.") from None
+        return pedido.futuro.result() # Já estava sendo gravado: espera o fim do lote
+
+def _executar(conn, sql, parametros):
+    return conn.execute(sql, parametros).rowcount
+
+def _executar_lote(conn, sql, registros):
+    return conn.executemany(sql, registros).rowcount
+
+def executar(psicologo_id, sql, parametros=()):
+    """Uma instrução pelo escritor único. Retorna as linhas afetadas."""
+    return escrever(psicologo_id, _executar, sql, parametros)
+
+def executar_lote(psicologo_id, sql, registros):
+    # executemany em um único pedido (ex.: um lote da importação)
+    return escrever(psicologo_id, _executar_lote, sql, registros)
+
+def estatisticas():
+    with _escritores_lock:
+        return {
+            escritor.caminho: {"lotes": escritor.lotes, "pedidos": escritor.pedidos, "na_fila": escritor.fila.qsize()}
+            for escritor in _escritores.values()
+        }
+
+def encerrar():
+    # Grava o que já está na fila e para as threads (scripts, testes, benchmarks)
+    with _escritores_lock:
+        escritores = list(_escritores.values())
+        _escritores.clear()
+    for escritor in escritores:
+        escritor.fila.put(None)
+    for escritor in escritores:
+        escritor.join()
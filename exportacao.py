@@ -0,0 +1,223 @@
+"""Exportação de sessões, custos e agendamentos para CSV ou Parquet.
+
+Os registros são lidos do cursor em blocos de TAMANHO_BLOCO linhas
+(fetchmany) e escritos no destino à medida que chegam: a tabela inteira nunca
+fica em memória. No Parquet, cada bloco vira um row group.
+
+No painel, porém, o st.download_button não transmite de um arquivo: o Streamlit
+lê o arquivo inteiro e guarda os bytes no seu armazenamento de mídia (em
+memória) até a sessão terminar. O arquivo temporário evita só a cópia extra
+durante a geração. Por isso a exportação pela tela tem um teto
+(MAX_BYTES_DOWNLOAD); acima dele, use um período menor ou a linha de comando,
+que escreve direto no disco sem limite.
+
+Os agendamentos incluem as ocorrências das séries recorrentes no período
+(agenda.ocorrencias), intercaladas na mesma ordem, com a coluna serie_id. As
+séries sem data final param em HORIZONTE_SERIES_DIAS a partir de hoje.
+
+Uso pela linha de comando:
+    python exportacao.py sessoes --psicologo 1 --de 2020-01-01 --ate 2024-12-31 --formato parquet --saida sessoes.parquet
+"""
+import csv
+import heapq
+import io
+import os
+import tempfile
+from datetime import date, timedelta
+
+import agenda
+
+TAMANHO_BLOCO = 5000
+
+# Maior arquivo entregue ao botão de download do painel (ver acima)
+MAX_BYTES_DOWNLOAD = int(float(os.environ.get("PSYCONTROL_EXPORTACAO_MAX_MB", "50")) * 1024 * 1024)
+
+FORMATOS = ("csv", "parquet")
+
+# Até onde as séries sem data final são expandidas na exportação
+HORIZONTE_SERIES_DIAS = 365
+
+# tipo -> (colunas, SQL com parâmetros psicologo_id, data inicial, data final).
+# A ordenação segue os índices (paciente, data / psicólogo, data), então o SQLite
+# não precisa ordenar o resultado inteiro antes de devolver a primeira linha.
+# Valores saem em reais, convertidos dos centavos do banco (cada um vira o
+# decimal exato no CSV, ex.: 0.3, e não a soma de floats 0.30000000000000004).
+EXPORTACOES = {
+    "sessoes": (
+        ["id", "data", "paciente", "carteirinha", "tipo_receita", "qtd_sessoes", "valor_unitario", "valor", "descricao"],
+        """
+        SELECT s.id, s.data, p.nome, p.carteirinha, s.tipo_receita, s.qtd_sessoes,
+               s.valor_unitario_centavos / 100.0, s.valor_centavos / 100.0, s.descricao
+        FROM sessoes s
+        JOIN pacientes p ON s.paciente_id = p.id
+        WHERE p.psicologo_id = ? AND s.data BETWEEN ? AND ?
+        ORDER BY p.nome, p.id, s.data, s.id
+        """,
+    ),
+    "custos": (
+        ["id", "data", "categoria", "descricao", "valor"],
+        """
+        SELECT id, data, categoria, descricao, valor_centavos / 100.0
+        FROM custos
+        WHERE psicologo_id = ? AND data BETWEEN ? AND ?
+        ORDER BY data, id
+        """,
+    ),
+    # O último campo (p.id) só ordena a intercalação com as séries; não é exportado
+    "agendamentos": (
+        ["id", "serie_id", "data", "hora", "paciente", "observacoes"],
+        """
+        SELECT a.id, NULL, a.data, a.hora, p.nome, a.observacoes, p.id
+        FROM agendamentos a
+        JOIN pacientes p ON a.paciente_id = p.id
+        WHERE p.psicologo_id = ? AND a.data BETWEEN ? AND ?
+        ORDER BY p.nome, p.id, a.data, a.hora, a.id
+        """,
+    ),
+}
+
+
+def iterar_blocos(conn, tipo, psicologo_id, data_inicio, data_fim, tamanho_bloco=TAMANHO_BLOCO):
+    """Gera listas de até tamanho_bloco tuplas, na ordem das colunas de EXPORTACOES[tipo]."""
+    _colunas, sql = EXPORTACOES[tipo]
+    cursor = conn.execute(sql, (psicologo_id, data_inicio, data_fim))
+    try:
+        if tipo == "agendamentos":
+            yield from _blocos_com_ocorrencias(conn, cursor, psicologo_id, data_inicio, data_fim, tamanho_bloco)
+            return
+        while True:
+            bloco = cursor.fetchmany(tamanho_bloco)
+            if not bloco:
+                break
+            yield bloco
+    finally:
+        cursor.close()
+
+def _como_data(texto, padrao):
+    # "AAAA-MM-DD" (ou date) -> date; os extremos da linha de comando viram `padrao`
+    try:
+        return date.fromisoformat(str(texto))
+    except ValueError:
+        return padrao
+
+def _blocos_com_ocorrencias(conn, cursor, psicologo_id, data_inicio, data_fim, tamanho_bloco):
+    # Avulsos (do cursor, em ordem) intercalados com as ocorrências das séries
+    # no período. As ocorrências são calculadas em memória, limitadas ao período
+    # e a HORIZONTE_SERIES_DIAS; os avulsos continuam vindo em blocos.
+    de = max(_como_data(data_inicio, date.min), date(1900, 1, 1))
+    ate = min(_como_data(data_fim, date.max), date.today() + timedelta(days=HORIZONTE_SERIES_DIAS))
+    ocorrencias = []
+    if de <= ate:
+        for _id, inicio, _duracao, nome, observacoes, paciente_id, serie_id, _original in agenda.ocorrencias(
+                conn, psicologo_id, de, ate + timedelta(days=1)):
+            ocorrencias.append((None, serie_id, inicio[:10], inicio[11:], nome, observacoes, paciente_id))
+    ocorrencias.sort(key=_ordem_agendamento)
+
+    avulsos = (linha for bloco in iter(lambda: cursor.fetchmany(tamanho_bloco), []) for linha in bloco)
+    bloco = []
+    for linha in heapq.merge(avulsos, ocorrencias, key=_ordem_agendamento):
+        bloco.append(linha[:-1])
+        if len(bloco) == tamanho_bloco:
+            yield bloco
+            bloco = []
+    if bloco:
+        yield bloco
+
+def _ordem_agendamento(linha):
+    # Mesma ordem do SQL: paciente (nome, id), data, hora
+    return linha[4], linha[6], linha[2], linha[3]
+
+def exportar_csv(conn, tipo, psicologo_id, data_inicio, data_fim, destino, tamanho_bloco=TAMANHO_BLOCO):
+    """Escreve o CSV no destino (arquivo texto). Retorna o número de linhas."""
+    colunas, _sql = EXPORTACOES[tipo]
+    escritor = csv.writer(destino)
+    escritor.writerow(colunas)
+    total = 0
+    for bloco in iterar_blocos(conn, tipo, psicologo_id, data_inicio, data_fim, tamanho_bloco):
+        escritor.writerows(bloco)
+        total += len(bloco)
+    return total
+
+def exportar_parquet(conn, tipo, psicologo_id, data_inicio, data_fim, destino, tamanho_bloco=TAMANHO_BLOCO):
+    """Escreve o Parquet no destino (caminho ou arquivo binário). Retorna o número de linhas."""
+    try:
+        import pyarrow as pa # Opcional: pip install pyarrow
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Para exportar em Parquet instale o pyarrow: pip install pyarrow")
+
+    colunas, _sql = EXPORTACOES[tipo]
+    # Esquema fixo: o tipo da coluna não pode depender do que aparece no 1º bloco
+    tipos_arrow = {"id": pa.int64(), "serie_id": pa.int64(), "qtd_sessoes": pa.int64(), "valor_unitario": pa.float64(), "valor": pa.float64()}
+    esquema = pa.schema([(coluna, tipos_arrow.get(coluna, pa.string())) for coluna in colunas])
+
+    total = 0
+    with pq.ParquetWriter(destino, esquema) as escritor:
+        for bloco in iterar_blocos(conn, tipo, psicologo_id, data_inicio, data_fim, tamanho_bloco):
+            dados = {coluna: [linha[i] for linha in bloco] for i, coluna in enumerate(colunas)}
+            escritor.write_table(pa.Table.from_pydict(dados, schema=esquema))
+            total += len(bloco)
+    return total
+
+class ExportacaoGrande(ValueError):
+    pass
+
+
+def exportar_para_arquivo_temporario(conn, tipo, psicologo_id, data_inicio, data_fim, formato="csv",
+                                     limite_bytes=None):
+    """Gera a exportação em um arquivo temporário em disco (apagado ao ser fechado).
+    Retorna (arquivo binário posicionado no início, número de linhas).
+
+    Com limite_bytes, levanta ExportacaoGrande (e apaga o arquivo) se ele passar disso."""
+    arquivo = tempfile.TemporaryFile()
+    try:
+        if formato == "parquet":
+            total = exportar_parquet(conn, tipo, psicologo_id, data_inicio, data_fim, arquivo)
+        else:
+            texto = io.TextIOWrapper(arquivo, encoding="utf-8-sig", newline="")
+            total = exportar_csv(conn, tipo, psicologo_id, data_inicio, data_fim, texto)
+            texto.flush()
+            texto.detach() # Mantém o arquivo binário aberto
+        tamanho = arquivo.seek(0, os.SEEK_END)
+        if limite_bytes is not None and tamanho > limite_bytes:
+            raise ExportacaoGrande(
+                f"O arquivo ficou com {tamanho / 1024 / 1024:.1f} MB (limite de {limite_bytes / 1024 / 1024:.0f} MB "
+                f"para download pela tela). Escolha um período menor ou use `python exportacao.py`."
+            )
+        arquivo.seek(0)
+    except Exception:
+        arquivo.close()
+        raise
+    return arquivo, total
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    from database import criar_conexao, inicializar_banco
+
+    parser = argparse.ArgumentParser(description="Exporta sessões, custos ou agendamentos de um psicólogo.")
+    parser.add_argument("tipo", choices=list(EXPORTACOES))
+    parser.add_argument("--psicologo", type=int, required=True)
+    parser.add_argument("--de", default="0000-01-01", help="Data inicial (AAAA-MM-DD)")
+    parser.add_argument("--ate", default="9999-12-31", help="Data final (AAAA-MM-DD)")
+    parser.add_argument("--formato", choices=FORMATOS, default="csv")
+    parser.add_argument("--saida", help="Arquivo de saída (padrão: stdout, só para CSV)")
+    args = parser.parse_args()
+
+    inicializar_banco()
+    conn = criar_conexao(args.psicologo)
+    try:
+        if args.formato == "parquet":
+            if not args.saida:
+                parser.error("--saida é obrigatório para Parquet")
+            total = exportar_parquet(conn, args.tipo, args.psicologo, args.de, args.ate, args.saida)
+        elif args.saida:
+            with open(args.saida, "w", encoding="utf-8-sig", newline="") as destino:
+                total = exportar_csv(conn, args.tipo, args.psicologo, args.de, args.ate, destino)
+        else:
+            total = exportar_csv(conn, args.tipo, args.psicologo, args.de, args.ate, sys.stdout)
+    finally:
+        conn.close()
+    print(f"{total} linhas exportadas.", file=sys.stderr)
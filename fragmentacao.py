@@ -0,0 +1,210 @@
+"""Modo fragmentado: um arquivo SQLite por psicólogo (ver database.py).
+
+Com PSYCONTROL_SHARDS definido, o DB_PATH guarda só psicólogos e tokens de
+sessão; pacientes, sessões, agendamentos, custos, resumos, log de alterações e
+índices de busca de cada psicólogo ficam em <PSYCONTROL_SHARDS>/psicologo_<id>.db.
+A escrita de um psicólogo só bloqueia o arquivo dele.
+
+Dividir um psycontrol.db existente (o próprio arquivo passa a ser o central):
+    PSYCONTROL_SHARDS=fragmentos python fragmentacao.py dividir [--limpar-central]
+
+Totais de todos os psicólogos, consultando os fragmentos em paralelo:
+    PSYCONTROL_SHARDS=fragmentos python fragmentacao.py resumo
+"""
+import glob
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+
+TRABALHADORES = min(8, os.cpu_count() or 2)
+
+# Tabelas copiadas para o fragmento, em ordem de dependência, com o filtro que
+# seleciona as linhas do psicólogo no banco de origem (anexado como "origem")
+TABELAS_DO_PSICOLOGO = {
+    "pacientes": "psicologo_id = :psicologo",
+    "sessoes": "paciente_id IN (SELECT id FROM origem.pacientes WHERE psicologo_id = :psicologo)",
+    "agendamentos": "paciente_id IN (SELECT id FROM origem.pacientes WHERE psicologo_id = :psicologo)",
+    "custos": "psicologo_id = :psicologo",
+    "series_agendamento": "psicologo_id = :psicologo",
+    "excecoes_serie": "serie_id IN (SELECT id FROM origem.series_agendamento WHERE psicologo_id = :psicologo)",
+}
+
+SQL_RESUMO_FRAGMENTO = """
+    SELECT
+        (SELECT COUNT(*) FROM pacientes WHERE psicologo_id = :psicologo),
+        (SELECT COALESCE(SUM(qtd), 0) FROM receita_mensal WHERE psicologo_id = :psicologo),
+        (SELECT COALESCE(SUM(total_centavos), 0) FROM receita_mensal WHERE psicologo_id = :psicologo),
+        (SELECT COALESCE(SUM(total_centavos), 0) FROM custo_mensal WHERE psicologo_id = :psicologo),
+        (SELECT COUNT(*) FROM agendamentos WHERE psicologo_id = :psicologo AND inicio >= date('now', 'localtime'))
+"""
+
+
+def _exigir_modo_fragmentado():
+    if not database.fragmentado():
+        raise RuntimeError("Defina PSYCONTROL_SHARDS (ou database.configurar(diretorio_shards=...)) antes.")
+
+def psicologos_com_fragmento():
+    """IDs dos psicólogos do banco central que já têm arquivo próprio."""
+    _exigir_modo_fragmentado()
+    existentes = set()
+    for caminho in glob.glob(os.path.join(database.SHARDS_DIR, "psicologo_*.db")):
+        encontrado = re.fullmatch(r"psicologo_(\d+)\.db", os.path.basename(caminho))
+        if encontrado:
+            existentes.add(int(encontrado.group(1)))
+    with database.conexao() as conn:
+        ids = [linha[0] for linha in conn.execute("SELECT id FROM psicologos ORDER BY id")]
+    return [psicologo_id for psicologo_id in ids if psicologo_id in existentes]
+
+
+# ----------------------------------------------
+# DIVISÃO DE UM BANCO ÚNICO
+# ----------------------------------------------
+
+def _colunas_comuns(conn, tabela):
+    # Bancos antigos podem ter as colunas em outra ordem (ALTER TABLE)
+    destino = [linha[1] for linha in conn.execute(f"PRAGMA main.table_info({tabela})")]
+    origem = {linha[1] for linha in conn.execute(f"PRAGMA origem.table_info({tabela})")}
+    return ", ".join(coluna for coluna in destino if coluna in origem)
+
+def _remover_arquivo(caminho):
+    for sufixo in ("", "-wal", "-shm"):
+        if os.path.exists(caminho + sufixo):
+            os.remove(caminho + sufixo)
+
+def copiar_psicologo(psicologo_id, caminho_origem=None, substituir=False):
+    """Copia as linhas de um psicólogo do banco único para o fragmento dele.
+
+    Resumos mensais e índices de busca são refeitos pelos triggers do próprio
+    fragmento; o log de alterações é copiado com os mesmos seq, para que os
+    cursores de sincronização continuem valendo. Retorna {tabela: linhas}."""
+    _exigir_modo_fragmentado()
+    caminho_origem = caminho_origem or database.DB_PATH
+    caminho = database.caminho_shard(psicologo_id)
+    if os.path.exists(caminho):
+        if not substituir:
+            raise FileExistsError(f"{caminho} já existe (use substituir=True / --substituir)")
+        database.fechar_shard(psicologo_id)
+        _remover_arquivo(caminho)
+
+    copiadas = {}
+    conn = database.criar_conexao(psicologo_id) # Cria e migra o arquivo
+    try:
+        conn.execute("ATTACH DATABASE ? AS origem", (caminho_origem,))
+        try:
+            with conn:
+                for tabela, filtro in TABELAS_DO_PSICOLOGO.items():
+                    colunas = _colunas_comuns(conn, tabela)
+                    copiadas[tabela] = conn.execute(
+                        f"INSERT INTO main.{tabela} ({colunas}) SELECT {colunas} FROM origem.{tabela} WHERE {filtro}",
+                        {"psicologo": psicologo_id},
+                    ).rowcount
+
+                # Os triggers registraram a cópia como inserções novas: volta ao log original
+                conn.execute("DELETE FROM main.alteracoes")
+                copiadas["alteracoes"] = conn.execute(
+                    "INSERT INTO main.alteracoes SELECT * FROM origem.alteracoes WHERE psicologo_id = :psicologo",
+                    {"psicologo": psicologo_id},
+                ).rowcount
+
+                # IDs novos continuam depois dos do banco único (nunca reaproveitados)
+                tabelas = tuple(TABELAS_DO_PSICOLOGO) + ("alteracoes",)
+                marcadores = ", ".join("?" * len(tabelas))
+                conn.execute(f"DELETE FROM main.sqlite_sequence WHERE name IN ({marcadores})", tabelas)
+                conn.execute(
+                    f"INSERT INTO main.sqlite_sequence (name, seq) SELECT name, seq FROM origem.sqlite_sequence WHERE name IN ({marcadores})",
+                    tabelas,
+                )
+        finally:
+            conn.execute("DETACH DATABASE origem")
+    finally:
+        conn.close()
+    return copiadas
+
+def limpar_central(psicologo_ids):
+    # Depois da divisão, o banco central fica só com psicólogos e tokens
+    with database.conexao() as conn:
+        for psicologo_id in psicologo_ids:
+            conn.execute("DELETE FROM custos WHERE psicologo_id = ?", (psicologo_id,))
+            conn.execute("DELETE FROM pacientes WHERE psicologo_id = ?", (psicologo_id,)) # Triggers levam o resto
+            conn.execute("DELETE FROM alteracoes WHERE psicologo_id = ?", (psicologo_id,))
+            conn.execute("DELETE FROM receita_mensal WHERE psicologo_id = ?", (psicologo_id,))
+            conn.execute("DELETE FROM custo_mensal WHERE psicologo_id = ?", (psicologo_id,))
+    conn = database.criar_conexao()
+    try:
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+def dividir_banco(substituir=False, limpar=False, trabalhadores=TRABALHADORES):
+    """Divide o DB_PATH atual em um fragmento por psicólogo. Retorna {psicologo_id: {tabela: linhas}}."""
+    _exigir_modo_fragmentado()
+    os.makedirs(database.SHARDS_DIR, exist_ok=True)
+    database.inicializar_banco()
+    with database.conexao() as conn:
+        ids = [linha[0] for linha in conn.execute("SELECT id FROM psicologos ORDER BY id")]
+
+    # Arquivos diferentes: as cópias não disputam o mesmo lock de escrita
+    with ThreadPoolExecutor(max_workers=trabalhadores) as executor:
+        resultados = dict(zip(ids, executor.map(lambda psicologo_id: copiar_psicologo(psicologo_id, substituir=substituir), ids)))
+    if limpar:
+        limpar_central(ids)
+    return resultados
+
+
+# ----------------------------------------------
+# AGREGADOS ENTRE FRAGMENTOS
+# ----------------------------------------------
+
+def consultar_todos(sql, parametros=None, trabalhadores=TRABALHADORES):
+    """Roda `sql` em cada fragmento, em paralelo. Retorna {psicologo_id: linhas}.
+
+    :psicologo nos parâmetros nomeados recebe o ID do dono do fragmento."""
+    ids = psicologos_com_fragmento()
+
+    def consultar(psicologo_id):
+        with database.conexao(psicologo_id) as conn:
+            return conn.execute(sql, dict(parametros or {}, psicologo=psicologo_id)).fetchall()
+
+    # O sqlite3 solta o GIL durante a consulta: os fragmentos são lidos ao mesmo tempo
+    with ThreadPoolExecutor(max_workers=trabalhadores) as executor:
+        return dict(zip(ids, executor.map(consultar, ids)))
+
+def resumo_geral(trabalhadores=TRABALHADORES):
+    """[(psicologo_id, nome, pacientes, sessões, receita, custos, agendamentos futuros)], valores em centavos."""
+    por_psicologo = consultar_todos(SQL_RESUMO_FRAGMENTO, trabalhadores=trabalhadores)
+    with database.conexao() as conn:
+        nomes = dict(conn.execute("SELECT id, nome FROM psicologos"))
+    return [(psicologo_id, nomes.get(psicologo_id, "?"), *linhas[0]) for psicologo_id, linhas in por_psicologo.items()]
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Ferramentas do modo fragmentado (PSYCONTROL_SHARDS).")
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+    dividir = subcomandos.add_parser("dividir", help="Divide o banco único em um arquivo por psicólogo")
+    dividir.add_argument("--substituir", action="store_true", help="Recria fragmentos que já existem")
+    dividir.add_argument("--limpar-central", action="store_true", help="Apaga do banco central os dados já copiados")
+    resumo = subcomandos.add_parser("resumo", help="Totais por psicólogo, lidos em paralelo")
+    for subparser in (dividir, resumo):
+        subparser.add_argument("--trabalhadores", type=int, default=TRABALHADORES)
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    if args.comando == "dividir":
+        resultados = dividir_banco(args.substituir, args.limpar_central, args.trabalhadores)
+        for psicologo_id, copiadas in resultados.items():
+            detalhes = ", ".join(f"{tabela}={total}" for tabela, total in copiadas.items())
+            print(f"psicologo_{psicologo_id}.db: {detalhes}")
+        print(f"{len(resultados)} fragmentos em {time.perf_counter() - inicio:.2f}s")
+    else:
+        linhas = resumo_geral(args.trabalhadores)
+        print(f"{'id':>5} {'nome':<25} {'pacientes':>9} {'sessões':>8} {'receita':>12} {'custos':>12} {'agend.':>7}")
+        for psicologo_id, nome, pacientes, sessoes, receita, custos, agendados in linhas:
+            print(f"{psicologo_id:5d} {nome[:25]:<25} {pacientes:9d} {sessoes:8d} {receita / 100:12.2f} {custos / 100:12.2f} {agendados:7d}")
+        totais = [sum(linha[indice] for linha in linhas) for indice in range(2, 7)]
+        print(f"{'':5} {'TOTAL':<25} {totais[0]:9d} {totais[1]:8d} {totais[2] / 100:12.2f} {totais[3] / 100:12.2f} {totais[4]:7d}")
+        print(f"{len(linhas)} fragmentos em {time.perf_counter() - inicio:.2f}s")
@@ -0,0 +1,225 @@
+"""Gerador de dados sintéticos para testes de carga e benchmarks.
+
+Popula um banco (criado/migrado por database.inicializar_banco) com
+psicólogos, pacientes, sessões, agendamentos e custos. A mesma semente gera
+sempre os mesmos dados. As datas se espalham pelos últimos anos (sessões
+semanais por paciente, agendamentos nas próximas semanas, aluguel todo mês) e
+as descrições têm tamanhos variados, como anotações reais de sessão.
+
+Uso pela linha de comando (NUNCA aponte para o banco de produção):
+    python gerador_dados.py /tmp/carga.db --escala media
+    python gerador_dados.py /tmp/carga.db --psicologos 3 --pacientes 100 --sessoes 40
+"""
+import random
+from datetime import date, timedelta
+
+import database
+from validacao import apenas_digitos, normalizar_nome
+
+TAMANHO_LOTE = 5000
+
+# Quantidades POR psicólogo (pacientes, custos, séries recorrentes) e POR
+# paciente (sessões, agendamentos)
+ESCALAS = {
+    "pequena": {"psicologos": 2, "pacientes": 30, "sessoes": 20, "agendamentos": 2, "custos": 60, "series": 5},
+    "media": {"psicologos": 5, "pacientes": 200, "sessoes": 40, "agendamentos": 3, "custos": 300, "series": 20},
+    "grande": {"psicologos": 10, "pacientes": 800, "sessoes": 60, "agendamentos": 4, "custos": 1500, "series": 60},
+}
+
+# Senha de todos os psicólogos gerados (usuário: psico1, psico2, ...)
+SENHA_PADRAO = "senha123"
+
+_NOMES = ["Ana", "Bruno", "Carla", "Daniel", "Eduarda", "Felipe", "Gabriela", "Henrique", "Isabela",
+          "João", "Karina", "Lucas", "Mariana", "Nicolas", "Olívia", "Paulo", "Rafaela", "Sérgio",
+          "Tatiane", "Vinícius", "Yasmin", "Álvaro", "Débora", "Érica", "Íris", "Otávio"]
+_SOBRENOMES = ["Silva", "Santos", "Oliveira", "Souza", "Rodrigues", "Ferreira", "Alves", "Pereira",
+               "Lima", "Gomes", "Costa", "Ribeiro", "Martins", "Carvalho", "Araújo", "Melo",
+               "Barbosa", "Cardoso", "Conceição", "Gonçalves", "Nascimento", "Moreira"]
+_PALAVRAS = ("paciente relata ansiedade semana trabalho família sono melhora piora sessão "
+             "exercício respiração pensamentos automáticos humor rotina conflito relacionamento "
+             "objetivo terapia progresso dificuldade estratégia enfrentamento tarefa casa "
+             "emoções medo tristeza evolução escola acompanhamento encaminhamento").split()
+_CATEGORIAS = ["Aluguel", "Material de Escritório", "Software/Licenças", "Treinamento/Cursos", "Marketing", "Outros"]
+_TIPOS_RECEITA = ["Particular", "Convênio - Plano A", "Convênio - Plano B", "Outros"]
+_HORARIOS = [f"{h:02d}:{m:02d}" for h in range(8, 20) for m in (0, 30)]
+_TAMANHO_MEDIO_PALAVRA = round(sum(len(p) + 1 for p in _PALAVRAS) / len(_PALAVRAS))
+
+
+def _texto(rnd, minimo, maximo):
+    # Tamanho com cauda longa: a maioria curta, algumas anotações bem longas
+    tamanho = min(maximo, minimo + int(rnd.expovariate(1 / ((maximo - minimo) / 4))))
+    palavras = rnd.choices(_PALAVRAS, k=1 + tamanho // _TAMANHO_MEDIO_PALAVRA)
+    return " ".join(palavras).capitalize() + "."
+
+def _hash_senha(senha):
+    try:
+        import bcrypt # Opcional aqui: sem ele os psicólogos gerados não conseguem logar
+    except ImportError:
+        return "!sem-bcrypt"
+    # Custo baixo: gerar milhares de usuários de teste não deve levar minutos
+    return bcrypt.hashpw(senha.encode("utf-8"), bcrypt.gensalt(rounds=4)).decode("utf-8")
+
+def _inserir_em_lotes(conn, sql, linhas):
+    lote = []
+    for linha in linhas:
+        lote.append(linha)
+        if len(lote) >= TAMANHO_LOTE:
+            conn.executemany(sql, lote)
+            lote.clear()
+    if lote:
+        conn.executemany(sql, lote)
+
+def gerar(conn, psicologos=2, pacientes=30, sessoes=20, agendamentos=2, custos=60, series=5,
+          anos=3, semente=42, hoje=None, ao_progredir=None):
+    """Gera os dados em conn e retorna {tabela: linhas inseridas}.
+
+    pacientes, custos e series (agendamentos recorrentes) são por psicólogo;
+    sessoes e agendamentos, por paciente (em média). ao_progredir(nº do
+    psicólogo), se informado, é chamado após cada um."""
+    rnd = random.Random(semente)
+    hoje = hoje or date.today()
+    inicio = hoje - timedelta(days=365 * anos)
+    totais = dict.fromkeys(["psicologos", "pacientes", "sessoes", "agendamentos", "custos", "series"], 0)
+    senha_hash = _hash_senha(SENHA_PADRAO)
+
+    primeiro = conn.execute("SELECT COALESCE(MAX(id), 0) FROM psicologos").fetchone()[0] + 1
+    for numero in range(primeiro, primeiro + psicologos):
+        with conn: # Uma transação por psicólogo
+            psicologo_id = conn.execute(
+                "INSERT INTO psicologos (nome, usuario, senha) VALUES (?, ?, ?)",
+                (f"Dr(a). {rnd.choice(_NOMES)} {rnd.choice(_SOBRENOMES)}", f"psico{numero}", senha_hash),
+            ).lastrowid
+
+            ids_pacientes = []
+            for _ in range(pacientes):
+                nome = f"{rnd.choice(_NOMES)} {rnd.choice(_SOBRENOMES)} {rnd.choice(_SOBRENOMES)}"
+                telefone = f"({rnd.randint(11, 99)}) 9{rnd.randint(1000, 9999)}-{rnd.randint(1000, 9999)}"
+                email = f"{nome.split()[0].lower()}.{rnd.randint(1, 99999)}@exemplo.com"
+                ids_pacientes.append(conn.execute(
+                    "INSERT INTO pacientes (psicologo_id, nome, telefone, email, observacoes, foto_path, carteirinha, nome_busca, telefone_digitos) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (psicologo_id, nome, telefone, email, _texto(rnd, 0, 300), "",
+                     f"{rnd.randint(0, 10**12):012d}" if rnd.random() < 0.6 else "",
+                     normalizar_nome(nome), apenas_digitos(telefone)),
+                ).lastrowid)
+
+            def linhas_sessoes():
+                for paciente_id in ids_pacientes:
+                    # Cada paciente começa em algum ponto do período e vem ~1x por semana
+                    quantidade = max(1, int(rnd.gauss(sessoes, sessoes / 3)))
+                    dia = inicio + timedelta(days=rnd.randint(0, 365 * anos))
+                    tipo = rnd.choice(_TIPOS_RECEITA)
+                    preco = rnd.choice([120, 150, 180, 200, 250])
+                    for _ in range(quantidade):
+                        if dia > hoje:
+                            break
+                        qtd = 1 if rnd.random() < 0.9 else rnd.randint(2, 4)
+                        yield (paciente_id, psicologo_id, dia.isoformat(), _texto(rnd, 40, 2000), preco * 100 * qtd, preco * 100, tipo, qtd)
+                        totais["sessoes"] += 1
+                        dia += timedelta(days=rnd.choice([7, 7, 7, 14, 3]))
+
+            _inserir_em_lotes(
+                conn,
+                "INSERT INTO sessoes (paciente_id, psicologo_id, data, descricao, valor_centavos, valor_unitario_centavos, tipo_receita, qtd_sessoes) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                linhas_sessoes(),
+            )
+
+            def linhas_agendamentos():
+                for paciente_id in ids_pacientes:
+                    for _ in range(rnd.randint(0, agendamentos * 2)):
+                        # Maioria nas próximas 8 semanas; alguns já passados
+                        dia = hoje + timedelta(days=rnd.randint(-30, 56))
+                        obs = _texto(rnd, 0, 120) if rnd.random() < 0.3 else ""
+                        hora = rnd.choice(_HORARIOS)
+                        yield (paciente_id, dia.isoformat(), hora, obs, f"{dia.isoformat()} {hora}", psicologo_id)
+                        totais["agendamentos"] += 1
+
+            _inserir_em_lotes(
+                conn,
+                "INSERT INTO agendamentos (paciente_id, data, hora, observacoes, inicio, psicologo_id) VALUES (?, ?, ?, ?, ?, ?)",
+                linhas_agendamentos(),
+            )
+
+            def linhas_custos():
+                # Aluguel fixo todo mês + despesas avulsas no restante
+                mes = date(inicio.year, inicio.month, 5)
+                aluguel = rnd.randint(8, 30) * 100 * 100 # centavos
+                avulsas = custos
+                while mes <= hoje:
+                    yield (psicologo_id, "Aluguel da sala", aluguel, mes.isoformat(), "Aluguel")
+                    totais["custos"] += 1
+                    avulsas -= 1
+                    mes = date(mes.year + mes.month // 12, mes.month % 12 + 1, 5)
+                for _ in range(max(0, avulsas)):
+                    dia = inicio + timedelta(days=rnd.randint(0, (hoje - inicio).days))
+                    valor = round(rnd.lognormvariate(4.5, 0.8) * 100) # centavos
+                    yield (psicologo_id, _texto(rnd, 10, 80), valor, dia.isoformat(), rnd.choice(_CATEGORIAS[1:]))
+                    totais["custos"] += 1
+
+            _inserir_em_lotes(
+                conn,
+                "INSERT INTO custos (psicologo_id, descricao, valor_centavos, data, categoria) VALUES (?, ?, ?, ?, ?)",
+                linhas_custos(),
+            )
+
+            def linhas_series():
+                # Pacientes fixos: começaram no último ano; parte já encerrada
+                for paciente_id in rnd.sample(ids_pacientes, min(series, len(ids_pacientes))):
+                    comeco = hoje - timedelta(days=rnd.randint(0, 365))
+                    fim = (comeco + timedelta(days=rnd.randint(60, 300))).isoformat() if rnd.random() < 0.3 else None
+                    regra = rnd.choice(["semanal", "semanal", "quinzenal", "mensal"])
+                    yield (psicologo_id, paciente_id, regra, comeco.isoformat(), fim, rnd.choice(_HORARIOS), 50)
+                    totais["series"] += 1
+
+            _inserir_em_lotes(
+                conn,
+                "INSERT INTO series_agendamento (psicologo_id, paciente_id, regra, data_inicio, data_fim, hora, duracao_min) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                linhas_series(),
+            )
+
+        totais["psicologos"] += 1
+        totais["pacientes"] += len(ids_pacientes)
+        if ao_progredir:
+            ao_progredir(totais["psicologos"])
+
+    return totais
+
+def gerar_banco(caminho, semente=42, **quantidades):
+    """Cria (ou completa) o banco em `caminho`, aplica as migrações e gera os dados."""
+    database.configurar(caminho)
+    database.inicializar_banco()
+    conn = database.criar_conexao()
+    try:
+        totais = gerar(conn, semente=semente, **quantidades)
+        conn.execute("ANALYZE") # Estatísticas para o planejador, como num banco já em uso
+        conn.commit()
+    finally:
+        conn.close()
+    return totais
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    import time
+
+    parser = argparse.ArgumentParser(description="Popula um banco com dados sintéticos.")
+    parser.add_argument("banco", help="Arquivo do banco a criar/completar")
+    parser.add_argument("--escala", choices=list(ESCALAS), default="pequena")
+    for campo in ESCALAS["pequena"]:
+        parser.add_argument(f"--{campo}", type=int, help="Sobrescreve o valor da escala")
+    parser.add_argument("--anos", type=int, default=3, help="Período coberto pelas sessões")
+    parser.add_argument("--semente", type=int, default=42)
+    args = parser.parse_args()
+
+    if os.path.abspath(args.banco) == os.path.abspath(database.DB_PATH) and os.path.exists(args.banco):
+        parser.error("recusando gerar dados no banco configurado do aplicativo; use outro arquivo")
+
+    quantidades = dict(ESCALAS[args.escala])
+    for campo in quantidades:
+        if getattr(args, campo) is not None:
+            quantidades[campo] = getattr(args, campo)
+
+    inicio = time.perf_counter()
+    totais = gerar_banco(args.banco, semente=args.semente, anos=args.anos, **quantidades)
+    resumo = ", ".join(f"{quantidade} {tabela}" for tabela, quantidade in totais.items())
+    print(f"Gerados em {time.perf_counter() - inicio:.1f}s: {resumo}.")
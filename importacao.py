@@ -0,0 +1,305 @@
+"""Importação em lote de pacientes, sessões e custos a partir de CSV/XLSX.
+
+Os arquivos são lidos em streaming (linha a linha, sem carregar tudo em
+memória), validados com as mesmas regras dos formulários do painel e gravados
+com executemany em transações de TAMANHO_LOTE linhas. Linhas inválidas não
+interrompem a importação: vão para a lista de erros do relatório.
+
+Colunas esperadas (cabeçalho na primeira linha, sem diferenciar maiúsculas):
+    pacientes: nome*, telefone*, email*, carteirinha, observacoes
+    sessoes:   paciente* (nome) ou carteirinha*, data*, descricao*, valor ou
+               valor_unitario*, qtd_sessoes, tipo_receita
+    custos:    data*, descricao*, valor*, categoria
+
+Uso pela linha de comando:
+    python importacao.py pacientes arquivo.csv --psicologo 1
+"""
+import codecs
+import csv
+import io
+from datetime import date, datetime
+from itertools import islice
+
+from moeda import dividir, para_centavos
+from validacao import apenas_digitos, normalizar_nome, validar_email, validar_telefone
+
+TAMANHO_LOTE = 1000
+
+# Guardamos no máximo esta quantidade de mensagens; o total continua sendo contado
+MAX_ERROS_RELATORIO = 1000
+
+TIPOS_IMPORTACAO = ("pacientes", "sessoes", "custos")
+
+
+class ErroLinha(ValueError):
+    pass
+
+
+# ----------------------------------------------
+# LEITURA (CSV/XLSX) EM STREAMING
+# ----------------------------------------------
+
+def _chave_coluna(nome):
+    return normalizar_nome(str(nome or "")).replace(" ", "_")
+
+def _ler_csv(arquivo):
+    # Aceita arquivo binário (upload do Streamlit, open(..., "rb")) ou texto
+    if isinstance(arquivo.read(0), bytes):
+        arquivo = codecs.getreader("utf-8-sig")(arquivo)
+    amostra = arquivo.read(4096)
+    try:
+        dialeto = csv.Sniffer().sniff(amostra, delimiters=",;\t")
+    except csv.Error:
+        dialeto = csv.excel
+    leitor = csv.reader(_concatenar(amostra, arquivo), dialeto)
+    cabecalho = [_chave_coluna(c) for c in next(leitor, [])]
+    for valores in leitor:
+        if any(v.strip() for v in valores):
+            yield dict(zip(cabecalho, valores))
+
+def _concatenar(amostra, arquivo):
+    # Devolve ao csv.reader a amostra já lida pelo Sniffer, seguida do restante
+    yield from io.StringIO(amostra + arquivo.readline())
+    yield from arquivo
+
+def _ler_xlsx(arquivo):
+    try:
+        from openpyxl import load_workbook # Opcional: pip install openpyxl
+    except ImportError:
+        raise RuntimeError("Para importar arquivos .xlsx instale o openpyxl: pip install openpyxl")
+    # read_only percorre a planilha sem montar todas as células em memória
+    planilha = load_workbook(arquivo, read_only=True, data_only=True).active
+    linhas = planilha.iter_rows(values_only=True)
+    cabecalho = [_chave_coluna(c) for c in next(linhas, ())]
+    for valores in linhas:
+        if any(v not in (None, "") for v in valores):
+            yield dict(zip(cabecalho, valores))
+
+def ler_linhas(arquivo, nome_arquivo):
+    """Gera um dicionário por linha (chaves = cabeçalho normalizado)."""
+    if nome_arquivo.lower().endswith((".xlsx", ".xlsm")):
+        return _ler_xlsx(arquivo)
+    return _ler_csv(arquivo)
+
+
+# ----------------------------------------------
+# CONVERSÃO E VALIDAÇÃO DE CAMPOS
+# ----------------------------------------------
+
+def _texto(linha, coluna):
+    valor = linha.get(coluna)
+    return "" if valor is None else str(valor).strip()
+
+def _obrigatorio(linha, coluna):
+    valor = _texto(linha, coluna)
+    if not valor:
+        raise ErroLinha(f"campo '{coluna}' é obrigatório")
+    return valor
+
+def _data(linha, coluna="data"):
+    valor = linha.get(coluna)
+    if isinstance(valor, (datetime, date)): # Células de data do Excel
+        return valor.strftime("%Y-%m-%d")
+    texto = _obrigatorio(linha, coluna)
+    for formato in ("%Y-%m-%d", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(texto, formato).strftime("%Y-%m-%d")
+        except ValueError:
+            pass
+    raise ErroLinha(f"data inválida '{texto}' (use AAAA-MM-DD ou DD/MM/AAAA)")
+
+def _centavos(linha, coluna):
+    # Valor em reais no arquivo -> centavos inteiros (o texto não passa por float)
+    valor = linha.get(coluna)
+    if not isinstance(valor, (int, float)):
+        valor = _texto(linha, coluna).replace("R$", "").replace(" ", "")
+        if not valor:
+            return None
+        if "," in valor: # Formato brasileiro: 1.234,56
+            valor = valor.replace(".", "").replace(",", ".")
+    try:
+        centavos = para_centavos(valor)
+    except ValueError:
+        raise ErroLinha(f"valor inválido em '{coluna}': '{valor}'")
+    if centavos < 0:
+        raise ErroLinha(f"valor negativo em '{coluna}'")
+    return centavos
+
+def _inteiro(linha, coluna, padrao):
+    texto = _texto(linha, coluna)
+    if not texto:
+        return padrao
+    try:
+        numero = float(texto.replace(",", ".")) # "2", "2.0" ou 2.0 vindo do Excel
+    except ValueError:
+        raise ErroLinha(f"número inválido em '{coluna}': '{texto}'")
+    if not numero.is_integer(): # "2.7" não vira 2 sem aviso
+        raise ErroLinha(f"'{coluna}' deve ser um número inteiro: '{texto}'")
+    numero = int(numero)
+    if numero < 1:
+        raise ErroLinha(f"'{coluna}' deve ser pelo menos 1")
+    return numero
+
+
+def _linha_paciente(psicologo_id, linha, _contexto):
+    nome = _obrigatorio(linha, "nome")
+    telefone = _obrigatorio(linha, "telefone")
+    email = _obrigatorio(linha, "email")
+    if not validar_email(email):
+        raise ErroLinha(f"email inválido '{email}'")
+    if not validar_telefone(telefone):
+        raise ErroLinha(f"telefone inválido '{telefone}' (use 10 ou 11 dígitos)")
+    carteirinha = _texto(linha, "carteirinha")[:20]
+    return (psicologo_id, nome, telefone, email, _texto(linha, "observacoes"), "", carteirinha,
+            normalizar_nome(nome), apenas_digitos(telefone))
+
+def _linha_sessao(psicologo_id, linha, contexto):
+    paciente_id = contexto.resolver(linha)
+    data = _data(linha)
+    descricao = _obrigatorio(linha, "descricao")
+    qtd_sessoes = _inteiro(linha, "qtd_sessoes", 1)
+    valor_unitario = _centavos(linha, "valor_unitario")
+    # Como no formulário: receita = valor unitário x quantidade (ou o total pronto,
+    # e o unitário sai da divisão)
+    if valor_unitario is not None:
+        valor = valor_unitario * qtd_sessoes
+    else:
+        valor = _centavos(linha, "valor")
+        if valor is None:
+            raise ErroLinha("informe 'valor_unitario' ou 'valor'")
+        valor_unitario = dividir(valor, qtd_sessoes)
+    tipo_receita = _texto(linha, "tipo_receita") or None
+    return (paciente_id, psicologo_id, data, descricao, valor, valor_unitario, tipo_receita, qtd_sessoes)
+
+def _linha_custo(psicologo_id, linha, _contexto):
+    data = _data(linha)
+    descricao = _obrigatorio(linha, "descricao")
+    valor = _centavos(linha, "valor")
+    if not valor:
+        raise ErroLinha("campo 'valor' é obrigatório e maior que zero")
+    categoria = _texto(linha, "categoria") or "Outros"
+    return (psicologo_id, descricao, valor, data, categoria)
+
+
+class ResolvedorPacientes:
+    # Carrega UMA vez os pacientes do psicólogo e resolve cada linha em memória
+    # (por carteirinha, depois por nome normalizado), sem consulta por linha.
+    # Só lê: a importação de sessões nunca altera o cadastro (nem a carteirinha)
+    # do paciente encontrado.
+    def __init__(self, conn, psicologo_id):
+        self.por_carteirinha = {}
+        self.por_nome = {}
+        linhas = conn.execute(
+            "SELECT id, nome, carteirinha FROM pacientes WHERE psicologo_id = ?", (psicologo_id,)
+        )
+        for id_pac, nome, carteirinha in linhas:
+            if carteirinha:
+                self.por_carteirinha[carteirinha.strip()] = id_pac
+            self.por_nome.setdefault(normalizar_nome(nome), []).append(id_pac)
+
+    def resolver(self, linha):
+        carteirinha = _texto(linha, "carteirinha")
+        if carteirinha:
+            if carteirinha not in self.por_carteirinha:
+                raise ErroLinha(f"nenhum paciente com a carteirinha '{carteirinha}'")
+            return self.por_carteirinha[carteirinha]
+        nome = _texto(linha, "paciente") or _texto(linha, "nome")
+        if not nome:
+            raise ErroLinha("informe 'paciente' (nome) ou 'carteirinha'")
+        ids = self.por_nome.get(normalizar_nome(nome), [])
+        if not ids:
+            raise ErroLinha(f"paciente '{nome}' não encontrado")
+        if len(ids) > 1:
+            raise ErroLinha(f"há {len(ids)} pacientes chamados '{nome}'; use a carteirinha")
+        return ids[0]
+
+
+_IMPORTADORES = {
+    "pacientes": (
+        _linha_paciente,
+        "INSERT INTO pacientes (psicologo_id, nome, telefone, email, observacoes, foto_path, carteirinha, nome_busca, telefone_digitos) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+    ),
+    "sessoes": (
+        _linha_sessao,
+        "INSERT INTO sessoes (paciente_id, psicologo_id, data, descricao, valor_centavos, valor_unitario_centavos, tipo_receita, qtd_sessoes) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+    ),
+    "custos": (
+        _linha_custo,
+        "INSERT INTO custos (psicologo_id, descricao, valor_centavos, data, categoria) VALUES (?, ?, ?, ?, ?)",
+    ),
+}
+
+
+# ----------------------------------------------
+# IMPORTAÇÃO
+# ----------------------------------------------
+
+def importar(conn, tipo, psicologo_id, linhas, tamanho_lote=TAMANHO_LOTE, ao_progredir=None, gravar_lote=None):
+    """Importa as linhas (dicionários) e retorna o relatório:
+    {"inseridos": int, "total_erros": int, "erros": [(nº da linha no arquivo, mensagem)]}
+
+    Cada lote é gravado em uma transação própria; ao_progredir(linhas_lidas),
+    se informado, é chamado ao fim de cada lote. gravar_lote(sql, registros),
+    se informado, grava no lugar de conn (o painel usa o escritor único)."""
+    converter, sql = _IMPORTADORES[tipo]
+    contexto = ResolvedorPacientes(conn, psicologo_id) if tipo == "sessoes" else None
+    relatorio = {"inseridos": 0, "total_erros": 0, "erros": []}
+
+    numeradas = enumerate(linhas, start=2) # Linha 1 do arquivo é o cabeçalho
+    lidas = 0
+    while True:
+        lote = list(islice(numeradas, tamanho_lote))
+        if not lote:
+            break
+        lidas += len(lote)
+
+        registros = []
+        for numero, linha in lote:
+            try:
+                registros.append(converter(psicologo_id, linha, contexto))
+            except ErroLinha as e:
+                relatorio["total_erros"] += 1
+                if len(relatorio["erros"]) < MAX_ERROS_RELATORIO:
+                    relatorio["erros"].append((numero, str(e)))
+
+        if registros:
+            if gravar_lote is not None:
+                gravar_lote(sql, registros)
+            else:
+                with conn: # Um commit por lote (rollback do lote em caso de erro)
+                    conn.executemany(sql, registros)
+            relatorio["inseridos"] += len(registros)
+        if ao_progredir:
+            ao_progredir(lidas)
+
+    return relatorio
+
+def importar_arquivo(conn, tipo, psicologo_id, arquivo, nome_arquivo, **kwargs):
+    return importar(conn, tipo, psicologo_id, ler_linhas(arquivo, nome_arquivo), **kwargs)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from database import criar_conexao, inicializar_banco
+
+    parser = argparse.ArgumentParser(description="Importa pacientes, sessões ou custos de um CSV/XLSX.")
+    parser.add_argument("tipo", choices=TIPOS_IMPORTACAO)
+    parser.add_argument("arquivo")
+    parser.add_argument("--psicologo", type=int, required=True, help="ID do psicólogo dono dos dados")
+    parser.add_argument("--lote", type=int, default=TAMANHO_LOTE, help="Linhas por transação")
+    args = parser.parse_args()
+
+    inicializar_banco()
+    conn = criar_conexao(args.psicologo)
+    inicio = time.perf_counter()
+    try:
+        with open(args.arquivo, "rb") as arquivo:
+            relatorio = importar_arquivo(conn, args.tipo, args.psicologo, arquivo, args.arquivo, tamanho_lote=args.lote)
+    finally:
+        conn.close()
+
+    print(f"{relatorio['inseridos']} linhas importadas em {time.perf_counter() - inicio:.2f}s; {relatorio['total_erros']} com erro.")
+    for numero, mensagem in relatorio["erros"]:
+        print(f"    linha {numero}: {mensagem}")
@@ -1,18 +1,729 @@
-import sqlite3
-
-# Conectar ao banco de dados
-conn = sqlite3.connect("psycontrol.db")
-cursor = conn.cursor()
-
-# Adicionar coluna 'carteirinha' se ainda não existir
-try:
-    cursor.execute("ALTER TABLE pacientes ADD COLUMN carteirinha TEXT")
-    print("Coluna 'carteirinha' adicionada com sucesso.")
-except sqlite3.OperationalError as e:
-    if "duplicate column name" in str(e):
-        print("A coluna 'carteirinha' já existe.")
-    else:
+"""Migrações versionadas do esquema, controladas por PRAGMA user_version.
+
+Cada passo é aplicado uma única vez, em ordem. Para alterar o esquema,
+acrescente uma nova função ao final de MIGRACOES (nunca edite um passo já
+publicado). Pode ser executado manualmente: python migracao.py
+"""
+from contextlib import contextmanager
+
+from validacao import apenas_digitos, normalizar_nome
+
+
+def _colunas(cursor, tabela):
+    return {linha[1] for linha in cursor.execute(f"PRAGMA table_info({tabela})")}
+
+def _adicionar_coluna(cursor, tabela, coluna, tipo):
+    # Bancos antigos podem já ter a coluna (o ALTER TABLE rodava a cada execução)
+    if coluna not in _colunas(cursor, tabela):
+        cursor.execute(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {tipo}")
+
+@contextmanager
+def _sem_registro_de_alteracoes(cursor, *tabelas):
+    # Cargas de colunas novas não são alterações do psicólogo: sem isto, cada
+    # linha do backfill viraria um 'U' em alteracoes. Os triggers do registro
+    # (_m006) saem durante o bloco e voltam com a mesma definição.
+    gatilhos = []
+    for tabela in tabelas:
+        gatilhos += cursor.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = ? AND name LIKE ?",
+            (tabela, f"trg_alteracoes_{tabela}_%"),
+        ).fetchall()
+    for nome, _ in gatilhos:
+        cursor.execute(f"DROP TRIGGER {nome}")
+    yield
+    for _, sql in gatilhos:
+        cursor.execute(sql)
+
+
+def _m001_esquema_inicial(cursor):
+    # IF NOT EXISTS: bancos anteriores ao controle de versão já têm as tabelas
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS psicologos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nome TEXT NOT NULL,
+        usuario TEXT UNIQUE NOT NULL,
+        senha TEXT NOT NULL
+    );
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS pacientes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        psicologo_id INTEGER NOT NULL,
+        nome TEXT NOT NULL,
+        telefone TEXT,
+        email TEXT,
+        observacoes TEXT,
+        foto_path TEXT,
+        FOREIGN KEY (psicologo_id) REFERENCES psicologos(id)
+    );
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS sessoes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        paciente_id INTEGER NOT NULL,
+        data TEXT NOT NULL,
+        descricao TEXT NOT NULL,
+        FOREIGN KEY (paciente_id) REFERENCES pacientes(id) ON DELETE CASCADE
+    );
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS agendamentos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        paciente_id INTEGER NOT NULL,
+        data TEXT NOT NULL,
+        hora TEXT NOT NULL,
+        observacoes TEXT,
+        FOREIGN KEY (paciente_id) REFERENCES pacientes(id) ON DELETE CASCADE
+    );
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS custos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        psicologo_id INTEGER NOT NULL,
+        descricao TEXT NOT NULL,
+        valor REAL NOT NULL,
+        data TEXT NOT NULL,
+        categoria TEXT NOT NULL,
+        FOREIGN KEY (psicologo_id) REFERENCES psicologos(id) ON DELETE CASCADE
+    );
+    """)
+
+def _m002_receita_nas_sessoes(cursor):
+    _adicionar_coluna(cursor, "sessoes", "valor", "REAL")
+    _adicionar_coluna(cursor, "sessoes", "tipo_receita", "TEXT")
+    _adicionar_coluna(cursor, "sessoes", "qtd_sessoes", "INTEGER")
+
+def _m003_carteirinha(cursor):
+    # Antes era o script avulso migracao.py
+    _adicionar_coluna(cursor, "pacientes", "carteirinha", "TEXT")
+
+def _m004_indices(cursor):
+    # Toda consulta do painel filtra pelo psicólogo e junta sessões/agendamentos
+    # pelo paciente, ordenando por data (e hora)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_pacientes_psicologo ON pacientes(psicologo_id, nome)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessoes_paciente_data ON sessoes(paciente_id, data)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_agendamentos_paciente_data ON agendamentos(paciente_id, data, hora)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_custos_psicologo_data ON custos(psicologo_id, data)")
+
+def _m005_resumos_mensais(cursor):
+    # Totais mensais por psicólogo, mantidos por triggers: os KPIs e gráficos da
+    # Gestão Financeira leem poucas dezenas de linhas em vez do histórico inteiro.
+    # tipo_receita nulo (sessões antigas) é guardado como ''.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS receita_mensal (
+        psicologo_id INTEGER NOT NULL,
+        ano_mes TEXT NOT NULL,
+        tipo_receita TEXT NOT NULL,
+        total REAL NOT NULL,
+        qtd INTEGER NOT NULL,
+        PRIMARY KEY (psicologo_id, ano_mes, tipo_receita)
+    ) WITHOUT ROWID;
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS custo_mensal (
+        psicologo_id INTEGER NOT NULL,
+        ano_mes TEXT NOT NULL,
+        categoria TEXT NOT NULL,
+        total REAL NOT NULL,
+        qtd INTEGER NOT NULL,
+        PRIMARY KEY (psicologo_id, ano_mes, categoria)
+    ) WITHOUT ROWID;
+    """)
+
+    # Sessões: a receita pertence ao psicólogo do paciente
+    soma_receita = """
+        INSERT INTO receita_mensal (psicologo_id, ano_mes, tipo_receita, total, qtd)
+        SELECT psicologo_id, substr(NEW.data, 1, 7), COALESCE(NEW.tipo_receita, ''), NEW.valor, 1
+        FROM pacientes WHERE id = NEW.paciente_id AND NEW.valor IS NOT NULL
+        ON CONFLICT (psicologo_id, ano_mes, tipo_receita)
+        DO UPDATE SET total = total + excluded.total, qtd = qtd + 1;
+    """
+    subtrai_receita = """
+        UPDATE receita_mensal SET total = total - OLD.valor, qtd = qtd - 1
+        WHERE OLD.valor IS NOT NULL
+          AND psicologo_id = (SELECT psicologo_id FROM pacientes WHERE id = OLD.paciente_id)
+          AND ano_mes = substr(OLD.data, 1, 7)
+          AND tipo_receita = COALESCE(OLD.tipo_receita, '');
+    """
+    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_receita_mensal_ins AFTER INSERT ON sessoes BEGIN {soma_receita} END;")
+    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_receita_mensal_del AFTER DELETE ON sessoes BEGIN {subtrai_receita} END;")
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_receita_mensal_upd
+    AFTER UPDATE OF paciente_id, data, valor, tipo_receita ON sessoes
+    BEGIN {subtrai_receita} {soma_receita} END;
+    """)
+
+    soma_custo = """
+        INSERT INTO custo_mensal (psicologo_id, ano_mes, categoria, total, qtd)
+        VALUES (NEW.psicologo_id, substr(NEW.data, 1, 7), NEW.categoria, NEW.valor, 1)
+        ON CONFLICT (psicologo_id, ano_mes, categoria)
+        DO UPDATE SET total = total + excluded.total, qtd = qtd + 1;
+    """
+    subtrai_custo = """
+        UPDATE custo_mensal SET total = total - OLD.valor, qtd = qtd - 1
+        WHERE psicologo_id = OLD.psicologo_id
+          AND ano_mes = substr(OLD.data, 1, 7)
+          AND categoria = OLD.categoria;
+    """
+    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_custo_mensal_ins AFTER INSERT ON custos BEGIN {soma_custo} END;")
+    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_custo_mensal_del AFTER DELETE ON custos BEGIN {subtrai_custo} END;")
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_custo_mensal_upd
+    AFTER UPDATE OF psicologo_id, data, valor, categoria ON custos
+    BEGIN {subtrai_custo} {soma_custo} END;
+    """)
+
+    # Ao excluir um paciente, apaga antes as sessões e agendamentos: assim os
+    # triggers acima ainda encontram o psicólogo do paciente, e bancos antigos
+    # (criados sem ON DELETE CASCADE) não violam a chave estrangeira.
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_pacientes_apagar_dependentes BEFORE DELETE ON pacientes
+    BEGIN
+        DELETE FROM sessoes WHERE paciente_id = OLD.id;
+        DELETE FROM agendamentos WHERE paciente_id = OLD.id;
+    END;
+    """)
+
+    # Carga inicial com o histórico existente
+    cursor.execute("DELETE FROM receita_mensal")
+    cursor.execute("""
+    INSERT INTO receita_mensal (psicologo_id, ano_mes, tipo_receita, total, qtd)
+    SELECT p.psicologo_id, substr(s.data, 1, 7), COALESCE(s.tipo_receita, ''), SUM(s.valor), COUNT(*)
+    FROM sessoes s
+    JOIN pacientes p ON s.paciente_id = p.id
+    WHERE s.valor IS NOT NULL
+    GROUP BY 1, 2, 3
+    """)
+    cursor.execute("DELETE FROM custo_mensal")
+    cursor.execute("""
+    INSERT INTO custo_mensal (psicologo_id, ano_mes, categoria, total, qtd)
+    SELECT psicologo_id, substr(data, 1, 7), categoria, SUM(valor), COUNT(*)
+    FROM custos
+    GROUP BY 1, 2, 3
+    """)
+
+# Tabelas acompanhadas pelo registro de alterações -> expressão que devolve o
+# psicólogo dono da linha (sessões e agendamentos pertencem ao do paciente)
+_TABELAS_ALTERACOES_M006 = {
+    "pacientes": "{linha}.psicologo_id",
+    "sessoes": "(SELECT psicologo_id FROM pacientes WHERE id = {linha}.paciente_id)",
+    "agendamentos": "(SELECT psicologo_id FROM pacientes WHERE id = {linha}.paciente_id)",
+    "custos": "{linha}.psicologo_id",
+}
+# Séries recorrentes entram na migração 15
+_TABELAS_ALTERACOES_M015 = {
+    "series_agendamento": "{linha}.psicologo_id",
+    "excecoes_serie": "(SELECT psicologo_id FROM series_agendamento WHERE id = {linha}.serie_id)",
+}
+TABELAS_ALTERACOES = {**_TABELAS_ALTERACOES_M006, **_TABELAS_ALTERACOES_M015}
+# Coluna gravada como registro_id, quando não é `id`: as exceções não têm id
+# próprio e são registradas pela série (os dados são a lista de exceções dela)
+CHAVES_ALTERACOES = {"excecoes_serie": "serie_id"}
+
+def _registrar_alteracoes(cursor, tabela, dono):
+    # Triggers de INSERT/UPDATE/DELETE em `tabela` que gravam em alteracoes
+    novo, antigo = dono.format(linha="NEW"), dono.format(linha="OLD")
+    registrar = """
+        INSERT INTO alteracoes (psicologo_id, tabela, registro_id, operacao)
+        SELECT dono, '{tabela}', {linha}.id, '{operacao}' FROM (SELECT {dono} AS dono) WHERE dono IS NOT NULL;
+    """
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_alteracoes_{tabela}_ins AFTER INSERT ON {tabela}
+    BEGIN {registrar.format(tabela=tabela, linha="NEW", operacao="I", dono=novo)} END;
+    """)
+    # Se a linha mudou de dono, o antigo recebe um 'D' para deixar de vê-la
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_alteracoes_{tabela}_upd AFTER UPDATE ON {tabela}
+    BEGIN
+        {registrar.format(tabela=tabela, linha="NEW", operacao="U", dono=novo)}
+        INSERT INTO alteracoes (psicologo_id, tabela, registro_id, operacao)
+        SELECT dono, '{tabela}', OLD.id, 'D' FROM (SELECT {antigo} AS dono, {novo} AS novo_dono)
+        WHERE dono IS NOT NULL AND dono IS NOT novo_dono;
+    END;
+    """)
+    # Para sessões/agendamentos o paciente ainda existe aqui: ao excluir um
+    # paciente, trg_pacientes_apagar_dependentes apaga os filhos ANTES dele
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_alteracoes_{tabela}_del AFTER DELETE ON {tabela}
+    BEGIN {registrar.format(tabela=tabela, linha="OLD", operacao="D", dono=antigo)} END;
+    """)
+
+def _carga_inicial_alteracoes(cursor, tabela, dono, chave="id", operacao="I"):
+    # Quem sincroniza a partir do cursor 0 recebe todas as linhas existentes
+    cursor.execute(f"""
+    INSERT INTO alteracoes (psicologo_id, tabela, registro_id, operacao)
+    SELECT dono, '{tabela}', id, '{operacao}'
+    FROM (SELECT DISTINCT {tabela}.{chave} AS id, {dono.format(linha=tabela)} AS dono FROM {tabela} ORDER BY 1)
+    WHERE dono IS NOT NULL
+    """)
+
+def _m006_registro_alteracoes(cursor):
+    # Log só de acréscimos (change data capture): cada INSERT/UPDATE/DELETE nas
+    # tabelas do psicólogo grava (seq, tabela, id, operação). Sincronizações
+    # pedem "tudo depois do seq X" (alteracoes.py) em vez de reler as tabelas.
+    # AUTOINCREMENT garante que seq nunca é reutilizado, mesmo após podar o log.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS alteracoes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        psicologo_id INTEGER NOT NULL,
+        tabela TEXT NOT NULL,
+        registro_id INTEGER NOT NULL,
+        operacao TEXT NOT NULL CHECK (operacao IN ('I', 'U', 'D')),
+        momento TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+    );
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_alteracoes_psicologo_seq ON alteracoes(psicologo_id, seq)")
+
+    for tabela, dono in _TABELAS_ALTERACOES_M006.items():
+        _registrar_alteracoes(cursor, tabela, dono)
+    # Carga inicial: as linhas existentes entram como inserções
+    for tabela, dono in _TABELAS_ALTERACOES_M006.items():
+        _carga_inicial_alteracoes(cursor, tabela, dono)
+
+def _m007_tokens_sessao(cursor):
+    # Sessões de login persistentes (ver autenticacao.py): guardamos só o SHA-256
+    # do token; o token em si fica com o navegador
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS tokens_sessao (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        psicologo_id INTEGER NOT NULL,
+        token_hash TEXT NOT NULL UNIQUE,
+        criado_em INTEGER NOT NULL,
+        expira_em INTEGER NOT NULL,
+        revogado INTEGER NOT NULL DEFAULT 0,
+        FOREIGN KEY (psicologo_id) REFERENCES psicologos(id) ON DELETE CASCADE
+    );
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tokens_sessao_psicologo ON tokens_sessao(psicologo_id)")
+
+# Busca textual (FTS5) -> (tabela de origem, coluna de texto, expressão do dono).
+# O dono entra no índice como o termo 'p<id>': a busca de um psicólogo cruza
+# as listas de termos dentro do próprio FTS, sem filtrar depois as notas dos outros.
+INDICES_BUSCA = {
+    "sessoes_busca": ("sessoes", "descricao", "(SELECT psicologo_id FROM pacientes WHERE id = {linha}.paciente_id)"),
+    "pacientes_busca": ("pacientes", "observacoes", "{linha}.psicologo_id"),
+}
+
+def _m008_busca_textual(cursor):
+    # Índices "external content": o texto fica só na tabela original; o FTS
+    # guarda o índice invertido e lê o conteúdo (para snippet) pela view.
+    # remove_diacritics: "ansiedade" encontra "Ansiedade" e "sessao" encontra "sessão".
+    for indice, (tabela, coluna, dono) in INDICES_BUSCA.items():
+        dono_da = lambda linha: f"'p' || {dono.format(linha=linha)}"
+        cursor.execute(f"""
+        CREATE VIEW IF NOT EXISTS {indice}_conteudo AS
+        SELECT id, {coluna} AS texto, {dono_da(tabela)} AS dono FROM {tabela}
+        """)
+        cursor.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {indice} USING fts5(
+            texto, dono,
+            content='{indice}_conteudo', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+        """)
+        # ORDER BY rank: bm25 só sobre o texto (o termo do dono está em toda linha)
+        cursor.execute(f"INSERT INTO {indice} ({indice}, rank) VALUES ('rank', 'bm25(1.0, 0.0)')")
+
+        # Com external content, o 'delete' precisa dos MESMOS valores indexados
+        inserir = f"INSERT INTO {indice} (rowid, texto, dono) VALUES (NEW.id, NEW.{coluna}, {dono_da('NEW')});"
+        remover = f"INSERT INTO {indice} ({indice}, rowid, texto, dono) VALUES ('delete', OLD.id, OLD.{coluna}, {dono_da('OLD')});"
+        origem_dono = "paciente_id" if tabela == "sessoes" else "psicologo_id"
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{indice}_ins AFTER INSERT ON {tabela} BEGIN {inserir} END;")
+        # Sessões: o paciente ainda existe aqui (trg_pacientes_apagar_dependentes
+        # apaga os filhos antes do paciente)
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{indice}_del AFTER DELETE ON {tabela} BEGIN {remover} END;")
+        cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{indice}_upd AFTER UPDATE OF {coluna}, {origem_dono} ON {tabela}
+        BEGIN {remover} {inserir} END;
+        """)
+
+    # Paciente transferido para outro psicólogo: as notas das sessões mudam de dono
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_sessoes_busca_dono AFTER UPDATE OF psicologo_id ON pacientes
+    WHEN OLD.psicologo_id IS NOT NEW.psicologo_id
+    BEGIN
+        INSERT INTO sessoes_busca (sessoes_busca, rowid, texto, dono)
+        SELECT 'delete', id, descricao, 'p' || OLD.psicologo_id FROM sessoes WHERE paciente_id = NEW.id;
+        INSERT INTO sessoes_busca (rowid, texto, dono)
+        SELECT id, descricao, 'p' || NEW.psicologo_id FROM sessoes WHERE paciente_id = NEW.id;
+    END;
+    """)
+
+    # Carga inicial com os textos existentes
+    for indice in INDICES_BUSCA:
+        cursor.execute(f"INSERT INTO {indice} ({indice}) VALUES ('rebuild')")
+
+
+# Reserva em SQL puro para linhas gravadas sem as colunas de busca (ex.: pelo
+# sqlite3 da linha de comando): lower() não tira acentos, mas o paciente ao
+# menos aparece no seletor. O aplicativo sempre grava os valores do Python.
+_NOME_BUSCA_SQL = "lower(trim(NEW.nome))"
+_TELEFONE_DIGITOS_SQL = "replace(replace(replace(replace(replace(replace(NEW.telefone, ' ', ''), '(', ''), ')', ''), '-', ''), '.', ''), '+', '')"
+
+def _m009_busca_pacientes(cursor):
+    # Seletor de pacientes por prefixo: nome sem acentos/minúsculo e telefone só
+    # com dígitos, indexados por psicólogo (carteirinha já é texto de dígitos)
+    _adicionar_coluna(cursor, "pacientes", "nome_busca", "TEXT")
+    _adicionar_coluna(cursor, "pacientes", "telefone_digitos", "TEXT")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_pacientes_nome_busca ON pacientes(psicologo_id, nome_busca)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_pacientes_telefone_digitos ON pacientes(psicologo_id, telefone_digitos)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_pacientes_carteirinha ON pacientes(psicologo_id, carteirinha)")
+
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_pacientes_colunas_busca_ins AFTER INSERT ON pacientes
+    WHEN NEW.nome_busca IS NULL OR NEW.telefone_digitos IS NULL
+    BEGIN
+        UPDATE pacientes SET nome_busca = COALESCE(NEW.nome_busca, {_NOME_BUSCA_SQL}),
+                             telefone_digitos = COALESCE(NEW.telefone_digitos, {_TELEFONE_DIGITOS_SQL})
+        WHERE id = NEW.id;
+    END;
+    """)
+    # Nome/telefone alterados sem atualizar as colunas de busca
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_pacientes_colunas_busca_upd AFTER UPDATE OF nome, telefone ON pacientes
+    WHEN NEW.nome_busca IS OLD.nome_busca AND NEW.telefone_digitos IS OLD.telefone_digitos
+    BEGIN
+        UPDATE pacientes SET nome_busca = {_NOME_BUSCA_SQL}, telefone_digitos = {_TELEFONE_DIGITOS_SQL}
+        WHERE id = NEW.id;
+    END;
+    """)
+
+    # Carga inicial, normalizada em Python (o SQLite não remove acentos)
+    linhas = cursor.execute("SELECT id, nome, telefone FROM pacientes").fetchall()
+    with _sem_registro_de_alteracoes(cursor, "pacientes"):
+        cursor.executemany(
+            "UPDATE pacientes SET nome_busca = ?, telefone_digitos = ? WHERE id = ?",
+            [(normalizar_nome(nome), apenas_digitos(telefone), id_pac) for id_pac, nome, telefone in linhas],
+        )
+
+def _m010_inicio_agendamentos(cursor):
+    # Agenda por faixa de horário: início normalizado ('AAAA-MM-DD HH:MM'),
+    # duração e o psicólogo (copiado do paciente) na própria linha, para que
+    # semana/mês/conflitos sejam uma faixa em (psicologo_id, inicio) sem JOIN.
+    # data e hora continuam gravadas (exportação, lista de pacientes).
+    _adicionar_coluna(cursor, "agendamentos", "inicio", "TEXT")
+    _adicionar_coluna(cursor, "agendamentos", "duracao_min", "INTEGER NOT NULL DEFAULT 50")
+    _adicionar_coluna(cursor, "agendamentos", "psicologo_id", "INTEGER")
+    with _sem_registro_de_alteracoes(cursor, "agendamentos"):
+        cursor.execute("""
+        UPDATE agendamentos SET
+            inicio = data || ' ' || hora,
+            psicologo_id = (SELECT psicologo_id FROM pacientes WHERE id = agendamentos.paciente_id)
+        """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_agendamentos_psicologo_inicio ON agendamentos(psicologo_id, inicio)")
+
+    # Reserva para gravações que só informam data/hora/paciente (o aplicativo
+    # grava tudo de uma vez, ver agenda.agendar)
+    completar = """
+        UPDATE agendamentos SET
+            inicio = NEW.data || ' ' || NEW.hora,
+            psicologo_id = (SELECT psicologo_id FROM pacientes WHERE id = NEW.paciente_id)
+        WHERE id = NEW.id;
+    """
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_agendamentos_inicio_ins AFTER INSERT ON agendamentos
+    WHEN NEW.inicio IS NULL OR NEW.psicologo_id IS NULL
+    BEGIN {completar} END;
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_agendamentos_inicio_upd AFTER UPDATE OF data, hora, paciente_id ON agendamentos
+    WHEN NEW.inicio IS NOT NEW.data || ' ' || NEW.hora OR NEW.paciente_id IS NOT OLD.paciente_id
+    BEGIN {completar} END;
+    """)
+    # Paciente transferido: os agendamentos vão junto
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_agendamentos_psicologo_upd AFTER UPDATE OF psicologo_id ON pacientes
+    WHEN OLD.psicologo_id IS NOT NEW.psicologo_id
+    BEGIN
+        UPDATE agendamentos SET psicologo_id = NEW.psicologo_id WHERE paciente_id = NEW.id;
+    END;
+    """)
+
+def _m011_series_agendamento(cursor):
+    # Agendamentos recorrentes guardados como UMA regra; as ocorrências são
+    # calculadas só para o período exibido (agenda.py). Uma ocorrência cancelada
+    # ou remarcada vira uma linha em excecoes_serie, nunca a série inteira.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS series_agendamento (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        psicologo_id INTEGER NOT NULL,
+        paciente_id INTEGER NOT NULL,
+        regra TEXT NOT NULL CHECK (regra IN ('semanal', 'quinzenal', 'mensal')),
+        data_inicio TEXT NOT NULL,
+        data_fim TEXT,
+        hora TEXT NOT NULL,
+        duracao_min INTEGER NOT NULL DEFAULT 50,
+        observacoes TEXT,
+        FOREIGN KEY (psicologo_id) REFERENCES psicologos(id) ON DELETE CASCADE,
+        FOREIGN KEY (paciente_id) REFERENCES pacientes(id) ON DELETE CASCADE
+    );
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_series_psicologo_inicio ON series_agendamento(psicologo_id, data_inicio)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_series_paciente ON series_agendamento(paciente_id)")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS excecoes_serie (
+        serie_id INTEGER NOT NULL,
+        data_original TEXT NOT NULL,
+        cancelada INTEGER NOT NULL DEFAULT 0,
+        novo_inicio TEXT,
+        duracao_min INTEGER,
+        PRIMARY KEY (serie_id, data_original),
+        FOREIGN KEY (serie_id) REFERENCES series_agendamento(id) ON DELETE CASCADE
+    ) WITHOUT ROWID;
+    """)
+    # Paciente transferido: as séries acompanham, como os agendamentos avulsos
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_series_psicologo_upd AFTER UPDATE OF psicologo_id ON pacientes
+    WHEN OLD.psicologo_id IS NOT NEW.psicologo_id
+    BEGIN
+        UPDATE series_agendamento SET psicologo_id = NEW.psicologo_id WHERE paciente_id = NEW.id;
+    END;
+    """)
+
+
+def _m012_valores_em_centavos(cursor):
+    # Dinheiro em centavos inteiros: somas exatas (sem resíduo de ponto
+    # flutuante) e feitas pelo próprio SQLite. A sessão passa a guardar também o
+    # valor unitário; o antigo é o total dividido pela quantidade.
+    for gatilho in ("trg_receita_mensal_ins", "trg_receita_mensal_del", "trg_receita_mensal_upd",
+                    "trg_custo_mensal_ins", "trg_custo_mensal_del", "trg_custo_mensal_upd"):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {gatilho}")
+
+    _adicionar_coluna(cursor, "sessoes", "valor_centavos", "INTEGER")
+    _adicionar_coluna(cursor, "sessoes", "valor_unitario_centavos", "INTEGER")
+    _adicionar_coluna(cursor, "custos", "valor_centavos", "INTEGER NOT NULL DEFAULT 0")
+    with _sem_registro_de_alteracoes(cursor, "sessoes", "custos"):
+        cursor.execute("""
+        UPDATE sessoes SET
+            valor_centavos = CAST(ROUND(valor * 100) AS INTEGER),
+            valor_unitario_centavos = CAST(ROUND(valor * 100 / MAX(COALESCE(qtd_sessoes, 1), 1)) AS INTEGER)
+        WHERE valor IS NOT NULL
+        """)
+        cursor.execute("UPDATE custos SET valor_centavos = CAST(ROUND(valor * 100) AS INTEGER)")
+    # As colunas REAL saem (DROP COLUMN, SQLite 3.35+): nada mais grava nelas
+    cursor.execute("ALTER TABLE sessoes DROP COLUMN valor")
+    cursor.execute("ALTER TABLE custos DROP COLUMN valor")
+
+    # Resumos mensais recriados em centavos
+    cursor.execute("DROP TABLE IF EXISTS receita_mensal")
+    cursor.execute("DROP TABLE IF EXISTS custo_mensal")
+    cursor.execute("""
+    CREATE TABLE receita_mensal (
+        psicologo_id INTEGER NOT NULL,
+        ano_mes TEXT NOT NULL,
+        tipo_receita TEXT NOT NULL,
+        total_centavos INTEGER NOT NULL,
+        qtd INTEGER NOT NULL,
+        PRIMARY KEY (psicologo_id, ano_mes, tipo_receita)
+    ) WITHOUT ROWID;
+    """)
+    cursor.execute("""
+    CREATE TABLE custo_mensal (
+        psicologo_id INTEGER NOT NULL,
+        ano_mes TEXT NOT NULL,
+        categoria TEXT NOT NULL,
+        total_centavos INTEGER NOT NULL,
+        qtd INTEGER NOT NULL,
+        PRIMARY KEY (psicologo_id, ano_mes, categoria)
+    ) WITHOUT ROWID;
+    """)
+
+    soma_receita = """
+        INSERT INTO receita_mensal (psicologo_id, ano_mes, tipo_receita, total_centavos, qtd)
+        SELECT psicologo_id, substr(NEW.data, 1, 7), COALESCE(NEW.tipo_receita, ''), NEW.valor_centavos, 1
+        FROM pacientes WHERE id = NEW.paciente_id AND NEW.valor_centavos IS NOT NULL
+        ON CONFLICT (psicologo_id, ano_mes, tipo_receita)
+        DO UPDATE SET total_centavos = total_centavos + excluded.total_centavos, qtd = qtd + 1;
+    """
+    subtrai_receita = """
+        UPDATE receita_mensal SET total_centavos = total_centavos - OLD.valor_centavos, qtd = qtd - 1
+        WHERE OLD.valor_centavos IS NOT NULL
+          AND psicologo_id = (SELECT psicologo_id FROM pacientes WHERE id = OLD.paciente_id)
+          AND ano_mes = substr(OLD.data, 1, 7)
+          AND tipo_receita = COALESCE(OLD.tipo_receita, '');
+    """
+    cursor.execute(f"CREATE TRIGGER trg_receita_mensal_ins AFTER INSERT ON sessoes BEGIN {soma_receita} END;")
+    cursor.execute(f"CREATE TRIGGER trg_receita_mensal_del AFTER DELETE ON sessoes BEGIN {subtrai_receita} END;")
+    cursor.execute(f"""
+    CREATE TRIGGER trg_receita_mensal_upd
+    AFTER UPDATE OF paciente_id, data, valor_centavos, tipo_receita ON sessoes
+    BEGIN {subtrai_receita} {soma_receita} END;
+    """)
+
+    soma_custo = """
+        INSERT INTO custo_mensal (psicologo_id, ano_mes, categoria, total_centavos, qtd)
+        VALUES (NEW.psicologo_id, substr(NEW.data, 1, 7), NEW.categoria, NEW.valor_centavos, 1)
+        ON CONFLICT (psicologo_id, ano_mes, categoria)
+        DO UPDATE SET total_centavos = total_centavos + excluded.total_centavos, qtd = qtd + 1;
+    """
+    subtrai_custo = """
+        UPDATE custo_mensal SET total_centavos = total_centavos - OLD.valor_centavos, qtd = qtd - 1
+        WHERE psicologo_id = OLD.psicologo_id
+          AND ano_mes = substr(OLD.data, 1, 7)
+          AND categoria = OLD.categoria;
+    """
+    cursor.execute(f"CREATE TRIGGER trg_custo_mensal_ins AFTER INSERT ON custos BEGIN {soma_custo} END;")
+    cursor.execute(f"CREATE TRIGGER trg_custo_mensal_del AFTER DELETE ON custos BEGIN {subtrai_custo} END;")
+    cursor.execute(f"""
+    CREATE TRIGGER trg_custo_mensal_upd
+    AFTER UPDATE OF psicologo_id, data, valor_centavos, categoria ON custos
+    BEGIN {subtrai_custo} {soma_custo} END;
+    """)
+
+    cursor.execute("""
+    INSERT INTO receita_mensal (psicologo_id, ano_mes, tipo_receita, total_centavos, qtd)
+    SELECT p.psicologo_id, substr(s.data, 1, 7), COALESCE(s.tipo_receita, ''), SUM(s.valor_centavos), COUNT(*)
+    FROM sessoes s
+    JOIN pacientes p ON s.paciente_id = p.id
+    WHERE s.valor_centavos IS NOT NULL
+    GROUP BY 1, 2, 3
+    """)
+    cursor.execute("""
+    INSERT INTO custo_mensal (psicologo_id, ano_mes, categoria, total_centavos, qtd)
+    SELECT psicologo_id, substr(data, 1, 7), categoria, SUM(valor_centavos), COUNT(*)
+    FROM custos
+    GROUP BY 1, 2, 3
+    """)
+
+def _m013_psicologo_nas_sessoes(cursor):
+    # Histórico do psicólogo em ordem (data, id) direto do índice, como a agenda
+    # em _m010: com o psicólogo (copiado do paciente) na própria sessão, cada
+    # página é uma descida em idx_sessoes_psicologo_data que para no LIMIT, sem
+    # JOIN para filtrar e sem ordenar todas as sessões do período.
+    _adicionar_coluna(cursor, "sessoes", "psicologo_id", "INTEGER")
+    with _sem_registro_de_alteracoes(cursor, "sessoes"):
+        cursor.execute("UPDATE sessoes SET psicologo_id = (SELECT psicologo_id FROM pacientes WHERE id = sessoes.paciente_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessoes_psicologo_data ON sessoes(psicologo_id, data)")
+
+    # Reserva para gravações que não informam o psicólogo (o aplicativo grava)
+    completar = """
+        UPDATE sessoes SET psicologo_id = (SELECT psicologo_id FROM pacientes WHERE id = NEW.paciente_id)
+        WHERE id = NEW.id;
+    """
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_sessoes_psicologo_ins AFTER INSERT ON sessoes
+    WHEN NEW.psicologo_id IS NULL
+    BEGIN {completar} END;
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_sessoes_psicologo_upd AFTER UPDATE OF paciente_id ON sessoes
+    WHEN NEW.paciente_id IS NOT OLD.paciente_id
+    BEGIN {completar} END;
+    """)
+    # Paciente transferido: as sessões vão junto
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_sessoes_psicologo_paciente_upd AFTER UPDATE OF psicologo_id ON pacientes
+    WHEN OLD.psicologo_id IS NOT NEW.psicologo_id
+    BEGIN
+        UPDATE sessoes SET psicologo_id = NEW.psicologo_id WHERE paciente_id = NEW.id;
+    END;
+    """)
+
+def _m014_colunas_derivadas_no_insert(cursor):
+    # As reservas AFTER INSERT de _m009/_m010/_m013 completavam a linha com um
+    # UPDATE, que o registro de alterações gravava como 'U' ANTES do 'I' da
+    # própria linha. Um BEFORE INSERT não pode alterar NEW no SQLite, então as
+    # colunas derivadas passam a ser obrigatórias no INSERT (todo o aplicativo,
+    # a importação e o gerador de dados já as gravam).
+    obrigatorias = {
+        "trg_pacientes_colunas_busca_ins": (
+            "pacientes", "NEW.nome_busca IS NULL OR NEW.telefone_digitos IS NULL",
+            "pacientes: informe nome_busca e telefone_digitos",
+        ),
+        "trg_agendamentos_inicio_ins": (
+            "agendamentos", "NEW.inicio IS NULL OR NEW.psicologo_id IS NULL",
+            "agendamentos: informe inicio e psicologo_id",
+        ),
+        "trg_sessoes_psicologo_ins": (
+            "sessoes", "NEW.psicologo_id IS NULL",
+            "sessoes: informe psicologo_id",
+        ),
+    }
+    for gatilho, (tabela, faltando, mensagem) in obrigatorias.items():
+        cursor.execute(f"DROP TRIGGER IF EXISTS {gatilho}")
+        cursor.execute(f"""
+        CREATE TRIGGER {gatilho} BEFORE INSERT ON {tabela}
+        WHEN {faltando}
+        BEGIN SELECT RAISE(ABORT, '{mensagem}'); END;
+        """)
+
+def _m015_alteracoes_das_series(cursor):
+    # Séries e exceções (migração 11) no registro de alterações, como as demais
+    # tabelas do psicólogo. Qualquer mudança nas exceções de uma série grava um
+    # 'U' com registro_id = serie_id: quem sincroniza relê a lista inteira.
+    dono, dono_excecao = _TABELAS_ALTERACOES_M015["series_agendamento"], _TABELAS_ALTERACOES_M015["excecoes_serie"]
+    _registrar_alteracoes(cursor, "series_agendamento", dono)
+    registrar_excecao = """
+        INSERT INTO alteracoes (psicologo_id, tabela, registro_id, operacao)
+        SELECT dono, 'excecoes_serie', {linha}.serie_id, 'U' FROM (SELECT {dono} AS dono) WHERE dono IS NOT NULL;
+    """
+    for evento, linha in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+        cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_alteracoes_excecoes_serie_{evento[:3].lower()} AFTER {evento} ON excecoes_serie
+        BEGIN {registrar_excecao.format(linha=linha, dono=dono_excecao.format(linha=linha))} END;
+        """)
+    _carga_inicial_alteracoes(cursor, "series_agendamento", dono)
+    _carga_inicial_alteracoes(cursor, "excecoes_serie", dono_excecao, chave="serie_id", operacao="U")
+
+
+# Ordem importa: a versão do banco é a quantidade de passos já aplicados
+MIGRACOES = [
+    _m001_esquema_inicial,
+    _m002_receita_nas_sessoes,
+    _m003_carteirinha,
+    _m004_indices,
+    _m005_resumos_mensais,
+    _m006_registro_alteracoes,
+    _m007_tokens_sessao,
+    _m008_busca_textual,
+    _m009_busca_pacientes,
+    _m010_inicio_agendamentos,
+    _m011_series_agendamento,
+    _m012_valores_em_centavos,
+    _m013_psicologo_nas_sessoes,
+    _m014_colunas_derivadas_no_insert,
+    _m015_alteracoes_das_series,
+]
+
+VERSAO_ATUAL = len(MIGRACOES)
+
+
+def versao_do_banco(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def aplicar_migracoes(conn):
+    """Aplica os passos pendentes em uma única transação. Retorna a lista aplicada."""
+    if versao_do_banco(conn) >= VERSAO_ATUAL:
+        return [] # Caminho comum: nada a fazer, nenhum lock de escrita
+
+    cursor = conn.cursor()
+    # IMMEDIATE pega o lock de escrita já no início: se dois processos sobem juntos,
+    # o segundo espera e relê a versão, sem reaplicar passos
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        versao = versao_do_banco(conn)
+        pendentes = MIGRACOES[versao:]
+        for passo in pendentes:
+            passo(cursor)
+        # PRAGMA não aceita parâmetros; VERSAO_ATUAL é sempre um int
+        cursor.execute(f"PRAGMA user_version = {VERSAO_ATUAL:d}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
         raise
+    return [passo.__name__ for passo in pendentes]
+
+
+if __name__ == "__main__":
+    from database import criar_conexao
 
-conn.commit()
-conn.close()
+    conn = criar_conexao()
+    try:
+        aplicados = aplicar_migracoes(conn)
+        if aplicados:
+            print(f"Migrações aplicadas: {', '.join(aplicados)}")
+        else:
+            print("Banco já está atualizado.")
+        print(f"Versão do esquema: {versao_do_banco(conn)}")
+    finally:
+        conn.close()
@@ -0,0 +1,36 @@
+"""Valores em dinheiro. Desde a migração 12 o banco guarda centavos inteiros.
+
+Os formulários e a importação convertem reais -> centavos aqui, uma vez, sem
+passar por soma de floats; totais são SUM de inteiros no SQLite, e a tela só
+formata o resultado.
+"""
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+
+def para_centavos(valor):
+    """Reais (float do st.number_input, int, Decimal ou texto '1234.56') -> centavos (int).
+
+    Meio centavo arredonda para cima. ValueError se o texto não for um número."""
+    if valor is None:
+        return None
+    try:
+        reais = Decimal(str(valor)) # str(): 0.1 vira Decimal('0.1'), não 0.1000000000000000055...
+    except InvalidOperation:
+        raise ValueError(f"valor inválido: '{valor}'")
+    if not reais.is_finite():
+        raise ValueError(f"valor inválido: '{valor}'")
+    return int((reais * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def dividir(centavos, partes):
+    # Parte de um total (ex.: valor unitário de um pacote), meio centavo para cima
+    return (2 * centavos + partes) // (2 * partes)
+
+def para_reais(centavos):
+    # Só para gráficos e exportação; contas continuam em centavos
+    return None if centavos is None else centavos / 100
+
+def formatar(centavos):
+    """12345678 -> 'R$ 123.456,78' (aritmética inteira, sem float)."""
+    sinal = "-" if centavos < 0 else ""
+    reais, resto = divmod(abs(int(centavos)), 100)
+    return f"{sinal}R$ {reais:,}".replace(",", ".") + f",{resto:02d}"
@@ -1,46 +1,182 @@
 import streamlit as st
 import sqlite3
 import os
-import re # Para validação de email/telefone
 import pandas as pd # Necessário instalar: pip install pandas
-from datetime import datetime
-from database import criar_conexao
+from datetime import datetime, timedelta
+import database
+from database import conexao, iniciar_coleta, encerrar_coleta
+import consultas
+import cache
+import importacao
+import exportacao
+import agenda
+import autenticacao
+import escrita
+import moeda
+import quadros
+from validacao import validar_email, validar_telefone, normalizar_nome, apenas_digitos # Também usadas pela importação
 
 st.set_page_config(page_title="Painel do Psicólogo", page_icon="🧠", layout="wide")
 
-# Verifica se está logado e, se não, redireciona.
-if "logado" not in st.session_state or not st.session_state["logado"]:
+# Verifica se está logado (ou se a URL traz um token de sessão válido, caso de
+# recarregar a página/abrir outra aba) e, se não, redireciona.
+# Com o login já feito, renovar_sessao estende a validade do token (e derruba a
+# sessão se ele foi revogado, ex.: "Sair de todos os dispositivos").
+if not autenticacao.restaurar_sessao(st.session_state, st.query_params) or not autenticacao.renovar_sessao(st.session_state):
     # st.warning("Acesso restrito. Por favor, faça login primeiro.")
     st.switch_page("Home.py") # Redireciona para o Home.py se não estiver logado
     st.stop()
 
+# Mantém o token na URL (a troca de página o remove): um F5 não pede login de
+# novo. É um token de uso único e validade curta (ver autenticacao.py): ao ser
+# restaurado, a URL recebe outro e o antigo deixa de valer.
+token_sessao = st.session_state.get("token_sessao")
+if token_sessao and st.query_params.get(autenticacao.PARAMETRO_SESSAO) != token_sessao:
+    st.query_params[autenticacao.PARAMETRO_SESSAO] = token_sessao
 
-# Variáveis de sessão do Psicólogo
+
+# Variáveis de sessão do Psicólogo. Com PSYCONTROL_SHARDS, conexao(PSICOLOGO_ID)
+# abre o arquivo deste psicólogo; sem o modo fragmentado, o banco único.
 PSICOLOGO_ID = st.session_state['psicologo_id']
 NOME_PSICOLOGO = st.session_state['nome_psicologo']
 
 #st.title(f"👋 Bem-vindo(a), Dr(a). {NOME_PSICOLOGO}")
 
+# Classificações de receita oferecidas no cadastro e no filtro do histórico
+TIPOS_RECEITA = ["Particular", "Convênio - Plano A", "Convênio - Plano B", "Outros"]
+
 # ----------------------------------------------
 # 1. FUNÇÕES AUXILIARES DE VALIDAÇÃO E DB
 # ----------------------------------------------
 
-def validar_email(email):
-    # Regex simples para validar formato de email
-    return re.match(r"[^@]+@[^@]+\.[^@]+", email)
-
-def validar_telefone(telefone):
-    # Regex para validar telefone com 10 ou 11 dígitos, aceitando ( ) - e espaços
-    telefone_limpo = re.sub(r'\D', '', telefone)
-    return len(telefone_limpo) >= 10 and len(telefone_limpo) <= 11
+# ----------------------------------------------
+# CARREGADORES DE DADOS (EM CACHE)
+# ----------------------------------------------
+# O cache é por psicólogo e só é descartado quando há escrita: toda inserção ou
+# exclusão abaixo chama cache.invalidar(PSICOLOGO_ID). Erros não ficam em cache.
+
+@cache.em_cache
+def carregar_seletor_pacientes(psicologo_id, termo):
+    with conexao(psicologo_id) as conn:
+        return consultas.buscar_pacientes_seletor(conn, psicologo_id, termo)
+
+@cache.em_cache
+def carregar_total_pacientes(psicologo_id, busca):
+    with conexao(psicologo_id) as conn:
+        return consultas.contar_pacientes(conn, psicologo_id, busca)
+
+@cache.em_cache
+def carregar_pagina_pacientes(psicologo_id, busca, ordenacao, pagina):
+    with conexao(psicologo_id) as conn:
+        return consultas.buscar_pagina_pacientes(conn, psicologo_id, busca, ordenacao, pagina)
+
+@cache.em_cache
+def carregar_observacoes_paciente(psicologo_id, id_pac):
+    with conexao(psicologo_id) as conn:
+        linha = conn.execute(consultas.SQL_OBSERVACOES_PACIENTE, (id_pac, psicologo_id)).fetchone()
+    return linha[0] if linha else None
+
+@cache.em_cache
+def carregar_primeira_data_sessao(psicologo_id):
+    with conexao(psicologo_id) as conn:
+        return conn.execute(consultas.SQL_PRIMEIRA_DATA_SESSAO, (psicologo_id,)).fetchone()[0]
+
+@cache.em_cache
+def carregar_historico_sessoes(psicologo_id, cursor, **filtros):
+    # Retorna (total, linhas da página, próximo cursor)
+    with conexao(psicologo_id) as conn:
+        total = consultas.contar_sessoes(conn, psicologo_id, **filtros)
+        pagina, proximo_cursor = consultas.buscar_pagina_sessoes(conn, psicologo_id, cursor=cursor, **filtros)
+    return total, pagina, proximo_cursor
+
+@cache.em_cache
+def carregar_descricao_sessao(psicologo_id, id_sessao):
+    with conexao(psicologo_id) as conn:
+        linha = conn.execute(consultas.SQL_DESCRICAO_SESSAO, (id_sessao, psicologo_id)).fetchone()
+    return linha[0] if linha else None
+
+@cache.em_cache
+def carregar_busca_textual(psicologo_id, texto, origem, pagina):
+    # Retorna (linhas da página, há próxima página)
+    with conexao(psicologo_id) as conn:
+        return consultas.buscar_textos(conn, psicologo_id, texto, origem, pagina)
+
+@cache.em_cache
+def carregar_agendamentos_futuros(psicologo_id, hoje):
+    # 'hoje' entra na chave para o cache virar junto com o dia. Avulsos e
+    # ocorrências das séries, no formato de agenda.buscar_periodo
+    with conexao(psicologo_id) as conn:
+        return agenda.proximos_agendamentos(conn, psicologo_id, hoje)
+
+@cache.em_cache
+def carregar_agenda_periodo(psicologo_id, de, ate):
+    with conexao(psicologo_id) as conn:
+        return agenda.buscar_periodo(conn, psicologo_id, de, ate)
+
+@cache.em_cache
+def carregar_horarios_livres(psicologo_id, dia, duracao_min):
+    with conexao(psicologo_id) as conn:
+        return agenda.horarios_livres(conn, psicologo_id, dia, duracao_min)
+
+@cache.em_cache
+def carregar_series_ativas(psicologo_id, hoje):
+    with conexao(psicologo_id) as conn:
+        return agenda.series_ativas(conn, psicologo_id, hoje)
+
+@cache.em_cache
+def carregar_proximas_ocorrencias(psicologo_id, serie_id, a_partir):
+    with conexao(psicologo_id) as conn:
+        return agenda.proximas_ocorrencias(conn, psicologo_id, serie_id, a_partir)
+
+@cache.em_cache
+def carregar_resumo_financeiro(psicologo_id):
+    # Totais, meses e categorias já somados pelo SQLite, em centavos inteiros
+    with conexao(psicologo_id) as conn:
+        totais = conn.execute(consultas.SQL_TOTAIS_FINANCEIROS, (psicologo_id, psicologo_id)).fetchone()
+        mensal = conn.execute(consultas.SQL_FINANCEIRO_MENSAL, (psicologo_id, psicologo_id)).fetchall()
+        por_categoria = conn.execute(consultas.SQL_CUSTOS_POR_CATEGORIA, (psicologo_id,)).fetchall()
+    return totais, mensal, por_categoria
+
+@cache.em_cache
+def carregar_transacoes(psicologo_id):
+    # Uma única conexão (do pool) para as duas consultas. Os DataFrames ficam
+    # em cache por sessão: só as colunas da tabela, com tipos compactos (quadros.py)
+    with conexao(psicologo_id) as conn:
+        df_custos = quadros.ler_custos(conn, psicologo_id)
+        df_receita = quadros.ler_receita(conn, psicologo_id) # Com o nome do paciente
+    return df_custos, df_receita
 
-def get_pacientes():
-    conn = criar_conexao()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, nome FROM pacientes WHERE psicologo_id = ?", (PSICOLOGO_ID,))
-    pacientes = cursor.fetchall()
-    conn.close()
-    return {id: nome for id, nome in pacientes}
+def seletor_paciente(chave, rotulo="Paciente*", opcao_vazia="", onde=st):
+    """Busca + selectbox com as primeiras correspondências (nome sem acentos,
+    telefone ou carteirinha). Retorna (paciente_id, nome) ou (None, None)."""
+    termo = onde.text_input(
+        "🔍 Buscar paciente",
+        placeholder="Nome, telefone ou carteirinha",
+        key=f"{chave}_busca",
+    )
+    encontrados = carregar_seletor_pacientes(PSICOLOGO_ID, termo.strip())
+    nomes = {id_pac: nome for id_pac, nome, _telefone, _carteirinha in encontrados}
+    # O rótulo mostra telefone/carteirinha: nomes repetidos continuam distinguíveis
+    rotulos = {
+        id_pac: " · ".join(parte for parte in (nome, telefone, carteirinha) if parte)
+        for id_pac, nome, telefone, carteirinha in encontrados
+    }
+    paciente_id = onde.selectbox(
+        rotulo,
+        [None] + list(rotulos),
+        format_func=lambda id_pac: opcao_vazia if id_pac is None else rotulos[id_pac],
+        # Chave fixa por seção: a lista muda a cada busca/invalidação do cache, e
+        # sem key o Streamlit criaria outro widget (e perderia a escolha)
+        key=f"{chave}_paciente",
+    )
+    if not encontrados:
+        onde.caption("Nenhum paciente encontrado.")
+    elif len(encontrados) == consultas.LIMITE_SELETOR_PACIENTES:
+        onde.caption("Mostrando as primeiras correspondências; digite mais para refinar.")
+    return paciente_id, nomes.get(paciente_id)
+
+def tem_pacientes():
+    return carregar_total_pacientes(PSICOLOGO_ID, "") > 0
 
 # ----------------------------------------------
 # 2. FUNCIONALIDADES DO PAINEL
@@ -81,37 +217,77 @@ def cadastrar_paciente():
             # Código para salvar foto foi omitido, use 'foto_path = None'
 
             try:
-                conn = criar_conexao()
-                cursor = conn.cursor()
-                cursor.execute(
-                    "INSERT INTO pacientes (psicologo_id, nome, telefone, email, observacoes, foto_path, carteirinha) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                    (PSICOLOGO_ID, nome, telefone, email, observacoes, foto_path, carteirinha)
+                escrita.executar(
+                    PSICOLOGO_ID,
+                    "INSERT INTO pacientes (psicologo_id, nome, telefone, email, observacoes, foto_path, carteirinha, nome_busca, telefone_digitos) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (PSICOLOGO_ID, nome, telefone, email, observacoes, foto_path, carteirinha,
+                     normalizar_nome(nome), apenas_digitos(telefone))
                 )
-                conn.commit()
-                conn.close()
+                cache.invalidar(PSICOLOGO_ID)
                 st.success(f"Paciente **{nome}** cadastrado com sucesso!")
             except Exception as e:
                 st.error(f"Erro ao salvar: {e}")
 
 # ... (O restante da função listar_pacientes)
+# As listagens rodam como fragmentos: paginar, confirmar ou excluir uma linha
+# re-executa só a lista, não o painel inteiro. Os botões usam on_click: o
+# callback roda antes do rerun que o próprio clique dispara, sem st.rerun.
+# Callbacks de fragmento não devem desenhar nada, então o resultado de uma
+# gravação fica em st.session_state[f"{lista}_aviso"] até o fragmento mostrá-lo.
+def _definir(**valores):
+    st.session_state.update(valores)
+
+def _gravar(lista, mensagem, gravacao, *args):
+    # gravacao é escrita.executar ou escrita.escrever (no banco deste psicólogo)
+    try:
+        gravacao(PSICOLOGO_ID, *args)
+        cache.invalidar(PSICOLOGO_ID)
+        st.session_state[f"{lista}_aviso"] = ("toast", mensagem)
+    except Exception as e:
+        st.session_state[f"{lista}_aviso"] = ("error", f"Erro: {e}")
+
+def _mostrar_aviso(lista):
+    tipo, mensagem = st.session_state.pop(f"{lista}_aviso", (None, None))
+    if tipo == "toast":
+        st.toast(mensagem)
+    elif tipo == "error":
+        st.error(mensagem)
+
+def _excluir_paciente(id_pac, nome):
+    # O trigger trg_pacientes_apagar_dependentes cuida de sessões e agendamentos
+    _gravar("pacientes", f"Paciente {nome} e todos os seus dados excluídos.",
+            escrita.executar, "DELETE FROM pacientes WHERE id = ?", (id_pac,))
+    st.session_state.pop(f"confirm_excluir_{id_pac}", None)
+
+@st.fragment
 def listar_pacientes():
     st.subheader("👥 Listagem de Pacientes")
-
-    conn = criar_conexao()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, nome, telefone, email, observacoes, carteirinha FROM pacientes WHERE psicologo_id = ?", (PSICOLOGO_ID,))
-    pacientes = cursor.fetchall()
-    conn.close()
-
-    if not pacientes:
-        st.info("Nenhum paciente cadastrado.")
+    _mostrar_aviso("pacientes")
+
+    # Busca e ordenação feitas no banco; a página só recebe as linhas visíveis
+    col_busca, col_ordem = st.columns([3, 1])
+    with col_busca:
+        busca = st.text_input("🔎 Buscar por nome, telefone, email ou carteirinha", key="pacientes_busca").strip()
+    with col_ordem:
+        ordenacao = st.selectbox("Ordenar por", list(consultas.ORDENACOES_PACIENTES), key="pacientes_ordem")
+
+    # Nova busca/ordenação volta para a primeira página
+    if st.session_state.get("pacientes_consulta") != (busca, ordenacao):
+        st.session_state["pacientes_consulta"] = (busca, ordenacao)
+        st.session_state["pacientes_pagina"] = 0
+
+    total = carregar_total_pacientes(PSICOLOGO_ID, busca)
+    # Após exclusões a página guardada pode não existir mais
+    total_paginas = max(1, (total - 1) // consultas.TAMANHO_PAGINA_PACIENTES + 1)
+    pagina = min(st.session_state["pacientes_pagina"], total_paginas - 1)
+    st.session_state["pacientes_pagina"] = pagina
+    pacientes = carregar_pagina_pacientes(PSICOLOGO_ID, busca, ordenacao, pagina)
+
+    if not total:
+        st.info("Nenhum paciente encontrado." if busca else "Nenhum paciente cadastrado.")
         return
 
-    st.markdown(f"**Total de pacientes:** **{len(pacientes)}**")
-    
-    # Prepara um dicionário para facilitar o mapeamento
-    pacientes_map = {id: {'nome': nome, 'tel': tel, 'email': email, 'obs': obs, 'cart': cart} 
-                     for id, nome, tel, email, obs, cart in pacientes}
+    st.markdown(f"**Total de pacientes:** **{total}**")
 
     # ----------------------------------------------------
     # Layout de Listagem com Expander para detalhes
@@ -119,57 +295,67 @@ def listar_pacientes():
     
     st.markdown("---")
 
-    for id_pac, dados in pacientes_map.items():
+    for id_pac, nome, tel, email, cart, total_sessoes, total_pago_centavos, ultima_sessao, proximo_agend in pacientes:
         # Usa um container para delimitar cada paciente na lista
         with st.container(border=True):
             col_info, col_acao = st.columns([5, 1])
 
-            # Coluna de Informações (Nome, Telefone, Email)
+            # Coluna de Informações (Nome, Telefone, Email e totalizadores)
             with col_info:
-                st.markdown(f"**👤 {dados['nome']}** (ID: {id_pac})")
-                st.caption(f"📞 {dados['tel']} | 📧 {dados['email']}")
+                st.markdown(f"**👤 {nome}** (ID: {id_pac})")
+                st.caption(f"📞 {tel} | 📧 {email}")
+
+                total_pago_formatado = moeda.formatar(total_pago_centavos)
+                ultima_exibicao = datetime.strptime(ultima_sessao, "%Y-%m-%d").strftime("%d/%m/%Y") if ultima_sessao else "—"
+                proximo_exibicao = datetime.strptime(proximo_agend, "%Y-%m-%d %H:%M").strftime("%d/%m/%Y %H:%M") if proximo_agend else "—"
+                st.caption(
+                    f"📚 {total_sessoes} sessões | 💰 {total_pago_formatado} | "
+                    f"🕘 Última: {ultima_exibicao} | 📅 Próximo: {proximo_exibicao}"
+                )
                 
-                # Expansor para detalhes e observações
-                with st.expander("Detalhes e Observações"):
-                    st.write(f"**Carteirinha:** {dados['cart'] if dados['cart'] else 'N/A'}")
+                # Detalhes e observações só são buscados quando pedidos
+                if st.toggle("Detalhes e Observações", key=f"paciente_detalhes_{id_pac}"):
+                    obs = carregar_observacoes_paciente(PSICOLOGO_ID, id_pac)
+                    st.write(f"**Carteirinha:** {cart if cart else 'N/A'}")
                     st.write("**Observações Iniciais:**")
-                    st.markdown(dados['obs'] if dados['obs'] else "_Nenhuma observação inicial._")
+                    st.markdown(obs if obs else "_Nenhuma observação inicial._")
 
             # Coluna de Ações (Exclusão)
             with col_acao:
                 st.write("") # Espaçamento
-                if st.button("🗑️ Excluir", key=f"excluir_{id_pac}", use_container_width=True, type="secondary"):
-                    
-                    # Confirmação antes de excluir
-                    if st.session_state.get(f"confirm_excluir_{id_pac}"):
-                        conn = criar_conexao()
-                        cursor = conn.cursor()
-                        # O ON DELETE CASCADE cuida de sessões e agendamentos
-                        cursor.execute("DELETE FROM pacientes WHERE id = ?", (id_pac,))
-                        conn.commit()
-                        conn.close()
-                        st.success(f"Paciente **{dados['nome']}** e todos os seus dados excluídos.")
-                        st.experimental_rerun()
-                    else:
-                        st.warning("Clique novamente para confirmar a exclusão TOTAL dos dados do paciente.")
-                        st.session_state[f"confirm_excluir_{id_pac}"] = True
-                        st.experimental_rerun()
-# Substitua a função cadastrar_sessao() COMPLETA
+                # Confirmação antes de excluir (o aviso fica visível até confirmar ou cancelar)
+                if st.session_state.get(f"confirm_excluir_{id_pac}"):
+                    st.warning("Excluir TODOS os dados do paciente?")
+                    st.button("✔️ Confirmar", key=f"confirmar_excluir_{id_pac}", use_container_width=True, type="primary",
+                              on_click=_excluir_paciente, args=(id_pac, nome))
+                    st.button("Cancelar", key=f"cancelar_excluir_{id_pac}", use_container_width=True,
+                              on_click=_definir, kwargs={f"confirm_excluir_{id_pac}": False})
+                else:
+                    st.button("🗑️ Excluir", key=f"excluir_{id_pac}", use_container_width=True, type="secondary",
+                              on_click=_definir, kwargs={f"confirm_excluir_{id_pac}": True})
+
+    # Navegação entre páginas
+    col_anterior, col_pagina, col_proxima = st.columns([1, 2, 1])
+    with col_anterior:
+        st.button("◀ Anterior", key="pacientes_pagina_anterior", disabled=pagina == 0, use_container_width=True,
+                  on_click=_definir, kwargs={"pacientes_pagina": pagina - 1})
+    with col_pagina:
+        st.caption(f"Página {pagina + 1} de {total_paginas}")
+    with col_proxima:
+        st.button("Próxima ▶", key="pacientes_pagina_proxima", disabled=pagina + 1 >= total_paginas, use_container_width=True,
+                  on_click=_definir, kwargs={"pacientes_pagina": pagina + 1})
 
 # Substitua a função cadastrar_sessao() COMPLETA
-
 def cadastrar_sessao():
     st.subheader("✍️ Registrar Nova Sessão")
-    pacientes_dict = get_pacientes()
 
-    if not pacientes_dict:
+    if not tem_pacientes():
         st.warning("Cadastre um paciente primeiro para registrar uma sessão.")
         return
         
-    paciente_selecionado = st.selectbox("Paciente*", [""] + list(pacientes_dict.values()))
+    paciente_id, _paciente_nome = seletor_paciente("sessao_paciente")
     
-    if paciente_selecionado:
-        paciente_id = list(pacientes_dict.keys())[list(pacientes_dict.values()).index(paciente_selecionado)]
+    if paciente_id is not None:
         
         # LINHA 1: Data e Tipo de Receita
         col_data, col_tipo_receita = st.columns(2)
@@ -177,10 +363,7 @@ def cadastrar_sessao():
             data_sessao = st.date_input("Data da Sessão*", max_value=datetime.today().date())
         with col_tipo_receita:
             # NOVO CAMPO 1: Classificação da Receita
-            tipo_receita = st.selectbox(
-                "Tipo de Receita*", 
-                ["Particular", "Convênio - Plano A", "Convênio - Plano B", "Outros"]
-            )
+            tipo_receita = st.selectbox("Tipo de Receita*", TIPOS_RECEITA)
             
         # LINHA 2: Valor Unitário e Quantidade de Sessões
         col_valor_unitario, col_quantidade = st.columns(2)
@@ -191,78 +374,67 @@ def cadastrar_sessao():
             # NOVO CAMPO 3: Quantidade de Sessões
             qtd_sessoes = st.number_input("Qtd. de Sessões (paga agora)*", min_value=1, step=1)
             
-        # CÁLCULO DA RECEITA TOTAL
-        valor_total_recebido = valor_unitario * qtd_sessoes
+        # CÁLCULO DA RECEITA TOTAL (em centavos: 3 x R$ 0,10 é exatamente R$ 0,30)
+        valor_unitario_centavos = moeda.para_centavos(valor_unitario)
+        valor_total_centavos = valor_unitario_centavos * qtd_sessoes
         
         # Exibe o total calculado de forma clara
-        st.info(f"💰 **Receita Total Registrada:** **R$ {valor_total_recebido:,.2f}** ({qtd_sessoes} x R$ {valor_unitario:,.2f})".replace(",", "X").replace(".", ",").replace("X", "."))
+        st.info(f"💰 **Receita Total Registrada:** **{moeda.formatar(valor_total_centavos)}** ({qtd_sessoes} x {moeda.formatar(valor_unitario_centavos)})")
         
         descricao = st.text_area("Descrição/Notas da Sessão*", height=250)
 
         if st.button("Salvar Sessão e Receita", use_container_width=True, type="primary"):
             if descricao and valor_unitario >= 0 and qtd_sessoes >= 1:
-                conn = None
                 try:
-                    conn = criar_conexao()
-                    cursor = conn.cursor()
                     data_str = data_sessao.strftime("%Y-%m-%d")
                     
-                    # Salva a RECEITA TOTAL CALCULADA no campo 'valor' da tabela sessoes
-                    cursor.execute(
-                        "INSERT INTO sessoes (paciente_id, data, descricao, valor, tipo_receita, qtd_sessoes) VALUES (?, ?, ?, ?, ?, ?)",
-                        (paciente_id, data_str, descricao, valor_total_recebido, tipo_receita, qtd_sessoes)
+                    # Salva a RECEITA TOTAL CALCULADA (e o valor unitário) em centavos
+                    escrita.executar(
+                        PSICOLOGO_ID,
+                        "INSERT INTO sessoes (paciente_id, psicologo_id, data, descricao, valor_centavos, valor_unitario_centavos, tipo_receita, qtd_sessoes) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (paciente_id, PSICOLOGO_ID, data_str, descricao, valor_total_centavos, valor_unitario_centavos, tipo_receita, qtd_sessoes)
                     )
-                    conn.commit()
-                    st.success(f"Receita de R$ {valor_total_recebido:.2f} registrada! Tipo: {tipo_receita}.")
+                    cache.invalidar(PSICOLOGO_ID)
+                    st.success(f"Receita de {moeda.formatar(valor_total_centavos)} registrada! Tipo: {tipo_receita}.")
                     st.rerun() # <--- CORREÇÃO APLICADA AQUI
                 except sqlite3.OperationalError as e:
                     # Este erro ocorrerá se as colunas 'tipo_receita' e 'qtd_sessoes' não existirem
                     if "no such column" in str(e):
-                        st.error("ERRO CRÍTICO: As colunas 'tipo_receita' e 'qtd_sessoes' não foram adicionadas à tabela 'sessoes'. Por favor, execute a migração manual (Passo 2).")
+                        st.error("ERRO CRÍTICO: As colunas 'tipo_receita' e 'qtd_sessoes' não foram adicionadas à tabela 'sessoes'. Por favor, execute as migrações: python migracao.py")
                     else:
                         st.error(f"Erro ao salvar a sessão: {e}")
                 except Exception as e:
                     st.error(f"Erro ao salvar a sessão: {e}")
-                finally:
-                    if conn:
-                        conn.close()
             else:
                 st.error("Preencha a descrição, o valor unitário e a quantidade de sessões.")
 
-# Certifique-se de que get_pacientes() está definida e retorna {id: nome}
-
 # Substitua a função listar_sessoes() COMPLETA
 
 def listar_sessoes():
     st.subheader("📚 Histórico de Sessões e Receita")
+
+    # Busca por conteúdo (índice FTS5): enquanto houver texto, substitui a lista
+    col_busca, col_origem = st.columns([3, 2])
+    with col_busca:
+        texto_busca = st.text_input(
+            "🔍 Buscar nas anotações",
+            placeholder="Ex.: ansiedade sono (use * para prefixo: insôn*)",
+            key="busca_textual",
+        )
+    with col_origem:
+        origem_busca = st.radio("Onde buscar", list(consultas.ORIGENS_BUSCA), horizontal=True, key="busca_origem")
+    if texto_busca.strip():
+        resultados_busca(texto_busca.strip(), origem_busca)
+        return
     
-    # 1. Busca Segura dos Dados
-    conn = None
-    df_sessoes = pd.DataFrame()
-    
+    # 1. Dados mínimos para montar os filtros (nada do histórico em si ainda)
     try:
-        conn = criar_conexao()
-        df_sessoes = pd.read_sql_query(
-            """
-            SELECT 
-                s.id, s.data, s.descricao, s.valor, s.tipo_receita, s.qtd_sessoes, 
-                p.nome as paciente_nome, s.paciente_id 
-            FROM sessoes s
-            JOIN pacientes p ON s.paciente_id = p.id
-            WHERE p.psicologo_id = ? 
-            ORDER BY s.data DESC
-            """, 
-            conn, 
-            params=(PSICOLOGO_ID,)
-        )
+        primeira_data = carregar_primeira_data_sessao(PSICOLOGO_ID)
     except Exception as e:
         st.error(f"Erro ao carregar histórico de sessões. Detalhe: {e}")
         return
-    finally:
-        if conn:
-            conn.close()
 
-    if df_sessoes.empty:
+    if primeira_data is None:
         st.info("Nenhuma sessão registrada. Use a aba 'Registrar Sessão' para começar.")
         return
 
@@ -271,111 +443,152 @@ def listar_sessoes():
     # ----------------------------------------------------
     st.sidebar.markdown("### 🔎 Filtros do Histórico")
 
-    # Filtro por Paciente
-    pacientes_list = df_sessoes['paciente_nome'].unique().tolist()
-    paciente_filter = st.sidebar.selectbox("Filtrar por Paciente", ["Todos"] + sorted(pacientes_list))
+    # Filtro por Paciente (por ID: nomes repetidos não se misturam)
+    paciente_filter, _paciente_nome = seletor_paciente(
+        "historico_paciente", "Filtrar por Paciente", opcao_vazia="Todos", onde=st.sidebar
+    )
 
     # Filtro por Tipo de Receita
-    tipos_receita_list = df_sessoes['tipo_receita'].unique().tolist()
-    
-    # *** CORREÇÃO AQUI: Removemos os valores None antes de ordenar ***
-    tipos_receita_validos = [t for t in tipos_receita_list if t is not None]
-    tipo_receita_filter = st.sidebar.selectbox("Filtrar por Tipo de Receita", ["Todos"] + sorted(tipos_receita_validos))
+    tipo_receita_filter = st.sidebar.selectbox("Filtrar por Tipo de Receita", ["Todos"] + sorted(TIPOS_RECEITA))
     
     # Filtro de Data
     col_start, col_end = st.sidebar.columns(2)
     with col_start:
-        data_min = datetime.strptime(df_sessoes['data'].min(), "%Y-%m-%d").date()
+        data_min = datetime.strptime(primeira_data, "%Y-%m-%d").date()
         data_inicio_filter = st.date_input("De", value=data_min, min_value=data_min)
     with col_end:
         data_fim_filter = st.date_input("Até", value=datetime.today().date(), max_value=datetime.today().date())
 
+    # Os filtros vão direto para o WHERE da consulta
+    filtros = dict(
+        data_inicio=data_inicio_filter.strftime("%Y-%m-%d"),
+        data_fim=data_fim_filter.strftime("%Y-%m-%d"),
+        paciente_id=paciente_filter,
+        tipo_receita=None if tipo_receita_filter == "Todos" else tipo_receita_filter,
+    )
+
+    # Paginação por keyset: guardamos a pilha de cursores (data, id) das páginas já
+    # visitadas. Mudou algum filtro, volta para a primeira página.
+    assinatura_filtros = tuple(sorted(filtros.items()))
+    if st.session_state.get("sessoes_filtros") != assinatura_filtros:
+        st.session_state["sessoes_filtros"] = assinatura_filtros
+        st.session_state["sessoes_cursores"] = [None]
+
+    # Os filtros ficam na sidebar, fora do fragmento (fragmentos não escrevem na
+    # sidebar); mudar um filtro reexecuta o painel, paginar/excluir só a lista
+    lista_sessoes(filtros)
+
+    with st.expander("⬇️ Exportar Histórico"):
+        painel_exportacao(["sessoes", "agendamentos"], "historico")
+
+@st.fragment
+def lista_sessoes(filtros):
+    _mostrar_aviso("sessoes")
+    cursores = st.session_state["sessoes_cursores"]
 
-    # Aplicar os Filtros
-    df_filtrado = df_sessoes.copy()
-    
-    if paciente_filter != "Todos":
-        df_filtrado = df_filtrado[df_filtrado['paciente_nome'] == paciente_filter]
-        
-    if tipo_receita_filter != "Todos":
-        # Se o tipo de receita for None para registros antigos, eles serão ignorados pelo filtro.
-        df_filtrado = df_filtrado[df_filtrado['tipo_receita'] == tipo_receita_filter]
-        
-    # Filtro de Data
-    df_filtrado['data_dt'] = pd.to_datetime(df_filtrado['data'])
-    df_filtrado = df_filtrado[
-        (df_filtrado['data_dt'].dt.date >= data_inicio_filter) & 
-        (df_filtrado['data_dt'].dt.date <= data_fim_filter)
-    ]
+    try:
+        total, pagina, proximo_cursor = carregar_historico_sessoes(PSICOLOGO_ID, cursores[-1], **filtros)
+    except Exception as e:
+        st.error(f"Erro ao carregar histórico de sessões. Detalhe: {e}")
+        return
     
     # ----------------------------------------------------
     # 3. EXIBIÇÃO E AÇÕES
     # ----------------------------------------------------
-    st.markdown(f"**Sessões Encontradas:** **{len(df_filtrado)}**")
+    st.markdown(f"**Sessões Encontradas:** **{total}**")
     
-    if df_filtrado.empty:
+    if not pagina:
         st.warning("Nenhuma sessão corresponde aos filtros selecionados.")
         return
 
     st.markdown("---")
     
-    for _, row in df_filtrado.iterrows():
-        id_sessao = row['id']
-        data_exibicao = datetime.strptime(row['data'], "%Y-%m-%d").strftime("%d/%m/%Y")
+    for id_sessao, data_str, valor_centavos, tipo_receita, qtd_sessoes, paciente_nome, paciente_id in pagina:
+        data_exibicao = datetime.strptime(data_str, "%Y-%m-%d").strftime("%d/%m/%Y")
         
         # Cria um container por sessão para melhor visualização
         with st.container(border=True):
             col_info, col_valor, col_acao = st.columns([3, 2, 1])
             
-            # Coluna de Informações Principais
-            # ... (dentro da função listar_sessoes)
             # Coluna de Informações Principais
             with col_info:
-                st.markdown(f"**📅 {data_exibicao}** | **👤 {row['paciente_nome']}**")
-                
-                # --- NOVO TRATAMENTO MAIS SEGURO ---
-                # 1. tipo_receita: O "else" original já funciona bem aqui
-                tipo_receita_exibicao = row['tipo_receita'] if row['tipo_receita'] else "N/A (Antigo)"
+                st.markdown(f"**📅 {data_exibicao}** | **👤 {paciente_nome}**")
                 
-                # 2. qtd_sessoes: É o ponto que falha. Checamos se é None/NaN antes de converter para int.
-                if pd.notna(row['qtd_sessoes']) and row['qtd_sessoes'] is not None:
-                    # Se for um valor válido, converte para inteiro
-                    qtd_sessoes_exibicao = int(row['qtd_sessoes'])
-                else:
-                    # Se for nulo/NaN, exibe "N/A" (ou você pode colocar 1, se for o valor padrão para registros antigos)
-                    qtd_sessoes_exibicao = "N/A" # Ou 1, se for sua regra de negócio para antigos
+                # Registros antigos podem não ter tipo de receita nem quantidade
+                tipo_receita_exibicao = tipo_receita if tipo_receita else "N/A (Antigo)"
+                qtd_sessoes_exibicao = int(qtd_sessoes) if qtd_sessoes is not None else "N/A"
                 
                 st.caption(f"Tipo: {tipo_receita_exibicao} | Qtd: {qtd_sessoes_exibicao}")
-# ...
             
             # Coluna de Valor/Receita
             with col_valor:
                 # Formatação de moeda
-                valor_formatado = f"R$ {row['valor']:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+                valor_formatado = moeda.formatar(valor_centavos or 0)
                 st.markdown(f"**💰 Receita:** **{valor_formatado}**")
             
             # Coluna de Ações
             with col_acao:
                 # Chave Única garantida com 'sessao_excluir_'
-                if st.button("🗑️ Excluir", key=f"sessao_excluir_{id_sessao}", use_container_width=True, type="secondary"):
-                    
-                    conn_del = None
-                    try:
-                        conn_del = criar_conexao()
-                        cursor_del = conn_del.cursor()
-                        cursor_del.execute("DELETE FROM sessoes WHERE id = ?", (id_sessao,))
-                        conn_del.commit()
-                        st.success(f"Sessão de {data_exibicao} excluída.")
-                        st.rerun() 
-                    except Exception as e:
-                        st.error(f"Erro ao excluir: {e}")
-                    finally:
-                        if conn_del:
-                            conn_del.close()
+                st.button("🗑️ Excluir", key=f"sessao_excluir_{id_sessao}", use_container_width=True, type="secondary",
+                          on_click=_gravar, args=("sessoes", f"Sessão de {data_exibicao} excluída.",
+                                                  escrita.executar, "DELETE FROM sessoes WHERE id = ?", (id_sessao,)))
             
-            # Expansor para a descrição
-            with st.expander("Ver Notas da Sessão"):
-                st.markdown(row['descricao'])
+            # As notas só são buscadas no banco quando o usuário pede para vê-las
+            if st.toggle("Ver Notas da Sessão", key=f"sessao_notas_{id_sessao}"):
+                descricao = carregar_descricao_sessao(PSICOLOGO_ID, id_sessao)
+                st.markdown(descricao if descricao is not None else "_Sessão não encontrada._")
+
+    # Navegação entre páginas
+    col_anterior, col_pagina, col_proxima = st.columns([1, 2, 1])
+    with col_anterior:
+        st.button("◀ Anterior", key="sessoes_pagina_anterior", disabled=len(cursores) == 1, use_container_width=True,
+                  on_click=_definir, kwargs={"sessoes_cursores": cursores[:-1]})
+    with col_pagina:
+        st.caption(f"Página {len(cursores)}")
+    with col_proxima:
+        st.button("Próxima ▶", key="sessoes_pagina_proxima", disabled=proximo_cursor is None, use_container_width=True,
+                  on_click=_definir, kwargs={"sessoes_cursores": cursores + [proximo_cursor]})
+
+@st.fragment
+def resultados_busca(texto, origem):
+    # Paginação por número de página (a ordem é por relevância). Mudou a busca,
+    # volta para a primeira.
+    if st.session_state.get("busca_assinatura") != (texto, origem):
+        st.session_state["busca_assinatura"] = (texto, origem)
+        st.session_state["busca_pagina"] = 0
+    pagina_atual = st.session_state["busca_pagina"]
+
+    try:
+        resultados, tem_proxima = carregar_busca_textual(PSICOLOGO_ID, texto, origem, pagina_atual)
+    except Exception as e:
+        st.error(f"Erro na busca. Detalhe: {e}")
+        return
+
+    if not resultados:
+        st.warning("Nenhuma anotação contém esses termos.")
+        return
+
+    for id_registro, data_str, paciente_nome, trecho in resultados:
+        with st.container(border=True):
+            if data_str:
+                data_exibicao = datetime.strptime(data_str, "%Y-%m-%d").strftime("%d/%m/%Y")
+                st.markdown(f"**📅 {data_exibicao}** | **👤 {paciente_nome}**")
+            else:
+                st.markdown(f"**👤 {paciente_nome}** (observações do cadastro)")
+            st.markdown(trecho)
+            if data_str and st.toggle("Ver Notas da Sessão", key=f"busca_notas_{id_registro}"):
+                descricao = carregar_descricao_sessao(PSICOLOGO_ID, id_registro)
+                st.markdown(descricao if descricao is not None else "_Sessão não encontrada._")
+
+    col_anterior, col_pagina, col_proxima = st.columns([1, 2, 1])
+    with col_anterior:
+        st.button("◀ Anterior", key="busca_pagina_anterior", disabled=pagina_atual == 0, use_container_width=True,
+                  on_click=_definir, kwargs={"busca_pagina": pagina_atual - 1})
+    with col_pagina:
+        st.caption(f"Página {pagina_atual + 1} (mais relevantes primeiro)")
+    with col_proxima:
+        st.button("Próxima ▶", key="busca_pagina_proxima", disabled=not tem_proxima, use_container_width=True,
+                  on_click=_definir, kwargs={"busca_pagina": pagina_atual + 1})
 
 # ----------------------------------------------
 # 3. FUNCIONALIDADES DE AGENDAMENTO (NOVA)
@@ -383,97 +596,244 @@ def listar_sessoes():
 
 def cadastrar_agendamento():
     st.subheader("📅 Agendar Sessão")
-    pacientes_dict = get_pacientes()
     
-    if not pacientes_dict:
+    if not tem_pacientes():
         st.warning("Cadastre um paciente primeiro para agendar uma sessão.")
         return
 
+    # Fora do formulário: a lista de opções acompanha o que é digitado na busca
+    paciente_id, paciente_selecionado = seletor_paciente("agendamento_paciente")
+
     with st.form("form_agendamento"):
-        paciente_selecionado = st.selectbox("Paciente*", [""] + list(pacientes_dict.values()))
         
-        col_data, col_hora = st.columns(2)
+        col_data, col_hora, col_duracao = st.columns(3)
         with col_data:
             data_agendamento = st.date_input("Data do Agendamento*", min_value=datetime.today().date())
         with col_hora:
             hora_agendamento = st.time_input("Hora do Agendamento*", value=datetime.now().time())
+        with col_duracao:
+            duracao = st.number_input("Duração (min)*", min_value=10, max_value=agenda.DURACAO_MAXIMA,
+                                      value=agenda.DURACAO_PADRAO, step=5)
+        
+        col_repetir, col_ate = st.columns(2)
+        with col_repetir:
+            repetir = st.selectbox("Repetir", ["Não repetir"] + [regra.capitalize() for regra in agenda.REGRAS])
+        with col_ate:
+            repetir_ate = st.date_input("Repetir até (opcional)", value=None, min_value=datetime.today().date())
         
         observacoes = st.text_area("Observações do Agendamento")
+        permitir_conflito = st.checkbox("Permitir sobreposição com outro agendamento (ex.: sessão em grupo)")
 
         if st.form_submit_button("Agendar", use_container_width=True):
-            if paciente_selecionado:
-                paciente_id = list(pacientes_dict.keys())[list(pacientes_dict.values()).index(paciente_selecionado)]
-                
+            if paciente_id is not None:
+                inicio = datetime.combine(data_agendamento, hora_agendamento.replace(second=0, microsecond=0))
+                hora_str = inicio.strftime("%H:%M")
                 try:
-                    conn = criar_conexao()
-                    cursor = conn.cursor()
-                    # Formato da data YYYY-MM-DD
-                    data_str = data_agendamento.strftime("%Y-%m-%d")
-                    hora_str = hora_agendamento.strftime("%H:%M")
-                    
-                    cursor.execute(
-                        "INSERT INTO agendamentos (paciente_id, data, hora, observacoes) VALUES (?, ?, ?, ?)",
-                        (paciente_id, data_str, hora_str, observacoes)
+                    # Confere sobreposição e grava na mesma transação. Uma série
+                    # é uma única linha, qualquer que seja o número de ocorrências.
+                    if repetir == "Não repetir":
+                        escrita.escrever(PSICOLOGO_ID, agenda.agendar, PSICOLOGO_ID, paciente_id, inicio, int(duracao),
+                                         observacoes, permitir_conflito)
+                    else:
+                        escrita.escrever(PSICOLOGO_ID, agenda.criar_serie, PSICOLOGO_ID, paciente_id, inicio, int(duracao),
+                                         repetir.lower(), repetir_ate, observacoes, permitir_conflito)
+                    cache.invalidar(PSICOLOGO_ID)
+                    recorrencia = "" if repetir == "Não repetir" else f" ({repetir.lower()})"
+                    st.success(f"Sessão agendada com sucesso para **{paciente_selecionado}** em {data_agendamento.strftime('%d/%m/%Y')} às {hora_str}{recorrencia}.")
+                except agenda.ConflitoDeHorario as e:
+                    ocupados = ", ".join(
+                        f"{nome} ({datetime.strptime(inicio_c, '%Y-%m-%d %H:%M').strftime('%d/%m %H:%M')}, {duracao_c or agenda.DURACAO_PADRAO} min)"
+                        for _id, inicio_c, duracao_c, nome in e.conflitos[:5]
                     )
-                    conn.commit()
-                    conn.close()
-                    st.success(f"Sessão agendada com sucesso para **{paciente_selecionado}** em {data_agendamento.strftime('%d/%m/%Y')} às {hora_str}.")
+                    mais = f" e mais {len(e.conflitos) - 5}" if len(e.conflitos) > 5 else ""
+                    st.error(f"Horário ocupado: {ocupados}{mais}.")
+                    livres = carregar_horarios_livres(PSICOLOGO_ID, data_agendamento, int(duracao))
+                    if livres:
+                        st.info("Horários livres neste dia: " + ", ".join(h.strftime("%H:%M") for h in livres))
                 except Exception as e:
                     st.error(f"Erro ao agendar: {e}")
             else:
                 st.error("Selecione um paciente.")
 
-# Substitua esta função COMPLETA em pages/painel_psicologo.py
+DIAS_SEMANA = ["Seg", "Ter", "Qua", "Qui", "Sex", "Sáb", "Dom"]
+MAX_POR_DIA_MES = 3 # Na visão mensal, o resto vira "+N"
+
+# Semana ou mês: uma consulta por faixa de datas (agenda.buscar_periodo).
+# Navegar entre períodos re-executa só o fragmento.
+@st.fragment
+def calendario_agendamentos():
+    st.subheader("🗓️ Calendário")
+    hoje = datetime.today().date()
+    referencia = st.session_state.setdefault("agenda_referencia", hoje)
+
+    col_modo, col_anterior, col_hoje, col_proximo = st.columns([3, 1, 1, 1])
+    with col_modo:
+        modo = st.radio("Visualização", ["Semana", "Mês"], horizontal=True, key="agenda_modo", label_visibility="collapsed")
+    de, ate = agenda.semana_de(referencia) if modo == "Semana" else agenda.mes_de(referencia)
+    with col_anterior:
+        st.button("◀", key="agenda_anterior", use_container_width=True,
+                  on_click=_definir, kwargs={"agenda_referencia": de - timedelta(days=1 if modo == "Mês" else 7)})
+    with col_hoje:
+        st.button("Hoje", key="agenda_hoje", use_container_width=True,
+                  on_click=_definir, kwargs={"agenda_referencia": hoje})
+    with col_proximo:
+        st.button("▶", key="agenda_proximo", use_container_width=True,
+                  on_click=_definir, kwargs={"agenda_referencia": ate})
 
+    try:
+        linhas = carregar_agenda_periodo(PSICOLOGO_ID, de, ate)
+    except Exception as e:
+        st.error(f"Erro ao carregar a agenda. Detalhe: {e}")
+        return
+
+    por_dia = {}
+    for _id, inicio, duracao, nome, _obs, _paciente_id, serie_id, _original in linhas:
+        marcador = "🔁 " if serie_id is not None else ""
+        por_dia.setdefault(inicio[:10], []).append((inicio[11:16], duracao, marcador + nome))
+
+    st.caption(f"{de.strftime('%d/%m/%Y')} a {(ate - timedelta(days=1)).strftime('%d/%m/%Y')}: {len(linhas)} agendamento(s)")
+
+    # Linhas de 7 dias (segunda a domingo); no mês, os dias de fora ficam vazios
+    inicio_grade = agenda.semana_de(de)[0]
+    while inicio_grade < ate:
+        colunas = st.columns(7)
+        for deslocamento, coluna in enumerate(colunas):
+            dia = inicio_grade + timedelta(days=deslocamento)
+            if not de <= dia < ate:
+                continue
+            with coluna:
+                titulo = f"{DIAS_SEMANA[dia.weekday()]} {dia.strftime('%d/%m')}"
+                st.markdown(f"**{titulo}**" + (" 📍" if dia == hoje else ""))
+                do_dia = por_dia.get(dia.isoformat(), [])
+                visiveis = do_dia if modo == "Semana" else do_dia[:MAX_POR_DIA_MES]
+                for hora, duracao, nome in visiveis:
+                    st.caption(f"{hora} · {nome} ({duracao or agenda.DURACAO_PADRAO} min)")
+                if len(do_dia) > len(visiveis):
+                    st.caption(f"+{len(do_dia) - len(visiveis)}")
+        inicio_grade += timedelta(days=7)
+
+    with st.expander("🕒 Horários livres"):
+        col_dia, col_duracao = st.columns(2)
+        with col_dia:
+            dia_livre = st.date_input("Dia", value=hoje, min_value=hoje, key="agenda_livres_dia")
+        with col_duracao:
+            duracao_livre = st.number_input("Duração (min)", min_value=10, max_value=agenda.DURACAO_MAXIMA,
+                                            value=agenda.DURACAO_PADRAO, step=5, key="agenda_livres_duracao")
+        livres = carregar_horarios_livres(PSICOLOGO_ID, dia_livre, int(duracao_livre))
+        if livres:
+            st.markdown(" · ".join(h.strftime("%H:%M") for h in livres))
+        else:
+            st.info(f"Nenhum horário livre entre {agenda.INICIO_EXPEDIENTE} e {agenda.FIM_EXPEDIENTE}.")
+
+def _rotulo_serie(serie):
+    _id, regra, data_inicio, data_fim, hora, duracao, nome, _paciente_id = serie
+    ate = f" até {datetime.strptime(data_fim, '%Y-%m-%d').strftime('%d/%m/%Y')}" if data_fim else ""
+    return f"{nome} · {regra} às {hora} ({duracao} min){ate}"
+
+# Ações sobre UMA ocorrência gravam uma exceção; a série continua sendo uma linha
+@st.fragment
+def gerenciar_series():
+    hoje = datetime.today().date()
+    with st.expander("🔁 Sessões recorrentes"):
+        try:
+            series = carregar_series_ativas(PSICOLOGO_ID, hoje)
+        except Exception as e:
+            st.error(f"Erro ao carregar as séries. Detalhe: {e}")
+            return
+        if not series:
+            st.info("Nenhuma série ativa. Use 'Repetir' ao agendar para criar uma.")
+            return
+
+        por_id = {serie[0]: serie for serie in series}
+        serie_id = st.selectbox("Série", list(por_id), format_func=lambda id_serie: _rotulo_serie(por_id[id_serie]),
+                                key="serie_escolhida")
+        proximas = carregar_proximas_ocorrencias(PSICOLOGO_ID, serie_id, hoje)
+        if not proximas:
+            st.caption("Nenhuma ocorrência nas próximas semanas.")
+            return
+        inicios = {linha[7]: linha[1] for linha in proximas} # data original -> início atual
+        data_original = st.selectbox(
+            "Ocorrência",
+            list(inicios),
+            format_func=lambda original: datetime.strptime(inicios[original], "%Y-%m-%d %H:%M").strftime("%d/%m/%Y às %H:%M")
+            + (" (remarcada)" if inicios[original][:10] != original else ""),
+            key="serie_ocorrencia",
+        )
+
+        col_cancelar, col_encerrar = st.columns(2)
+        with col_cancelar:
+            if st.button("Cancelar esta ocorrência", key="serie_cancelar", use_container_width=True):
+                try:
+                    escrita.escrever(PSICOLOGO_ID, agenda.cancelar_ocorrencia, PSICOLOGO_ID, serie_id, data_original)
+                    cache.invalidar(PSICOLOGO_ID)
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"Erro ao cancelar: {e}")
+        with col_encerrar:
+            if st.button("Encerrar a série a partir desta", key="serie_encerrar", use_container_width=True):
+                try:
+                    ultima = datetime.strptime(data_original, "%Y-%m-%d").date() - timedelta(days=1)
+                    escrita.escrever(PSICOLOGO_ID, agenda.encerrar_serie, PSICOLOGO_ID, serie_id, ultima)
+                    cache.invalidar(PSICOLOGO_ID)
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"Erro ao encerrar: {e}")
+
+        col_nova_data, col_nova_hora, col_remarcar = st.columns([2, 2, 1])
+        atual = datetime.strptime(inicios[data_original], "%Y-%m-%d %H:%M")
+        with col_nova_data:
+            nova_data = st.date_input("Nova data", value=atual.date(), min_value=hoje, key="serie_nova_data")
+        with col_nova_hora:
+            nova_hora = st.time_input("Novo horário", value=atual.time(), key="serie_nova_hora")
+        with col_remarcar:
+            st.write("")
+            if st.button("Remarcar", key="serie_remarcar", use_container_width=True):
+                try:
+                    escrita.escrever(PSICOLOGO_ID, agenda.remarcar_ocorrencia, PSICOLOGO_ID, serie_id, data_original,
+                                     datetime.combine(nova_data, nova_hora.replace(second=0, microsecond=0)))
+                    cache.invalidar(PSICOLOGO_ID)
+                    st.rerun()
+                except agenda.ConflitoDeHorario as e:
+                    st.error("Horário ocupado: " + ", ".join(f"{nome} ({inicio_c[11:16]})" for _id, inicio_c, _d, nome in e.conflitos))
+                except Exception as e:
+                    st.error(f"Erro ao remarcar: {e}")
+
+@st.fragment
 def listar_agendamentos():
     st.subheader("🗓️ Próximos Agendamentos")
+    _mostrar_aviso("agendamentos")
 
-    # Inicializa conn e agendamentos fora do bloco try para garantir escopo e valores padrão
-    conn = None 
+    # Inicializa agendamentos fora do bloco try para garantir escopo e valor padrão
     agendamentos = [] 
 
     try:
-        conn = criar_conexao()
-        cursor = conn.cursor()
-        
         # Busca agendamentos do psicólogo, com o nome do paciente, ordenado por data e hora
-        cursor.execute("""
-            SELECT a.id, p.nome, a.data, a.hora, a.observacoes, a.paciente_id
-            FROM agendamentos a
-            JOIN pacientes p ON a.paciente_id = p.id
-            WHERE p.psicologo_id = ? AND a.data >= date('now', 'localtime')
-            ORDER BY a.data ASC, a.hora ASC
-        """, (PSICOLOGO_ID,))
-        agendamentos = cursor.fetchall()
+        agendamentos = carregar_agendamentos_futuros(PSICOLOGO_ID, datetime.today().date())
         
     except Exception as e:
         # Exibe um erro amigável caso haja problemas de conexão ou SQL
         st.error(f"Erro ao carregar agendamentos do banco de dados. Tente novamente. Detalhe: {e}")
         return # Sai da função em caso de erro
 
-    finally:
-        # ESSENCIAL: Garante que a conexão seja fechada, mesmo se houver erro
-        if conn:
-            conn.close() 
-
     if not agendamentos:
         st.info("Nenhum agendamento futuro encontrado.")
         return
 
     # Usar um container para a lista
     st.markdown(f"**Total de Agendamentos Futuros:** **{len(agendamentos)}**")
+    st.caption(f"Sessões recorrentes aparecem com as ocorrências dos próximos {agenda.DIAS_PROXIMAS_OCORRENCIAS} dias.")
     st.markdown("---")
     
-    # O loop de exibição permanece o mesmo, usando as variáveis corretamente
-    for id_agend, nome_paciente, data_str, hora_str, obs, paciente_id in agendamentos:
+    for id_agend, inicio, _duracao, nome_paciente, obs, paciente_id, serie_id, data_original in agendamentos:
         # Formata a data para exibição
-        data_exibicao = datetime.strptime(data_str, "%Y-%m-%d").strftime("%d/%m/%Y")
+        data_exibicao = datetime.strptime(inicio[:10], "%Y-%m-%d").strftime("%d/%m/%Y")
+        hora_str = inicio[11:16]
         
         with st.container(border=True):
             col_info, col_acao = st.columns([4, 2])
             
             with col_info:
-                st.markdown(f"**👤 Paciente:** {nome_paciente}")
+                st.markdown(f"**👤 Paciente:** {nome_paciente}" + (" 🔁" if serie_id is not None else ""))
                 st.markdown(f"**⏰ Data e Hora:** **{data_exibicao}** às **{hora_str}**")
                 
                 with st.expander("Observações do Agendamento"):
@@ -481,64 +841,42 @@ def listar_agendamentos():
 
             with col_acao:
                 st.write("") # Espaçamento para alinhar o botão
-                # Botão Excluir - Usa sua própria conexão segura
-                if st.button("❌ Excluir", key=f"excluir_agend_{id_agend}", use_container_width=True, type="secondary"):
-                    
-                    conn_del = None
-                    try:
-                        conn_del = criar_conexao()
-                        cursor_del = conn_del.cursor()
-                        cursor_del.execute("DELETE FROM agendamentos WHERE id = ?", (id_agend,))
-                        conn_del.commit()
-                        st.success(f"Agendamento com {nome_paciente} excluído.")
-                        st.experimental_rerun()
-                    except Exception as e:
-                        st.error(f"Erro ao excluir: {e}")
-                    finally:
-                        if conn_del:
-                            conn_del.close()
+                # Ocorrência de série: cancela só esta data (a série continua)
+                if serie_id is not None:
+                    st.button("❌ Cancelar", key=f"cancelar_ocorrencia_{serie_id}_{data_original}",
+                              use_container_width=True, type="secondary",
+                              on_click=_gravar, args=("agendamentos", f"Ocorrência de {nome_paciente} cancelada.",
+                                                      escrita.escrever, agenda.cancelar_ocorrencia, PSICOLOGO_ID, serie_id, data_original))
+                else:
+                    st.button("❌ Excluir", key=f"excluir_agend_{id_agend}", use_container_width=True, type="secondary",
+                              on_click=_gravar, args=("agendamentos", f"Agendamento com {nome_paciente} excluído.",
+                                                      escrita.executar, "DELETE FROM agendamentos WHERE id = ?", (id_agend,)))
 
 # ----------------------------------------------
 # 4. GESTÃO DE CUSTOS/FINANCEIRO (NOVA E MELHORADA)
 # ----------------------------------------------
 
+def get_resumo_financeiro():
+    """Busca os totais (receita, custos, lucro), os totais por mês e os custos por
+    categoria, todos em centavos e já somados no banco."""
+    try:
+        return carregar_resumo_financeiro(PSICOLOGO_ID)
+    except Exception as e:
+        st.error(f"Erro ao carregar resumo financeiro: {e}")
+        return (0, 0, 0), [], []
+
 # Substitua a função get_dados_financeiros()
 def get_dados_financeiros():
-    """Busca todos os custos e receita do psicólogo de forma segura."""
-    conn = None
+    """Busca os lançamentos mais recentes de custos e receita do psicólogo de forma segura."""
     df_custos = pd.DataFrame()
     df_receita = pd.DataFrame()
     
     try:
-        conn = criar_conexao()
-        
-        # 1. Busca Custos
-        df_custos = pd.read_sql_query(
-            "SELECT * FROM custos WHERE psicologo_id = ? ORDER BY data DESC", 
-            conn, 
-            params=(PSICOLOGO_ID,)
-        )
-        
-        # 2. Busca Receita (Sessões)
-        # Junta com o nome do paciente para possível análise futura
-        df_receita = pd.read_sql_query(
-            """
-            SELECT s.data, s.valor, p.nome as paciente_nome
-            FROM sessoes s
-            JOIN pacientes p ON s.paciente_id = p.id
-            WHERE p.psicologo_id = ? AND s.valor IS NOT NULL
-            """, 
-            conn, 
-            params=(PSICOLOGO_ID,)
-        )
-        
+        df_custos, df_receita = carregar_transacoes(PSICOLOGO_ID)
     except Exception as e:
         st.error(f"Erro ao carregar dados financeiros: {e}")
         df_custos = pd.DataFrame()
         df_receita = pd.DataFrame()
-    finally:
-        if conn:
-            conn.close()
     
     return df_custos, df_receita
 
@@ -550,15 +888,9 @@ def gestao_custos():
     # ----------------------------------------------------
     # 1. VISUALIZAÇÃO DE KPIs (RECEITA, CUSTO E LUCRO)
     # ----------------------------------------------------
+    # Os totais vêm dos resumos mensais, somados no SQLite em centavos inteiros
+    (total_receita, total_custos, lucro), mensal, custos_por_categoria = get_resumo_financeiro()
     df_custos, df_receita = get_dados_financeiros()
-    
-    total_custos = df_custos['valor'].sum() if not df_custos.empty else 0.0
-    total_receita = df_receita['valor'].sum() if not df_receita.empty else 0.0
-    lucro = total_receita - total_custos
-    
-    # Função auxiliar para formatar em moeda brasileira
-    def formatar_moeda(valor):
-        return f"R$ {valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
 
     col_receita, col_custo, col_lucro = st.columns(3)
     
@@ -566,7 +898,7 @@ def gestao_custos():
     with col_receita:
         st.metric(
             label="RECEITA TOTAL (Sessões)", 
-            value=formatar_moeda(total_receita),
+            value=moeda.formatar(total_receita),
             delta=f"Último mês: +R$ 0,00", # Placeholder para futura análise de delta
             delta_color="normal"
         )
@@ -575,7 +907,7 @@ def gestao_custos():
     with col_custo:
         st.metric(
             label="CUSTOS TOTAIS", 
-            value=formatar_moeda(total_custos),
+            value=moeda.formatar(total_custos),
             delta_color="inverse" # Usa cor inversa para indicar que é uma saída
         )
 
@@ -583,7 +915,7 @@ def gestao_custos():
     with col_lucro:
         st.metric(
             label="LUCRO LÍQUIDO", 
-            value=formatar_moeda(lucro),
+            value=moeda.formatar(lucro),
             delta=f"{(lucro / total_receita * 100):.1f}% de Margem" if total_receita > 0 else "Sem Receita",
             delta_color="normal" if lucro >= 0 else "inverse"
         )
@@ -607,23 +939,19 @@ def gestao_custos():
 
             if st.form_submit_button("💾 Salvar Despesa", use_container_width=True):
                 if descricao and valor:
-                    conn = None
                     try:
-                        conn = criar_conexao()
-                        cursor = conn.cursor()
                         data_str = data_custo.strftime("%Y-%m-%d")
-                        cursor.execute(
-                            "INSERT INTO custos (psicologo_id, descricao, valor, data, categoria) VALUES (?, ?, ?, ?, ?)",
-                            (PSICOLOGO_ID, descricao, valor, data_str, categoria)
+                        valor_centavos = moeda.para_centavos(valor)
+                        escrita.executar(
+                            PSICOLOGO_ID,
+                            "INSERT INTO custos (psicologo_id, descricao, valor_centavos, data, categoria) VALUES (?, ?, ?, ?, ?)",
+                            (PSICOLOGO_ID, descricao, valor_centavos, data_str, categoria)
                         )
-                        conn.commit()
-                        st.success(f"Despesa de R$ {valor:.2f} salva com sucesso!")
-                        st.experimental_rerun()
+                        cache.invalidar(PSICOLOGO_ID)
+                        st.toast(f"Despesa de {moeda.formatar(valor_centavos)} salva com sucesso!")
+                        st.rerun()
                     except Exception as e:
                         st.error(f"Erro ao salvar despesa: {e}")
-                    finally:
-                        if conn:
-                            conn.close()
                 else:
                     st.error("Preencha a descrição e o valor.")
     
@@ -631,139 +959,255 @@ def gestao_custos():
     # 3. ANÁLISE GRÁFICA E TABELA
     # ----------------------------------------------------
     with col_cat:
-        visualizar_custos(df_custos, df_receita)
+        visualizar_custos(df_custos, df_receita, mensal, custos_por_categoria)
+
+    st.markdown("---")
+    with st.expander("⬇️ Exportar Dados Financeiros"):
+        painel_exportacao(["custos", "sessoes"], "financeiro")
     
 
 # Substitua a função visualizar_custos()
-def visualizar_custos(df_custos, df_receita):
+def visualizar_custos(df_custos, df_receita, mensal, custos_por_categoria):
     st.markdown("##### 📈 Análise Gráfica Detalhada")
 
-    if df_custos.empty and df_receita.empty:
+    if not mensal:
         st.info("Sem dados para análise. Registre receitas (sessões) e despesas (custos).")
         return
 
-    # Gráfico de Receita vs Custo por Mês
+    # Gráfico de Receita vs Custo por Mês (somados e ordenados pelo SQLite; só
+    # a conversão centavos -> reais para o eixo acontece aqui)
     st.markdown("###### Receita e Custos ao Longo do Tempo")
-    
-    # Prepara dados de custo por mês
-    if not df_custos.empty:
-        df_custos['Ano/Mês'] = df_custos['data'].apply(lambda x: datetime.strptime(x, "%Y-%m-%d").strftime("%Y-%m"))
-        custos_por_mes = df_custos.groupby('Ano/Mês')['valor'].sum().reset_index().rename(columns={'valor': 'Custos'})
-    else:
-        custos_por_mes = pd.DataFrame({'Ano/Mês': [], 'Custos': []})
-        
-    # Prepara dados de receita por mês
-    if not df_receita.empty:
-        df_receita['Ano/Mês'] = df_receita['data'].apply(lambda x: datetime.strptime(x, "%Y-%m-%d").strftime("%Y-%m"))
-        receita_por_mes = df_receita.groupby('Ano/Mês')['valor'].sum().reset_index().rename(columns={'valor': 'Receita'})
-    else:
-        receita_por_mes = pd.DataFrame({'Ano/Mês': [], 'Receita': []})
-        
-    # Combina os dois dataframes
-    df_mensal = pd.merge(custos_por_mes, receita_por_mes, on='Ano/Mês', how='outer').fillna(0)
-    df_mensal = df_mensal.sort_values('Ano/Mês').set_index('Ano/Mês')
-    
+    df_mensal = pd.DataFrame(mensal, columns=['Ano/Mês', 'Receita', 'Custos']).set_index('Ano/Mês') / 100
     st.line_chart(df_mensal[['Receita', 'Custos']])
 
     # 1. Gráfico de Distribuição de Custos por Categoria
     st.markdown("###### Distribuição de Custos por Categoria")
-    if not df_custos.empty:
-        custos_por_categoria = df_custos.groupby('categoria')['valor'].sum().sort_values(ascending=False).reset_index()
-        st.bar_chart(custos_por_categoria.set_index('categoria'))
+    if custos_por_categoria:
+        df_categorias = pd.DataFrame(custos_por_categoria, columns=['categoria', 'total']).set_index('categoria') / 100
+        st.bar_chart(df_categorias)
     else:
         st.info("Nenhum custo registrado para análise de categoria.")
 
 
     st.markdown("---")
     st.markdown("###### Histórico de Transações")
+    st.caption(f"Últimos {consultas.LIMITE_TRANSACOES} lançamentos de cada tipo.")
     
     # Tabela de Histórico de Custos
     if not df_custos.empty:
         st.markdown("**Despesas (Custos)**")
-        df_custos_table = df_custos[['data', 'descricao', 'categoria', 'valor']].copy()
+        df_custos_table = df_custos[['data', 'descricao', 'categoria', 'valor_centavos']].copy()
         df_custos_table.columns = ['Data', 'Descrição', 'Categoria', 'Valor (R$)']
-        df_custos_table['Valor (R$)'] = df_custos_table['Valor (R$)'].apply(lambda x: f"R$ {x:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."))
-        df_custos_table['Data'] = df_custos_table['Data'].apply(lambda x: datetime.strptime(x, "%Y-%m-%d").strftime("%d/%m/%Y"))
+        df_custos_table['Valor (R$)'] = df_custos_table['Valor (R$)'].apply(moeda.formatar)
+        df_custos_table['Data'] = df_custos_table['Data'].dt.strftime("%d/%m/%Y")
         st.dataframe(df_custos_table, use_container_width=True, hide_index=True)
 
     # Tabela de Histórico de Receitas
     if not df_receita.empty:
         st.markdown("**Receitas (Sessões)**")
-        df_receita_table = df_receita[['data', 'paciente_nome', 'valor']].copy()
+        df_receita_table = df_receita[['data', 'paciente_nome', 'valor_centavos']].copy()
         df_receita_table.columns = ['Data', 'Paciente', 'Valor (R$)']
-        df_receita_table['Valor (R$)'] = df_receita_table['Valor (R$)'].apply(lambda x: f"R$ {x:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."))
-        df_receita_table['Data'] = df_receita_table['Data'].apply(lambda x: datetime.strptime(x, "%Y-%m-%d").strftime("%d/%m/%Y"))
+        df_receita_table['Valor (R$)'] = df_receita_table['Valor (R$)'].apply(moeda.formatar)
+        df_receita_table['Data'] = df_receita_table['Data'].dt.strftime("%d/%m/%Y")
         st.dataframe(df_receita_table, use_container_width=True, hide_index=True)
 
-# Lembre-se de adicionar 'from datetime import datetime' e 'import pandas as pd' no topo do arquivo se já não estiverem!
-# ... (todas as funções)
-
 # ----------------------------------------------
-# 5. INTERFACE PRINCIPAL
+# 5. IMPORTAÇÃO E EXPORTAÇÃO EM LOTE
 # ----------------------------------------------
 
-# ----------------------------------------------
-# 5. INTERFACE PRINCIPAL
-# ----------------------------------------------
+# Fragmento: escolher período/formato e gerar o arquivo não reexecuta a aba.
+# O arquivo é montado em disco bloco a bloco (exportacao.py) e só então
+# entregue ao botão de download. O Streamlit guarda em memória os bytes do
+# download (não há download em streaming), então arquivos acima de
+# exportacao.MAX_BYTES_DOWNLOAD são recusados aqui.
+@st.fragment
+def painel_exportacao(tipos, chave):
+    rotulos = {"sessoes": "Sessões", "custos": "Custos", "agendamentos": "Agendamentos"}
+    col_tipo, col_formato = st.columns(2)
+    with col_tipo:
+        tipo = st.selectbox("Dados", tipos, format_func=rotulos.get, key=f"exportar_tipo_{chave}")
+    with col_formato:
+        formato = st.radio("Formato", exportacao.FORMATOS, format_func=str.upper, horizontal=True, key=f"exportar_formato_{chave}")
+
+    col_de, col_ate = st.columns(2)
+    with col_de:
+        data_inicio = st.date_input("De", value=datetime(datetime.today().year, 1, 1).date(), key=f"exportar_de_{chave}")
+    with col_ate:
+        data_fim = st.date_input("Até", value=datetime.today().date(), key=f"exportar_ate_{chave}")
+
+    if st.button("Gerar arquivo", key=f"exportar_gerar_{chave}", use_container_width=True):
+        inicio_str, fim_str = data_inicio.strftime("%Y-%m-%d"), data_fim.strftime("%Y-%m-%d")
+        try:
+            with conexao(PSICOLOGO_ID) as conn:
+                arquivo, total = exportacao.exportar_para_arquivo_temporario(
+                    conn, tipo, PSICOLOGO_ID, inicio_str, fim_str, formato,
+                    limite_bytes=exportacao.MAX_BYTES_DOWNLOAD,
+                )
+        except exportacao.ExportacaoGrande as e:
+            st.warning(str(e))
+            return
+        except Exception as e:
+            st.error(f"Erro ao exportar: {e}")
+            return
+
+        with arquivo:
+            st.download_button(
+                f"⬇️ Baixar {total} registro(s)",
+                data=arquivo,
+                file_name=f"{tipo}_{inicio_str}_{fim_str}.{formato}",
+                mime="text/csv" if formato == "csv" else "application/octet-stream",
+                key=f"exportar_baixar_{chave}",
+                use_container_width=True,
+            )
 
-# Movendo o título para um container de cabeçalho
-with st.container():
-    col_titulo, col_sair = st.columns([5, 1])
-    with col_titulo:
-        # UNIFICADO: O título principal agora contém a saudação e o nome
-        st.title(f"👋 Painel de Gestão: Dr(a). {st.session_state['nome_psicologo']}")
-        # st.subheader(f"Dr(a). {NOME_PSICOLOGO}") # REMOVA esta subheader se já usou a linha acima
-    with col_sair:
-        st.markdown("<br>", unsafe_allow_html=True) # Espaço para alinhar
-        if st.button("🔒 Sair", type="primary", use_container_width=True):
-            st.session_state["logado"] = False
-            st.session_state["psicologo_id"] = None
-            st.session_state["nome_psicologo"] = None
-            st.switch_page("Home.py")
-
-st.markdown("---") # Divisor visual
-
-# ... (o resto do código com as abas)
-
-st.markdown("---") # Divisor visual
-
-# Otimização da Interface com abas
-abas = st.tabs([
-    "Cadastrar Paciente", 
-    "Pacientes & Detalhes", 
-    "Agendamentos",
-    "Registrar Sessão", 
-    "Histórico de Sessões", 
-    "Gestão Financeira"
-])
-
-# Remanejando as funções nas abas para melhor fluxo (Cadastro -> Lista -> Agendamento -> Sessão)
-
-with abas[0]:
-    cadastrar_paciente()
-
-with abas[1]:
-    listar_pacientes()
-
-with abas[2]:
-    cadastrar_agendamento()
-    st.markdown("---")
-    listar_agendamentos()
+def importar_dados():
+    st.subheader("📥 Importar Dados (CSV/Excel)")
+    st.caption(
+        "A primeira linha deve ter os nomes das colunas. "
+        "Pacientes: nome, telefone, email, carteirinha, observacoes. "
+        "Sessões: paciente (nome) ou carteirinha, data, descricao, valor_unitario (ou valor), qtd_sessoes, tipo_receita. "
+        "Custos: data, descricao, valor, categoria."
+    )
+
+    rotulos = {"pacientes": "Pacientes", "sessoes": "Sessões", "custos": "Custos"}
+    tipo = st.radio("O que será importado?", importacao.TIPOS_IMPORTACAO, format_func=rotulos.get, horizontal=True)
+    arquivo = st.file_uploader("Arquivo", type=["csv", "xlsx"])
+
+    if arquivo and st.button("📥 Importar", use_container_width=True, type="primary"):
+        progresso = st.empty()
+        try:
+            with conexao(PSICOLOGO_ID) as conn:
+                # A conexão só lê (pacientes das sessões); cada lote vai pelo escritor único
+                relatorio = importacao.importar_arquivo(
+                    conn, tipo, PSICOLOGO_ID, arquivo, arquivo.name,
+                    ao_progredir=lambda lidas: progresso.caption(f"{lidas} linhas processadas..."),
+                    gravar_lote=lambda sql, registros: escrita.executar_lote(PSICOLOGO_ID, sql, registros),
+                )
+        except Exception as e:
+            st.error(f"Erro ao importar: {e}")
+            return
+        finally:
+            # Mesmo com erro no meio, os lotes anteriores já foram gravados
+            cache.invalidar(PSICOLOGO_ID)
+
+        st.success(f"{relatorio['inseridos']} registro(s) importado(s).")
+        if relatorio["total_erros"]:
+            st.warning(f"{relatorio['total_erros']} linha(s) com erro não foram importadas.")
+            df_erros = pd.DataFrame(relatorio["erros"], columns=["Linha", "Erro"])
+            st.dataframe(df_erros, use_container_width=True, hide_index=True)
 
-with abas[3]:
-    cadastrar_sessao()
+# Lembre-se de adicionar 'from datetime import datetime' e 'import pandas as pd' no topo do arquivo se já não estiverem!
+# ... (todas as funções)
 
-with abas[4]:
-    listar_sessoes()
+# ----------------------------------------------
+# 6. INTERFACE PRINCIPAL
+# ----------------------------------------------
 
-with abas[5]:
-    gestao_custos()
+def sair(todos_os_dispositivos=False):
+    # Revoga o token: a URL antiga deixa de abrir o painel. Com
+    # todos_os_dispositivos, revoga os de todas as abas e aparelhos.
+    if todos_os_dispositivos:
+        autenticacao.revogar_sessoes_do_psicologo(PSICOLOGO_ID)
+    else:
+        autenticacao.revogar_token_sessao(st.session_state.get("token_sessao"))
+    autenticacao.encerrar_sessao(st.session_state)
+    st.query_params.clear()
+    st.switch_page("Home.py")
+
+# Com PSYCONTROL_RASTREIO=1, registra todo o SQL deste rerun (painel na sidebar).
+# O finally encerra a coleta mesmo quando st.rerun, st.stop ou st.switch_page
+# interrompem o script no meio. Ficam de fora: os reruns de fragmento (só a
+# função do fragmento roda de novo) e o SQL gravado pela thread de escrita
+# (escrita.py), então os totais subestimam as gravações.
+coleta_sql = iniciar_coleta()
+try:
+    # Movendo o título para um container de cabeçalho
+    with st.container():
+        col_titulo, col_sair = st.columns([5, 1])
+        with col_titulo:
+            # UNIFICADO: O título principal agora contém a saudação e o nome
+            st.title(f"👋 Painel de Gestão: Dr(a). {st.session_state['nome_psicologo']}")
+            # st.subheader(f"Dr(a). {NOME_PSICOLOGO}") # REMOVA esta subheader se já usou a linha acima
+        with col_sair:
+            st.markdown("<br>", unsafe_allow_html=True) # Espaço para alinhar
+            if st.button("🔒 Sair", type="primary", use_container_width=True):
+                sair()
+
+    if st.sidebar.button("🚪 Sair de todos os dispositivos", use_container_width=True,
+                         help="Encerra as sessões abertas em outras abas e aparelhos"):
+        sair(todos_os_dispositivos=True)
+
+    st.markdown("---") # Divisor visual
+
+    # ... (o resto do código com as abas)
+
+    st.markdown("---") # Divisor visual
+
+    # Navegação por seções: diferente de st.tabs (que executa o corpo de TODAS as
+    # abas a cada rerun), só a seção escolhida roda suas consultas e widgets.
+    # A escolha fica em st.session_state["secao_ativa"] entre os reruns.
+    def secao_agendamentos():
+        cadastrar_agendamento()
+        st.markdown("---")
+        calendario_agendamentos()
+        gerenciar_series()
+        st.markdown("---")
+        listar_agendamentos()
+
+    # Remanejando as funções nas seções para melhor fluxo (Cadastro -> Lista -> Agendamento -> Sessão)
+    SECOES = {
+        "Cadastrar Paciente": cadastrar_paciente,
+        "Pacientes & Detalhes": listar_pacientes,
+        "Agendamentos": secao_agendamentos,
+        "Registrar Sessão": cadastrar_sessao,
+        "Histórico de Sessões": listar_sessoes,
+        "Gestão Financeira": gestao_custos,
+        "Importar Dados": importar_dados,
+    }
+
+    secao_ativa = st.radio(
+        "Seção",
+        list(SECOES),
+        horizontal=True,
+        key="secao_ativa",
+        label_visibility="collapsed",
+    )
+
+    SECOES[secao_ativa]()
+
+
+    # Cache de dados deste psicólogo: memória retida por carregador. Os números do
+    # processo inteiro (todos os psicólogos) só aparecem com o rastreio de SQL ligado.
+    with st.sidebar.expander("📊 Cache de dados"):
+        if database.RASTREIO_ATIVO:
+            estatisticas_cache = cache.estatisticas()
+            st.caption(
+                f"Processo — Acertos: {estatisticas_cache['acertos']} | Falhas: {estatisticas_cache['falhas']} | "
+                f"Taxa: {estatisticas_cache['taxa_acerto']:.0%}"
+            )
+            st.caption(f"Itens: {estatisticas_cache['itens']}/{estatisticas_cache['max_itens']} | Descartes (LRU): {estatisticas_cache['descartes']}")
+        memoria_cache = sorted(cache.memoria(PSICOLOGO_ID).items(), key=lambda item: item[1][1], reverse=True)
+        st.dataframe(
+            pd.DataFrame(
+                [(nome, itens, round(tamanho / 1024, 1)) for nome, (itens, tamanho) in memoria_cache],
+                columns=["Carregador", "Itens", "KB"],
+            ),
+            hide_index=True, use_container_width=True,
+        )
 
+    # Painel de depuração: só aparece com o rastreio de SQL ligado
+    if coleta_sql is not None:
+        with st.sidebar.expander("🐢 SQL desta execução"):
+            st.caption(
+                f"{coleta_sql.instrucoes} instruções em {coleta_sql.ms_total:.1f} ms | "
+                f"Conexões: {coleta_sql.conexoes_emprestadas} emprestadas, {coleta_sql.conexoes_abertas} abertas"
+            )
+            mais_lentas = [(round(r.ms, 2), r.linhas, r.sql) for r in coleta_sql.mais_lentas(10)]
+            st.dataframe(pd.DataFrame(mais_lentas, columns=["ms", "Linhas", "SQL"]), hide_index=True, use_container_width=True)
 
-# Botão de Sair no final da página
-st.markdown("---")
-if st.button("🔒 Sair do Painel", type="primary"):
-    st.session_state["logado"] = False
-    st.session_state["psicologo_id"] = None
-    st.session_state["nome_psicologo"] = None
-    st.switch_page("Home.py")
\ No newline at end of file
+    # Botão de Sair no final da página
+    st.markdown("---")
+    if st.button("🔒 Sair do Painel", type="primary"):
+        sair()
+finally:
+    encerrar_coleta()
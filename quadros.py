@@ -0,0 +1,39 @@
+"""DataFrames compactos para os carregadores financeiros do painel (requer pandas).
+
+Cada DataFrame fica no cache (cache.py) de cada processo do Streamlit até a próxima
+escrita do psicólogo. Com muitas sessões abertas, são esses objetos que fazem
+crescer a memória residente do servidor. Por isso:
+  - o SQL traz só as colunas que a tela mostra (consultas.SQL_CUSTOS/SQL_RECEITA);
+  - a data vira datetime64 (8 bytes por linha, em vez de um str Python);
+  - texto repetido (categoria, nome do paciente) vira category: cada valor
+    distinto é guardado uma vez, e cada linha guarda só um código;
+  - inteiros (centavos) usam o menor tipo em que os valores cabem.
+"""
+import pandas as pd
+
+import consultas
+
+# Colunas de cada consulta: (datas, categóricas, inteiros a compactar)
+COLUNAS_CUSTOS = (("data",), ("categoria",), ("valor_centavos",))
+COLUNAS_RECEITA = (("data",), ("paciente_nome",), ("valor_centavos",))
+
+
+def ler(conn, sql, params, datas=(), categorias=(), inteiros=()):
+    """pd.read_sql_query com os tipos compactos descritos acima."""
+    df = pd.read_sql_query(
+        sql, conn, params=params,
+        parse_dates={coluna: {"format": "%Y-%m-%d"} for coluna in datas},
+    )
+    for coluna in categorias:
+        df[coluna] = df[coluna].astype("category")
+    for coluna in inteiros:
+        df[coluna] = pd.to_numeric(df[coluna], downcast="integer")
+    return df
+
+def ler_custos(conn, psicologo_id, limite=consultas.LIMITE_TRANSACOES):
+    # data, descricao, categoria, valor_centavos dos lançamentos mais recentes
+    return ler(conn, consultas.SQL_CUSTOS, (psicologo_id, limite), *COLUNAS_CUSTOS)
+
+def ler_receita(conn, psicologo_id, limite=consultas.LIMITE_TRANSACOES):
+    # data, valor_centavos, paciente_nome das sessões mais recentes
+    return ler(conn, consultas.SQL_RECEITA, (psicologo_id, limite), *COLUNAS_RECEITA)
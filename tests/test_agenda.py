@@ -0,0 +1,71 @@
+"""Regras das séries recorrentes e horários livres (agenda.py).
+
+    python -m pytest tests      (ou python -m unittest discover tests)
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import agenda
+import migracao
+
+
+class DatasDaRegraTest(unittest.TestCase):
+    def test_semanal_comeca_na_primeira_ocorrencia_do_periodo(self):
+        datas = list(agenda.datas_da_regra("semanal", date(2024, 1, 1), None, date(2024, 1, 10), date(2024, 1, 31)))
+        self.assertEqual(datas, [date(2024, 1, 15), date(2024, 1, 22), date(2024, 1, 29)])
+
+    def test_quinzenal_para_na_data_final(self):
+        datas = list(agenda.datas_da_regra("quinzenal", date(2024, 1, 1), date(2024, 1, 29), date(2024, 1, 1), date(2024, 3, 1)))
+        self.assertEqual(datas, [date(2024, 1, 1), date(2024, 1, 15), date(2024, 1, 29)])
+
+    def test_mensal_usa_o_ultimo_dia_dos_meses_curtos(self):
+        datas = list(agenda.datas_da_regra("mensal", date(2024, 1, 31), None, date(2024, 1, 1), date(2024, 5, 1)))
+        self.assertEqual(datas, [date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31), date(2024, 4, 30)])
+
+    def test_periodo_antes_do_inicio(self):
+        self.assertEqual(list(agenda.datas_da_regra("semanal", date(2024, 6, 1), None, date(2024, 1, 1), date(2024, 2, 1))), [])
+
+
+class HorariosLivresTest(unittest.TestCase):
+    DIA = date(2024, 3, 4) # Segunda-feira
+
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.conn = sqlite3.connect(os.path.join(self.diretorio.name, "agenda.db"))
+        migracao.aplicar_migracoes(self.conn)
+        self.conn.execute("INSERT INTO psicologos (nome, usuario, senha) VALUES ('Ana', 'ana', '!')")
+        self.conn.execute(
+            "INSERT INTO pacientes (psicologo_id, nome, telefone, nome_busca, telefone_digitos) VALUES (1, 'Bia', '1', 'bia', '1')"
+        )
+        self.conn.commit()
+
+    def tearDown(self):
+        self.conn.close()
+        self.diretorio.cleanup()
+
+    def _livres(self, duracao_min=60):
+        return [h.strftime("%H:%M") for h in agenda.horarios_livres(
+            self.conn, 1, self.DIA, duracao_min, inicio_expediente="08:00", fim_expediente="12:00", passo=60)]
+
+    def test_dia_vazio(self):
+        self.assertEqual(self._livres(), ["08:00", "09:00", "10:00", "11:00"])
+
+    def test_agendamento_avulso_ocupa_o_horario(self):
+        agenda.agendar(self.conn, 1, 1, datetime(2024, 3, 4, 9, 30), duracao_min=50)
+        self.assertEqual(self._livres(), ["08:00", "11:00"])
+
+    def test_ocorrencia_de_serie_ocupa_e_cancelada_libera(self):
+        serie_id = agenda.criar_serie(self.conn, 1, 1, datetime(2024, 2, 26, 10, 0), duracao_min=60)
+        self.assertEqual(self._livres(), ["08:00", "09:00", "11:00"])
+        agenda.cancelar_ocorrencia(self.conn, 1, serie_id, "2024-03-04")
+        self.assertEqual(self._livres(), ["08:00", "09:00", "10:00", "11:00"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+"""Limite de tentativas de login (autenticacao.py).
+
+    python -m pytest tests      (ou python -m unittest discover tests)
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import autenticacao
+    import database
+except ImportError: # bcrypt não instalado
+    autenticacao = None
+
+
+@unittest.skipIf(autenticacao is None, "dependências do login ausentes")
+class FalhasLembradasTest(unittest.TestCase):
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.caminho_original = database.DB_PATH
+        database.configurar(os.path.join(self.diretorio.name, "teste.db"))
+        database.inicializar_banco()
+        self.maximo_original = autenticacao.MAX_USUARIOS_COM_FALHAS
+        autenticacao.MAX_USUARIOS_COM_FALHAS = 50
+        autenticacao._falhas.clear()
+
+    def tearDown(self):
+        autenticacao.MAX_USUARIOS_COM_FALHAS = self.maximo_original
+        autenticacao._falhas.clear()
+        database.configurar(self.caminho_original)
+        self.diretorio.cleanup()
+
+    def test_usuarios_inexistentes_nao_crescem_sem_limite(self):
+        for numero in range(500):
+            self.assertIsNone(autenticacao.autenticar(f"inexistente-{numero}", "senha"))
+            self.assertLessEqual(len(autenticacao._falhas), 50)
+        # Os lembrados são os de falha mais recente
+        self.assertIn("inexistente-499", autenticacao._falhas)
+        self.assertNotIn("inexistente-0", autenticacao._falhas)
+
+    def test_falhas_vencidas_sao_varridas(self):
+        autenticacao.autenticar("antigo", "senha")
+        autenticacao._falhas["antigo"] = [m - autenticacao.JANELA_FALHAS - 1 for m in autenticacao._falhas["antigo"]]
+        autenticacao.autenticar("novo", "senha")
+        self.assertEqual(list(autenticacao._falhas), ["novo"])
+
+    def test_bloqueio_continua_valendo(self):
+        for _ in range(autenticacao.LIMITE_FALHAS):
+            autenticacao.autenticar("alvo", "senha")
+        with self.assertRaises(autenticacao.TentativasExcedidas):
+            autenticacao.autenticar("alvo", "senha")
+
+
+@unittest.skipIf(autenticacao is None, "dependências do login ausentes")
+class TokenSessaoTest(unittest.TestCase):
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.caminho_original = database.DB_PATH
+        database.configurar(os.path.join(self.diretorio.name, "teste.db"))
+        database.inicializar_banco()
+        with database.conexao() as conn:
+            self.psicologo_id = conn.execute(
+                "INSERT INTO psicologos (nome, usuario, senha) VALUES ('Ana', 'ana', '!')"
+            ).lastrowid
+
+    def tearDown(self):
+        autenticacao.escrita.encerrar()
+        database.configurar(self.caminho_original)
+        self.diretorio.cleanup()
+
+    def test_token_da_url_serve_varias_abas(self):
+        token = autenticacao.criar_token_sessao(self.psicologo_id)
+        estado, outra_aba = {}, {}
+        self.assertTrue(autenticacao.restaurar_sessao(estado, {autenticacao.PARAMETRO_SESSAO: token}))
+        self.assertEqual(estado["token_sessao"], token)
+        self.assertTrue(autenticacao.restaurar_sessao(outra_aba, {autenticacao.PARAMETRO_SESSAO: token}))
+        self.assertEqual(outra_aba["psicologo_id"], self.psicologo_id)
+
+    def test_token_revogado_nao_restaura(self):
+        token = autenticacao.criar_token_sessao(self.psicologo_id)
+        autenticacao.revogar_token_sessao(token)
+        self.assertFalse(autenticacao.restaurar_sessao({}, {autenticacao.PARAMETRO_SESSAO: token}))
+
+    def test_sair_de_todos_derruba_na_renovacao(self):
+        estado = {}
+        autenticacao.restaurar_sessao(estado, {autenticacao.PARAMETRO_SESSAO: autenticacao.criar_token_sessao(self.psicologo_id)})
+        autenticacao.revogar_sessoes_do_psicologo(self.psicologo_id)
+        self.assertTrue(autenticacao.renovar_sessao(estado)) # Ainda dentro de RENOVAR_A_CADA
+        estado["token_renovado_em"] = 0
+        self.assertFalse(autenticacao.renovar_sessao(estado))
+        self.assertFalse(estado["logado"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+"""Invalidação por geração do cache dos carregadores (cache.py).
+
+    python -m pytest tests      (ou python -m unittest discover tests)
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache import CacheGeracional
+
+
+class CacheGeracionalTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = CacheGeracional(max_itens=10)
+        self.chamadas = []
+
+        @self.cache.em_cache
+        def carregar(psicologo_id, pagina=0):
+            self.chamadas.append((psicologo_id, pagina))
+            return [psicologo_id, pagina, len(self.chamadas)]
+
+        self.carregar = carregar
+
+    def test_reaproveita_ate_a_proxima_escrita(self):
+        primeiro = self.carregar(1)
+        self.assertIs(self.carregar(1), primeiro)
+        self.assertEqual(len(self.chamadas), 1)
+        self.cache.invalidar(1)
+        self.assertIsNot(self.carregar(1), primeiro)
+        self.assertEqual(len(self.chamadas), 2)
+
+    def test_invalidar_um_psicologo_nao_afeta_outro(self):
+        self.carregar(1)
+        self.carregar(2)
+        self.cache.invalidar(1)
+        self.carregar(2)
+        self.assertEqual(self.chamadas, [(1, 0), (2, 0)])
+        self.assertEqual(set(self.cache.memoria(2)), {"carregar"})
+        self.assertEqual(self.cache.memoria(1), {})
+
+    def test_escrita_durante_a_consulta_nao_guarda_o_resultado(self):
+        @self.cache.em_cache
+        def carregar_com_escrita(psicologo_id):
+            self.cache.invalidar(psicologo_id) # Outra aba gravou enquanto a consulta rodava
+            return object()
+
+        carregar_com_escrita(1)
+        self.assertEqual(self.cache.estatisticas()["itens"], 0)
+
+    def test_limite_de_itens_descarta_o_menos_recente(self):
+        for pagina in range(11):
+            self.carregar(1, pagina=pagina)
+        self.carregar(1, pagina=0)
+        self.assertEqual(self.cache.estatisticas()["descartes"], 2)
+        self.assertEqual(self.chamadas.count((1, 0)), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
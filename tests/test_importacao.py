@@ -0,0 +1,59 @@
+"""Leitura de valores e quantidades das planilhas (importacao.py).
+
+    python -m pytest tests      (ou python -m unittest discover tests)
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import importacao
+from importacao import ErroLinha
+
+
+class CentavosTest(unittest.TestCase):
+    def test_formatos_de_texto(self):
+        self.assertEqual(importacao._centavos({"valor": "150"}, "valor"), 15000)
+        self.assertEqual(importacao._centavos({"valor": "1234.56"}, "valor"), 123456)
+        self.assertEqual(importacao._centavos({"valor": "R$ 1.234,56"}, "valor"), 123456)
+        self.assertEqual(importacao._centavos({"valor": "0,1"}, "valor"), 10)
+
+    def test_numero_vindo_do_excel(self):
+        self.assertEqual(importacao._centavos({"valor": 99.9}, "valor"), 9990)
+
+    def test_vazio_vira_none(self):
+        self.assertIsNone(importacao._centavos({"valor": "  "}, "valor"))
+        self.assertIsNone(importacao._centavos({}, "valor"))
+
+    def test_invalido_ou_negativo(self):
+        with self.assertRaisesRegex(ErroLinha, "valor inválido"):
+            importacao._centavos({"valor": "dez reais"}, "valor")
+        with self.assertRaisesRegex(ErroLinha, "negativo"):
+            importacao._centavos({"valor": "-5"}, "valor")
+
+
+class InteiroTest(unittest.TestCase):
+    def test_aceita_inteiros(self):
+        self.assertEqual(importacao._inteiro({"qtd": "2"}, "qtd", 1), 2)
+        self.assertEqual(importacao._inteiro({"qtd": "2.0"}, "qtd", 1), 2)
+        self.assertEqual(importacao._inteiro({"qtd": 3.0}, "qtd", 1), 3)
+
+    def test_vazio_usa_o_padrao(self):
+        self.assertEqual(importacao._inteiro({"qtd": ""}, "qtd", 1), 1)
+        self.assertEqual(importacao._inteiro({}, "qtd", 1), 1)
+
+    def test_recusa_fracao_sem_truncar(self):
+        for texto in ("2.7", "2,5"):
+            with self.assertRaisesRegex(ErroLinha, "número inteiro"):
+                importacao._inteiro({"qtd": texto}, "qtd", 1)
+
+    def test_recusa_texto_e_zero(self):
+        with self.assertRaisesRegex(ErroLinha, "número inválido"):
+            importacao._inteiro({"qtd": "duas"}, "qtd", 1)
+        with self.assertRaisesRegex(ErroLinha, "pelo menos 1"):
+            importacao._inteiro({"qtd": "0"}, "qtd", 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+"""Conversão e divisão de valores em centavos (moeda.py).
+
+    python -m pytest tests      (ou python -m unittest discover tests)
+"""
+import os
+import sys
+import unittest
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import moeda
+
+
+class ParaCentavosTest(unittest.TestCase):
+    def test_tipos_aceitos(self):
+        self.assertEqual(moeda.para_centavos(150), 15000)
+        self.assertEqual(moeda.para_centavos(0.1), 10)
+        self.assertEqual(moeda.para_centavos(Decimal("1234.56")), 123456)
+        self.assertEqual(moeda.para_centavos("1234.56"), 123456)
+        self.assertIsNone(moeda.para_centavos(None))
+
+    def test_sem_residuo_de_float(self):
+        # 0.1 + 0.2 em float é 0.30000000000000004
+        self.assertEqual(moeda.para_centavos(0.1) + moeda.para_centavos(0.2), moeda.para_centavos(0.3))
+        self.assertEqual(moeda.para_centavos(1.005), 101)
+
+    def test_meio_centavo_arredonda_para_cima(self):
+        self.assertEqual(moeda.para_centavos("0.005"), 1)
+        self.assertEqual(moeda.para_centavos("0.004"), 0)
+
+    def test_texto_invalido(self):
+        for valor in ("abc", "", "nan", "inf"):
+            with self.assertRaises(ValueError):
+                moeda.para_centavos(valor)
+
+
+class DividirTest(unittest.TestCase):
+    def test_divisao_exata(self):
+        self.assertEqual(moeda.dividir(60000, 4), 15000)
+
+    def test_meio_centavo_arredonda_para_cima(self):
+        self.assertEqual(moeda.dividir(100, 3), 33) # 33,33...
+        self.assertEqual(moeda.dividir(5, 2), 3)    # 2,5
+        self.assertEqual(moeda.dividir(200, 3), 67) # 66,66...
+
+
+if __name__ == "__main__":
+    unittest.main()
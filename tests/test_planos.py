@@ -0,0 +1,37 @@
+"""Planos das consultas do painel (consultas.verificar_planos).
+
+    python -m pytest tests      (ou python -m unittest discover tests)
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import consultas
+import migracao
+
+
+class PlanosTest(unittest.TestCase):
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.conn = sqlite3.connect(os.path.join(self.diretorio.name, "planos.db"))
+        migracao.aplicar_migracoes(self.conn)
+
+    def tearDown(self):
+        self.conn.close()
+        self.diretorio.cleanup()
+
+    def test_nenhuma_consulta_faz_scan_completo(self):
+        self.assertEqual(consultas.verificar_planos(self.conn), [])
+
+    def test_indice_removido_aparece_no_relatorio(self):
+        self.conn.execute("DROP INDEX idx_sessoes_psicologo_data")
+        nomes = {nome for nome, _detalhe in consultas.verificar_planos(self.conn)}
+        self.assertIn("listar_sessoes (1ª página)", nomes)
+
+
+if __name__ == "__main__":
+    unittest.main()
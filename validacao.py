@@ -0,0 +1,22 @@
+"""Regras de validação e normalização compartilhadas pelo painel e pela importação."""
+import re
+import unicodedata
+
+
+def validar_email(email):
+    # Regex simples para validar formato de email
+    return re.match(r"[^@]+@[^@]+\.[^@]+", email)
+
+def validar_telefone(telefone):
+    # Regex para validar telefone com 10 ou 11 dígitos, aceitando ( ) - e espaços
+    telefone_limpo = re.sub(r'\D', '', telefone)
+    return len(telefone_limpo) >= 10 and len(telefone_limpo) <= 11
+
+def apenas_digitos(texto):
+    # "(11) 91234-5678" -> "11912345678"
+    return re.sub(r'\D', '', texto or "")
+
+def normalizar_nome(nome):
+    # "  José  da SILVA " -> "jose da silva": sem acentos, minúsculo, espaços simples
+    sem_acentos = unicodedata.normalize("NFKD", nome or "").encode("ascii", "ignore").decode("ascii")
+    return " ".join(sem_acentos.lower().split())